@@ -0,0 +1,142 @@
+import json  # for encoding the rejection body
+import time  # for timing requests
+
+from starlette.routing import Match
+
+from app.services.metrics import REQUEST_SECONDS, current_route
+
+# room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadLimitMiddleware:
+    """Rejects request bodies over the receiving endpoint's limit while they stream in.
+
+    A ``Content-Length`` over the limit is refused before any of the body is read;
+    chunked or mislabelled bodies are cut off as soon as the running byte count
+    passes it, instead of after the whole upload has been buffered.
+    """
+
+    def __init__(self, app, default_limit: int, limits: dict[str, int] = None):
+        self.app = app
+        self.default_limit = default_limit
+        self.limits = limits or {}
+
+    def _limit_for(self, path: str) -> int:
+        return self.limits.get(path.rstrip("/"), self.default_limit)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        file_limit = self._limit_for(scope["path"])
+        body_limit = file_limit + MULTIPART_OVERHEAD
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit():
+            if int(content_length) > body_limit:
+                await self._reject(send, file_limit)
+                return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > body_limit:
+                    exceeded = True
+                    # end the body early; the app's parser fails and we answer 413 instead
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self._reject(send, file_limit)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            # a parser giving up on the truncated body is expected once we cut it off
+            if not exceeded:
+                raise
+
+        if exceeded and not response_started:
+            await self._reject(send, file_limit)
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        body = json.dumps(
+            {"detail": f"File exceeds {limit // (1024 * 1024)}MB limit"}
+        ).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+class MetricsMiddleware:
+    """Times every request by route and status, until the last byte is sent.
+
+    Requests are labelled by route template rather than path, so download and job
+    ids do not each become a series. The route is also made known to stage timers
+    running while the request is handled.
+    """
+
+    def __init__(self, app, routes: list):
+        self.app = app
+        self.routes = routes
+
+    def _route_of(self, scope) -> str:
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route_of(scope)
+        token = current_route.set(route)
+        status = 500
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                route=route,
+                method=scope["method"],
+                status=str(status),
+            )
+            current_route.reset(token)
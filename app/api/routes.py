@@ -1,315 +1,672 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import StreamingResponse
-from typing import Optional
-import io
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import asyncio
+import json
+from contextlib import AsyncExitStack, ExitStack
+from typing import Optional, Union
 import os
-import zipfile
-from app.services.converter import FileConverter, FileCompressor
+from app.services.converter import (
+    VIDEO_PRESETS,
+    FileCompressor,
+    FileConverter,
+    parse_page_range,
+)
+from app.models.render import MAX_DPI, MIN_DPI, RenderOptions
+from app.models.svg import IMAGE_SVG_MODES, SvgTarget, TraceOptions
+from app.models.conversion import ConversionEdge
+from app.models.file import StoredFile
+from app.services.archive import ZipStreamWriter
+from app.services.storage import ResultStore
+from app.services.cache import ConversionCache
+from app.services.executor import (
+    PROCESS,
+    THREAD,
+    ConversionExecutor,
+    ExecutorSaturatedError,
+)
+from app.services import metrics
+from app.services.jobs import JobManager, JobQueueFullError, in_job
+from app.services.registry import (
+    NoConversionPathError,
+    default_graph,
+    extension_of,
+    format_of,
+    media_type_of,
+    normalize_format,
+    plan_kind,
+)
+from app.services.sniffing import (
+    SNIFF_BYTES,
+    UNTYPED,
+    ZIP_TAIL_BYTES,
+    ContentSniffer,
+    detect,
+)
+from app.services.uploads import IngestedUpload, UploadTooLargeError, ingest_upload
+from app import config
 import mimetypes
 import uuid
 
 router = APIRouter()
-converter = FileConverter()
+converter = FileConverter(
+    render_workers=config.PDF_RENDER_WORKERS,
+    parallel_min_pages=config.PDF_PARALLEL_MIN_PAGES,
+    start_method=config.EXECUTOR_START_METHOD,
+    docx_engine=config.DOCX_PDF_ENGINE,
+    docx_timeout=config.DOCX_PDF_TIMEOUT_SECONDS,
+    docx_font_dir=config.DOCX_PDF_FONT_DIR,
+)
+
+# conversions limited on top of the executor's own bounds, so slow documents cannot
+# take every worker
+conversion_slots = {
+    "convert_docx_to_pdf": asyncio.Semaphore(config.DOCX_PDF_MAX_CONCURRENCY),
+}
+
+# formats and the converter methods between them, for planning multi-step conversions
+graph = default_graph(config.CONVERSION_COSTS_FILE)
+
+result_store = ResultStore(
+    max_bytes=config.RESULT_STORE_MAX_BYTES,
+    ttl_seconds=config.RESULT_STORE_TTL_SECONDS,
+    delete_on_download=config.RESULT_STORE_DELETE_ON_DOWNLOAD,
+    spool_dir=config.RESULT_STORE_SPOOL_DIR,
+    spill_threshold=config.RESULT_STORE_SPILL_THRESHOLD,
+    max_disk_bytes=config.RESULT_STORE_MAX_DISK_BYTES,
+)
+
+sniffer = ContentSniffer()
+
+conversion_cache = ConversionCache(
+    max_bytes=config.CONVERSION_CACHE_MAX_BYTES,
+    disk_dir=config.CONVERSION_CACHE_DIR,
+    max_disk_bytes=config.CONVERSION_CACHE_MAX_DISK_BYTES,
+)
+
+executor = ConversionExecutor(
+    process_workers=config.EXECUTOR_PROCESS_WORKERS,
+    thread_workers=config.EXECUTOR_THREAD_WORKERS,
+    max_queue=config.EXECUTOR_MAX_QUEUE,
+    retry_after=config.EXECUTOR_RETRY_AFTER_SECONDS,
+    start_method=config.EXECUTOR_START_METHOD,
+    max_tasks_per_child=config.EXECUTOR_MAX_TASKS_PER_CHILD,
+)
+
+job_manager = JobManager(
+    max_running=config.JOBS_MAX_RUNNING,
+    max_queued=config.JOBS_MAX_QUEUED,
+    ttl_seconds=config.JOBS_TTL_SECONDS,
+    retry_after=config.EXECUTOR_RETRY_AFTER_SECONDS,
+    start_method=config.EXECUTOR_START_METHOD,
+)
+
+# existing stats, exported as gauges on /metrics
+metrics.REGISTRY.register_stats("fileconverter_storage", result_store.stats)
+metrics.REGISTRY.register_stats("fileconverter_cache", conversion_cache.stats)
+metrics.REGISTRY.register_stats("fileconverter_executor", executor.stats)
+metrics.REGISTRY.register_stats("fileconverter_jobs", job_manager.stats)
+metrics.REGISTRY.register_stats("fileconverter_uploads", sniffer.stats)
+
+
+# the number of bytes in a converter's input or output: content, a path or a list
+def _size_of(value) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_size_of(part) for part in value)
+    if isinstance(value, (str, os.PathLike)) and os.path.isfile(value):
+        return os.path.getsize(value)
+    return 0
+
+
+# run a blocking converter call on the executor, answering 503 when it is saturated;
+# a background job, already answered 202, waits for a free slot instead.
+# Conversions are labelled in metrics by ``label``, or else by the method's name
+async def _run_conversion(fn, *args, label: Optional[str] = None, **kwargs):
+    conversion = label or fn.__name__
+    kind = kwargs.pop("kind", PROCESS)
+    try:
+        with metrics.stage("convert"):
+            result, samples = await executor.run(
+                metrics.call_recorded, fn, args, kwargs, kind=kind, wait=in_job()
+            )
+    except ExecutorSaturatedError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except TimeoutError as e:
+        metrics.ERRORS.inc(conversion=conversion)
+        raise HTTPException(status_code=504, detail=f"Conversion timed out: {e}")
+    except Exception:
+        metrics.ERRORS.inc(conversion=conversion)
+        raise
+    metrics.merge(samples, conversion)
+    metrics.INPUT_BYTES.inc(_size_of(args[0]) if args else 0, conversion=conversion)
+    metrics.OUTPUT_BYTES.inc(_size_of(result), conversion=conversion)
+    return result
+
+
+# convert a spooled upload, answering repeats of the same conversion from the cache
+async def _convert(
+    upload: Union[IngestedUpload, list[IngestedUpload]], fn, *args, **kwargs
+):
+    # a list of uploads is handed to the converter as a list of paths
+    uploads = upload if isinstance(upload, list) else [upload]
+    owner = getattr(fn, "__self__", None)
+    params = {
+        "args": args,
+        "kwargs": {
+            k: v for k, v in kwargs.items() if k not in ("progress", "kind", "label")
+        },
+        # converter settings such as the compression quality change the output too
+        "settings": (
+            {k: v for k, v in vars(owner).items() if not k.startswith("_")}
+            if owner is not None
+            else None
+        ),
+    }
+    input_hash = ",".join(u.sha256 for u in uploads)
+    key = conversion_cache.key(input_hash, fn.__qualname__, params)
+    cached = conversion_cache.get(key)
+    if cached is not None:
+        return cached
 
-Temp_Storage = {}
+    source = [u.path for u in uploads] if isinstance(upload, list) else upload.path
+    result = await _run_conversion(fn, source, *args, **kwargs)
+    conversion_cache.put(key, result)
+    return result
 
 
-# png to pdf
-@router.post("/convert/png-to-pdf")
-async def png_to_pdf(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/png"):
-        raise HTTPException(status_code=400, detail="File must be a PNG image")
+# resolve a 1-based page selection against the uploaded PDF, answering 400 when it
+# does not fit; the upload is released when the request fails here
+async def _select_pages(upload: IngestedUpload, spec: Optional[str]) -> list[int]:
+    try:
+        page_count = await _run_conversion(
+            converter.pdf_page_count, upload.path, kind=THREAD
+        )
+        return parse_page_range(spec, page_count)
+    except ValueError as e:
+        upload.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        upload.close()
+        raise
+
+
+# build PDF render options from a preset and explicit overrides, answering 400 when
+# they are out of range
+def _render_options(
+    preset: Optional[str],
+    dpi: Optional[int],
+    grayscale: Optional[bool],
+    alpha: Optional[bool],
+    max_dimension: Optional[int],
+) -> RenderOptions:
+    try:
+        options = RenderOptions.preset(preset.lower()) if preset else RenderOptions()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if dpi is not None and not MIN_DPI <= dpi <= MAX_DPI:
+        raise HTTPException(
+            status_code=400, detail=f"dpi must be between {MIN_DPI} and {MAX_DPI}"
+        )
+    if max_dimension is not None and max_dimension < 1:
+        raise HTTPException(status_code=400, detail="max_dimension must be positive")
+    return options.with_overrides(
+        dpi=dpi, grayscale=grayscale, alpha=alpha, max_dimension=max_dimension
+    )
+
 
+# rasterize the selected pages of a PDF into one image or a ZIP written page by page.
+# Large selections fan out to the converter's render pool from a thread; rendering
+# small ones in a worker process is cheaper than the fan-out
+async def _render_pdf(
+    upload: IngestedUpload,
+    fmt: str,
+    original_name: str,
+    pages: list[int],
+    progress=None,
+    options: Optional[RenderOptions] = None,
+) -> dict:
+    media_type = "image/jpeg" if fmt == "jpg" else f"image/{fmt}"
+    kind = THREAD if converter.renders_in_parallel(len(pages)) else PROCESS
+
+    if len(pages) == 1:
+        image = await _convert(
+            upload,
+            converter.convert_pdf_to_archive,
+            fmt,
+            None,
+            # no archive is written for one page, so leave names out of the cache key
+            "",
+            pages,
+            progress=progress,
+            options=options,
+            kind=kind,
+        )
+        output_filename = f"{original_name}_page_{pages[0] + 1}.{fmt}"
+        return _store_result(image, media_type, output_filename)
+
+    archive_path = result_store.reserve_path()
+    file_id = str(uuid.uuid4())
     try:
-        # getting the file name without extension
-        original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.pdf"
+        await _run_conversion(
+            converter.convert_pdf_to_archive,
+            upload.path,
+            fmt,
+            archive_path,
+            original_name,
+            pages,
+            progress=progress,
+            options=options,
+            kind=kind,
+        )
+        zip_filename = f"{original_name}_images.zip"
+        # the archive is written to disk rather than returned, so count it here
+        metrics.OUTPUT_BYTES.inc(
+            _size_of(archive_path), conversion="convert_pdf_to_archive"
+        )
+        with metrics.stage("store"):
+            result_store.put_file(
+                file_id, archive_path, "application/zip", zip_filename
+            )
+    finally:
+        # put_file took the archive over unless the render failed before it
+        if os.path.exists(archive_path):
+            os.unlink(archive_path)
+    return _result_links(file_id, zip_filename)
+
+
+# the media type to handle an upload as, told from its first bytes before anything
+# is spooled or decoded; the declared type is only used when they are not recognised
+async def _sniff(file: UploadFile, declared: Optional[str] = None) -> str:
+    with metrics.stage("sniff"):
+        head = await file.read(SNIFF_BYTES)
+        tail = b""
+        if head.startswith(b"PK") and file.size and file.size > SNIFF_BYTES:
+            # a ZIP names its entries in the central directory at its end
+            await file.seek(max(file.size - ZIP_TAIL_BYTES, SNIFF_BYTES))
+            tail = await file.read()
+        await file.seek(0)
+        return sniffer.check(declared or file.content_type, head, tail)
+
+
+# stream an upload to the spool directory, rejecting it once it passes the limit
+async def _ingest(
+    file: UploadFile, max_bytes: int = config.UPLOAD_MAX_BYTES
+) -> IngestedUpload:
+    try:
+        with metrics.stage("upload"):
+            return await ingest_upload(file, max_bytes, config.UPLOAD_SPOOL_DIR)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-        # Read the uploaded file
-        png_content = await file.read()
-        file_id = str(uuid.uuid4())
 
-        # Convert using the converter
-        pdf_content = converter.convert_png_to_pdf(png_content)
+# queue a conversion as a background job and answer with where to poll for it
+def _start_job(kind: str, run, upload: IngestedUpload) -> JSONResponse:
+    "Queue ``run``, which closes ``upload`` when it ends; a refused job closes it here."
+    try:
+        job = job_manager.submit(kind, run)
+    except JobQueueFullError as e:
+        upload.close()
+        raise HTTPException(
+            status_code=503,
+            detail="Too many conversions in progress, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job.job_id,
+            "status": job.status,
+            "message": "Conversion queued",
+            "status_url": f"/api/v1/jobs/{job.job_id}",
+        },
+    )
 
-        Temp_Storage[file_id] = {
-            "content": pdf_content,
-            "media_type": "application/pdf",
-            "filename": f"{output_filename}",
-        }
 
-        # Return as streaming response
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+# store a converted file and build the response pointing at its download url; a
+# result already written to a scratch file is taken over without being read
+def _store_result(
+    content,
+    media_type: str,
+    filename: str,
+    message: str = "File Converted successfully",
+) -> dict:
+    file_id = str(uuid.uuid4())
+    with metrics.stage("store"):
+        if isinstance(content, str):
+            result_store.put_file(file_id, content, media_type, filename)
+        else:
+            result_store.put(file_id, content, media_type, filename)
+    return _result_links(file_id, filename, message)
 
 
-# jpg to pdf
-@router.post("/convert/jpg-to-pdf")
-async def jpg_to_pdf(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/jpeg"):
-        raise HTTPException(status_code=400, detail="File must be a JPG image")
+def _result_links(
+    file_id: str, filename: str, message: str = "File Converted successfully"
+) -> dict:
+    return {
+        "file_id": file_id,
+        "filename": filename,
+        "message": message,
+        "download_url": f"/api/v1/download/{file_id}",
+    }
 
+
+# plan the cheapest chain of conversions between two formats, answering 400 when
+# there is none
+def _plan(source: Optional[str], target: str) -> list[ConversionEdge]:
+    if source is None:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    try:
+        return graph.plan(source, target)
+    except NoConversionPathError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# the upload size limit for a planned conversion, the same as the dedicated endpoint
+# for its source format has
+def _upload_limit(plan: list[ConversionEdge]) -> int:
+    if media_type_of(plan[0].source).startswith("video/"):
+        return config.MP4_TO_MP3_MAX_BYTES
+    return config.UPLOAD_MAX_BYTES
+
+
+# run a planned conversion in one worker, keeping intermediates in memory; returns
+# the content, its media type and file name. Per-page results come back as one
+# image, or as the path of a scratch ZIP the pages were written into one by one
+async def _convert_planned(
+    upload: IngestedUpload, plan: list[ConversionEdge], original_name: str
+) -> tuple[Union[bytes, str], str, str]:
+    kind = plan_kind(plan)
+    if len(plan) == 1 and plan[0].fans_out:
+        # large PDFs fan out to the render pool from a thread, like page renders
+        page_count = await _run_conversion(
+            converter.pdf_page_count, upload.path, kind=THREAD
+        )
+        if converter.renders_in_parallel(page_count):
+            kind = THREAD
+    steps = [edge.step for edge in plan]
+    label = "->".join([plan[0].source] + [edge.target for edge in plan])
+    target = plan[-1].target
+    ext = extension_of(target)
+    async with AsyncExitStack() as slots:
+        for method in sorted({edge.method for edge in plan} & conversion_slots.keys()):
+            await slots.enter_async_context(conversion_slots[method])
+        if not plan[-1].per_page:
+            content = await _convert(
+                upload, converter.convert_chain, steps, kind=kind, label=label
+            )
+            return content, media_type_of(target), f"{original_name}.{ext}"
+
+        archive_path = result_store.reserve_path()
+        try:
+            image = await _run_conversion(
+                converter.convert_chain_to_archive,
+                upload.path,
+                steps,
+                ext,
+                archive_path,
+                original_name,
+                kind=kind,
+                label=label,
+            )
+        except BaseException:
+            os.unlink(archive_path)
+            raise
+    if image is not None:
+        os.unlink(archive_path)
+        return image, media_type_of(target), f"{original_name}_page_1.{ext}"
+    # the archive is written to disk rather than returned, so count it here
+    metrics.OUTPUT_BYTES.inc(_size_of(archive_path), conversion=label)
+    return archive_path, "application/zip", f"{original_name}_images.zip"
+
+
+# convert an upload between two fixed formats; the per-pair endpoints are shortcuts
+# for /convert
+async def _convert_pair(file: UploadFile, source: str, target: str) -> dict:
+    plan = _plan(source, target)
     try:
         original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.pdf"
-        file_id = str(uuid.uuid4())
-        jpg_content = await file.read()
+        with await _ingest(file, _upload_limit(plan)) as upload:
+            content, media_type, filename = await _convert_planned(
+                upload, plan, original_name
+            )
+        return _store_result(content, media_type, filename)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
-        pdf_content = converter.convert_jpg_to_pdf(jpg_content)
 
-        Temp_Storage[file_id] = {
-            "content": pdf_content,
-            "media_type": "application/pdf",
-            "filename": f"{output_filename}",
-        }
+# any supported format to another, through intermediate formats when there is no
+# direct converter
+@router.post("/convert")
+async def convert_file(
+    file: UploadFile = File(...),
+    target_format: str = Form(...),
+    source_format: Optional[str] = Form(None),
+    async_job: bool = Form(False),
+):
+    source = (
+        normalize_format(source_format)
+        if source_format
+        else format_of(await _sniff(file), file.filename)
+    )
+    plan = _plan(source, normalize_format(target_format))
+    steps = [plan[0].source] + [edge.target for edge in plan]
 
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
+    try:
+        upload = await _ingest(file, _upload_limit(plan))
+        original_name = os.path.splitext(file.filename)[0]
+
+        async def run(progress=None):
+            with upload:
+                if len(plan) == 1 and plan[0].per_page:
+                    # PDF pages go through the render pool and stream into a ZIP
+                    pages = await _select_pages(upload, None)
+                    result = await _render_pdf(
+                        upload,
+                        extension_of(plan[0].target),
+                        original_name,
+                        pages,
+                        progress,
+                    )
+                else:
+                    content, media_type, filename = await _convert_planned(
+                        upload, plan, original_name
+                    )
+                    result = _store_result(content, media_type, filename)
+            result["path"] = steps
+            return result
+
+        if async_job:
+            return _start_job("convert", run, upload)
+        return await run()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
+# supported conversions: every reachable target format, by source format
+@router.get("/convert/formats")
+async def conversion_formats():
+    return {source: sorted(graph.targets(source)) for source in sorted(graph.formats)}
+
+
+# png to pdf
+@router.post("/convert/png-to-pdf")
+async def png_to_pdf(file: UploadFile = File(...)):
+    content_type = await _sniff(file)
+    if not content_type.startswith("image/png"):
+        raise HTTPException(status_code=400, detail="File must be a PNG image")
+
+    return await _convert_pair(file, "png", "pdf")
+
+
+# jpg to pdf
+@router.post("/convert/jpg-to-pdf")
+async def jpg_to_pdf(file: UploadFile = File(...)):
+    content_type = await _sniff(file)
+    if not content_type.startswith("image/jpeg"):
+        raise HTTPException(status_code=400, detail="File must be a JPG image")
+
+    return await _convert_pair(file, "jpeg", "pdf")
+
+
 # image to pdf
 @router.post("/convert/img-to-pdf")
-async def img_to_pdf(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(
-            status_code=400, detail="File must be an image (jpg, png, webp, etc.)"
-        )
+async def img_to_pdf(
+    file: Optional[UploadFile] = File(None),
+    files: Optional[list[UploadFile]] = File(None),
+):
+    # "file" takes a single image; "files" merges several into one PDF, in order
+    images = ([file] if file is not None else []) + (files or [])
+    if not images:
+        raise HTTPException(status_code=400, detail="No image uploaded")
+    content_types = [await _sniff(image) for image in images]
+    for content_type in content_types:
+        if not content_type.startswith("image/"):
+            raise HTTPException(
+                status_code=400, detail="File must be an image (jpg, png, webp, etc.)"
+            )
 
     # Extract the image format from content-type, e.g., 'image/png' -> 'PNG'
-    image_format = file.content_type.split("/")[-1].upper()
+    image_format = content_types[0].split("/")[-1].upper()
 
     try:
-        original_name = os.path.splitext(file.filename)[0]
+        original_name = os.path.splitext(images[0].filename)[0]
         output_filename = f"{original_name}.pdf"
-        file_id = str(uuid.uuid4())
-        pdf_content = converter.convert_image_to_pdf(
-            await file.read(), image_format=image_format
-        )
-
-        Temp_Storage[file_id] = {
-            "content": pdf_content,
-            "media_type": "application/pdf",
-            "filename": f"{output_filename}",
-        }
+        with ExitStack() as stack:
+            uploads = [stack.enter_context(await _ingest(image)) for image in images]
+            if len(uploads) == 1:
+                pdf_content = await _convert(
+                    uploads[0],
+                    converter.convert_image_to_pdf,
+                    image_format=image_format,
+                )
+            else:
+                pdf_content = await _convert(uploads, converter.convert_images_to_pdf)
+
+        return _store_result(pdf_content, "application/pdf", output_filename)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return {
-        "file_id": file_id,
-        "filename": output_filename,
-        "message": "File Converted successfully",
-        "download_url": f"/api/v1/download/{file_id}",
-    }
-
 
 # doc to pdf
 @router.post("/convert/docx-to-pdf")
 async def docx_to_pdf(file: UploadFile = File(...)):
     """Convert DOCX document to PDF"""
-    if not file.content_type.startswith("application/vnd.openxmlformats"):
+    content_type = await _sniff(file)
+    if not content_type.startswith("application/vnd.openxmlformats"):
         raise HTTPException(status_code=400, detail="File must be a DOCX document")
 
-    try:
-        original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.pdf"
-        file_id = str(uuid.uuid4())
-        file_content = await file.read()
-        pdf_content = converter.convert_docx_to_pdf(file_content)
-
-        Temp_Storage[file_id] = {
-            "content": pdf_content,
-            "media_type": "application/pdf",
-            "filename": f"{output_filename}",
-        }
-
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "docx", "pdf")
 
 
 # svg to pdf
 @router.post("/convert/svg-to-pdf")
 async def svg_to_pdf(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/svg+xml"):
+    content_type = await _sniff(file)
+    if not content_type.startswith("image/svg+xml"):
         raise HTTPException(status_code=400, detail="File must be an SVG image")
 
-    try:
-        original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.pdf"
-        file_id = str(uuid.uuid4())
-        svg_content = await file.read()
-        pdf_content = converter.convert_svg_to_pdf(svg_content)
-
-        Temp_Storage[file_id] = {
-            "content": pdf_content,
-            "media_type": "application/pdf",
-            "filename": f"{output_filename}",
-        }
-
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "svg", "pdf")
 
 
 # pdf to jpg
 @router.post("/convert/pdf-to-png")
-async def pdf_to_png(file: UploadFile = File(...)):
-    if file.content_type != "application/pdf":
+async def pdf_to_png(
+    file: UploadFile = File(...),
+    pages: Optional[str] = Form(None),
+    async_job: bool = Form(False),
+):
+    content_type = await _sniff(file)
+    if content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="File must be a PDF")
 
     try:
-        file_content = await file.read()
-        if len(file_content) > 100 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File exceeds 100MB limit")
-        file_id = str(uuid.uuid4())
-        images = converter.convert_pdf_to_png(file_content)
-
-        if len(images) == 1:
-            # Single page: return image directly
-            original_name = os.path.splitext(file.filename)[0]
-            output_filename = f"{original_name}_page_1.png"
-            Temp_Storage[file_id] = {
-                "content": images,
-                "media_type": "image/png",
-                "filename": f"{output_filename}",
-            }
-            return {
-                "file_id": file_id,
-                "filename": output_filename,
-                "message": "File Converted successfully",
-                "download_url": f"/api/v1/download/{file_id}",
-            }
-
-        else:
-            # Multiple pages: return a ZIP of images
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w") as zipf:
-                for i, img_bytes in enumerate(images, start=1):
-                    zipf.writestr(f"{original_name}_page_{i}.png", img_bytes)
-            zip_buffer.seek(0)
-            zip_filename = f"{original_name}_images.zip"
-            Temp_Storage[file_id] = {
-                "content": images,
-                "media_type": "application/zip",
-                "filename": f"{zip_filename}",
-            }
-            return {
-                "file_id": file_id,
-                "filename": zip_filename,
-                "message": "File Converted successfully",
-                "download_url": f"/api/v1/download/{file_id}",
-            }
+        upload = await _ingest(file)
+        original_name = os.path.splitext(file.filename)[0]
+        selected = await _select_pages(upload, pages)
+
+        async def run(progress=None):
+            with upload:
+                return await _render_pdf(
+                    upload, "png", original_name, selected, progress
+                )
+
+        if async_job:
+            return _start_job("pdf-to-png", run, upload)
+        return await run()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
 # pdf to jpg
 @router.post("/convert/pdf-to-jpg")
-async def pdf_to_jpg(file: UploadFile = File(...)):
-    if file.content_type != "application/pdf":
+async def pdf_to_jpg(
+    file: UploadFile = File(...),
+    pages: Optional[str] = Form(None),
+    async_job: bool = Form(False),
+):
+    content_type = await _sniff(file)
+    if content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="File must be a PDF")
 
     try:
-        file_content = await file.read()
-        if len(file_content) > 100 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File exceeds 100MB limit")
-        file_id = str(uuid.uuid4())
-        images = converter.convert_pdf_to_jpg(file_content)
-
-        if len(images) == 1:
-            # Single page: return image directly
-            original_name = os.path.splitext(file.filename)[0]
-            output_filename = f"{original_name}_page_1.jpg"
-            Temp_Storage[file_id] = {
-                "content": images,
-                "media_type": "image/png",
-                "filename": f"{output_filename}",
-            }
-            return {
-                "file_id": file_id,
-                "filename": output_filename,
-                "message": "File Converted successfully",
-                "download_url": f"/api/v1/download/{file_id}",
-            }
-
-        else:
-            # Multiple pages: return a ZIP of images
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w") as zipf:
-                for i, img_bytes in enumerate(images, start=1):
-                    zipf.writestr(f"{original_name}_page_{i}.jpg", img_bytes)
-            zip_buffer.seek(0)
-            zip_filename = f"{original_name}_images.zip"
-            Temp_Storage[file_id] = {
-                "content": images,
-                "media_type": "application/zip",
-                "filename": f"{zip_filename}",
-            }
-            return {
-                "file_id": file_id,
-                "filename": zip_filename,
-                "message": "File Converted successfully",
-                "download_url": f"/api/v1/download/{file_id}",
-            }
+        upload = await _ingest(file)
+        original_name = os.path.splitext(file.filename)[0]
+        selected = await _select_pages(upload, pages)
+
+        async def run(progress=None):
+            with upload:
+                return await _render_pdf(
+                    upload, "jpg", original_name, selected, progress
+                )
+
+        if async_job:
+            return _start_job("pdf-to-jpg", run, upload)
+        return await run()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
-# pdf to docs
-@router.post("/connvert/pdf-to-docx")
+# pdf to docx; the misspelled path it was first published under still works
+@router.post("/convert/pdf-to-docx")
+@router.post("/connvert/pdf-to-docx", include_in_schema=False)
 async def pdf_to_docx(file: UploadFile = File(...)):
-    if file.content_type != "application/pdf":
+    content_type = await _sniff(file)
+    if content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="File must be a PDF")
 
-    try:
-        file_content = await file.read()
-        if len(file_content) > 100 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File exceeds 100MB limit")
-        original_filename = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_filename}.docx"
-        file_id = str(uuid.uuid4())
-        docx_byte = converter.convert_pdf_to_docx(file_content)
-        Temp_Storage[file_id] = {
-            "content": docx_byte,
-            "media_type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            "filename": f"{output_filename}",
-        }
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "pdf", "docx")
 
 
 # pdf to image
 @router.post("/convert/pdf-to-img")
-async def pdf_to_img(file: UploadFile = File(...), output_format: str = Form(...)):
-    if file.content_type != "application/pdf":
+async def pdf_to_img(
+    file: UploadFile = File(...),
+    output_format: str = Form(...),
+    pages: Optional[str] = Form(None),
+    preset: Optional[str] = Form(None),
+    dpi: Optional[int] = Form(None),
+    grayscale: Optional[bool] = Form(None),
+    alpha: Optional[bool] = Form(None),
+    max_dimension: Optional[int] = Form(None),
+    async_job: bool = Form(False),
+):
+    content_type = await _sniff(file)
+    if content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="File must be a PDF")
 
     output_format = output_format.upper()
@@ -318,47 +675,29 @@ async def pdf_to_img(file: UploadFile = File(...), output_format: str = Form(...
             status_code=400,
             detail="Unsupported image format. Only PNG or JPEG are supported.",
         )
+    options = _render_options(preset, dpi, grayscale, alpha, max_dimension)
 
     try:
-        file_content = await file.read()
-        if len(file_content) > 100 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File exceeds 100MB limit")
+        upload = await _ingest(file)
         original_name = os.path.splitext(file.filename)[0]
-        file_id = str(uuid.uuid4())
-        images = converter.convert_pdf_to_image(file_content, output_format)
-
-        if len(images) == 1:
-            output_filename = f"{original_name}_page_1.{output_format.lower()}"
-            Temp_Storage[file_id] = {
-                "content": images,
-                "media_type": f"image/{output_format.lower()}",
-                "filename": f"{output_filename}",
-            }
-            return {
-                "file_id": file_id,
-                "filename": output_filename,
-                "message": "File Converted successfully",
-                "download_url": f"/api/v1/download/{file_id}",
-            }
-        else:
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w") as zipf:
-                for i, img_bytes in enumerate(images, start=1):
-                    zipf.writestr(
-                        f"{original_name}_page_{i}.{output_format.lower()}", img_bytes
-                    )
-            zip_buffer.seek(0)
-            Temp_Storage[file_id] = {
-                "content": images,
-                "media_type": "application/zip",
-                "filename": f"{original_name}_images.zip",
-            }
-            return {
-                "file_id": file_id,
-                "filename": f"{original_name}_images.zip",
-                "message": "File Converted successfully",
-                "download_url": f"/api/v1/download/{file_id}",
-            }
+        selected = await _select_pages(upload, pages)
+
+        async def run(progress=None):
+            with upload:
+                return await _render_pdf(
+                    upload,
+                    "jpg" if output_format != "PNG" else "png",
+                    original_name,
+                    selected,
+                    progress,
+                    options,
+                )
+
+        if async_job:
+            return _start_job("pdf-to-img", run, upload)
+        return await run()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
@@ -368,34 +707,44 @@ async def pdf_to_img(file: UploadFile = File(...), output_format: str = Form(...
 
 # image to svg
 @router.post("/convert/img-to-svg")
-async def img_to_svg(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/"):
+async def img_to_svg(
+    file: UploadFile = File(...),
+    mode: str = Form("embed"),
+    colors: int = Form(8),
+    detail: float = Form(0.5),
+):
+    content_type = await _sniff(file)
+    if not content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
+    mode = mode.lower()
+    if mode not in IMAGE_SVG_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Mode must be one of: {', '.join(IMAGE_SVG_MODES)}",
+        )
+    trace = None
+    if mode == "trace":
+        try:
+            trace = TraceOptions(colors, detail)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
         original_name = os.path.splitext(file.filename)[0]
-        file_id = str(uuid.uuid4())
         output_filename = f"{original_name}.svg"
-        file_content = await file.read()
-        if "png" in file.content_type:
+        if "png" in content_type:
             image_format = "PNG"
-        elif "jpeg" in file.content_type or "jpg" in file.content_type:
+        elif "jpeg" in content_type or "jpg" in content_type:
             image_format = "JPEG"
         else:
             image_format = "PNG"
 
-        svg_content = converter.convert_image_to_svg(file_content, image_format)
-        Temp_Storage[file_id] = {
-            "content": svg_content,
-            "media_type": "image/svg+xml",
-            "filename": f"{output_filename}",
-        }
-
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
+        with await _ingest(file) as upload:
+            svg_content = await _convert(
+                upload, converter.convert_image_to_svg, image_format, trace=trace
+            )
+        return _store_result(svg_content, "image/svg+xml", output_filename)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
@@ -403,63 +752,28 @@ async def img_to_svg(file: UploadFile = File(...)):
 # png to svg
 @router.post("/convert/png-to-svg")
 async def png_to_svg(file: UploadFile = File(...)):
-    if file.content_type != "image/png":
+    content_type = await _sniff(file)
+    if content_type != "image/png":
         raise HTTPException(status_code=400, detail="File must be a PNG image")
 
-    try:
-        original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.svg"
-        file_id = str(uuid.uuid4())
-        file_content = await file.read()
-        svg_content = converter.convert_png_to_svg(file_content)
-        Temp_Storage[file_id] = {
-            "content": svg_content,
-            "media_type": "image/svg+xml",
-            "filename": f"{output_filename}",
-        }
-
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "png", "svg")
 
 
 # jpg to svg
 @router.post("/convert/jpg-to-svg")
 async def jpg_to_svg(file: UploadFile = File(...)):
-    if file.content_type != "image/jpeg":
+    content_type = await _sniff(file)
+    if content_type != "image/jpeg":
         raise HTTPException(status_code=400, detail="File must be a JPEG image")
 
-    try:
-        original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.svg"
-        file_id = str(uuid.uuid4())
-        file_content = await file.read()
-        svg_content = converter.convert_jpg_to_svg(file_content)
-        Temp_Storage[file_id] = {
-            "content": svg_content,
-            "media_type": "application/zip",
-            "filename": f"{output_filename}",
-        }
-
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "jpeg", "svg")
 
 
 # svg to image
 @router.post("/convert/svg-to-img")
 async def svg_to_img(file: UploadFile = File(...), output_format: str = Form(...)):
-    if file.content_type != "image/svg+xml":
+    content_type = await _sniff(file)
+    if content_type != "image/svg+xml":
         raise HTTPException(status_code=400, detail="File must be an SVG image")
 
     output_format = output_format.upper()
@@ -471,144 +785,93 @@ async def svg_to_img(file: UploadFile = File(...), output_format: str = Form(...
             detail="Unsupported image format. Only PNG or JPEG are supported.",
         )
 
-    try:
-        original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.{output_format.lower()}"
-        file_content = await file.read()
-        file_id = str(uuid.uuid4())
-        png_content = converter.convert_svg_to_image(file_content, output_format)
-        Temp_Storage[file_id] = {
-            "content": png_content,
-            "media_type": f"image/{output_format.lower()}",
-            "filename": f"{output_filename}",
-        }
-
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "svg", normalize_format(output_format))
 
 
 # svg to png
 @router.post("/convert/svg-to-png")
-def svg_to_png(file: UploadFile = File(...)):
-    if file.content_type != "image/svg+xml":
+async def svg_to_png(file: UploadFile = File(...)):
+    content_type = await _sniff(file)
+    if content_type != "image/svg+xml":
         raise HTTPException(status_code=400, detail="File must be an SVG image")
 
-    try:
-        original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.png"
-        svg_content = file.file.read()
-        file_id = str(uuid.uuid4)
-        png_content = converter.convert_svg_to_png(svg_content)
-
-        Temp_Storage[file_id] = {
-            "content": png_content,
-            "media_type": "image/png",
-            "filename": f"{output_filename}",
-        }
-
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "svg", "png")
 
 
 # svg to jpg
 @router.post("/convert/svg-to-jpg")
-def svg_to_jpg(file: UploadFile = File(...)):
-    if file.content_type != "image/svg+xml":
+async def svg_to_jpg(file: UploadFile = File(...)):
+    content_type = await _sniff(file)
+    if content_type != "image/svg+xml":
         raise HTTPException(status_code=400, detail="File must be an SVG image")
 
+    return await _convert_pair(file, "svg", "jpeg")
+
+
+# one SVG at several sizes and formats, parsed once and streamed back as a ZIP
+@router.post("/convert/svg-render")
+async def svg_render(file: UploadFile = File(...), targets: str = Form(...)):
+    content_type = await _sniff(file)
+    if content_type != "image/svg+xml":
+        raise HTTPException(status_code=400, detail="File must be an SVG image")
     try:
-        original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}.jpg"
-        svg_content = file.file.read()
-        file_id = str(uuid.uuid4())
-        jpg_content = converter.convert_svg_to_jpg(svg_content)
-        Temp_Storage[file_id] = {
-            "content": jpg_content,
-            "media_type": "image/jpeg",
-            "filename": f"{output_filename}",
-        }
+        renditions = SvgTarget.parse_list(targets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
+    try:
+        original_name = os.path.splitext(file.filename)[0]
+        with await _ingest(file) as upload:
+            outputs = await _convert(
+                upload, converter.convert_svg_to_renditions, renditions
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
+    def archive():
+        writer = ZipStreamWriter()
+        for target, content in zip(renditions, outputs):
+            yield from writer.add(target.filename(original_name), content)
+        yield from writer.close()
+
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={original_name}_renders.zip"
+        },
+    )
+
 
 # png to jpeg
 @router.post("/convert/png-to-jpeg")
 async def png_to_jpeg(file: UploadFile = File(...)):
-    if file.content_type != "image/png":
+    content_type = await _sniff(file)
+    if content_type != "image/png":
         raise HTTPException(status_code=400, detail="File must be a png image")
 
-    try:
-        original_filename = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_filename}.jpg"
-        file_content = await file.read()
-        file_id = str(uuid.uuid4())
-        jpg_content = converter.convert_png_to_jpeg(file_content)
-        Temp_Storage[file_id] = {
-            "content": jpg_content,
-            "media_type": "image/jpeg",
-            "filename": f"{output_filename}",
-        }
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "png", "jpeg")
 
 
 # jpeg to png
 @router.post("/convert/jpeg-to-png")
 async def jpeg_to_png(file: UploadFile = File(...)):
-
-    if file.content_type != "image/jpeg":
+    content_type = await _sniff(file)
+    if content_type != "image/jpeg":
         raise HTTPException(status_code=400, detail=f"File must be JPG image")
 
-    try:
-        original_filename = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_filename}.png"
-        file_id = str(uuid.uuid4())
-        file_content = await file.read()
-        png_content = converter.convert_jpeg_to_png(file_content)
-        Temp_Storage[file_id] = {
-            "content": png_content,
-            "media_type": "image/png",
-            "filename": f"{output_filename}",
-        }
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+    return await _convert_pair(file, "jpeg", "png")
 
 
 # mp4 to mp3
 @router.post("/convert/mp4-to-mp3")
-async def mp4_to_mp3(file: UploadFile = File(...)):
+async def mp4_to_mp3(
+    file: UploadFile = File(...),
+    output_format: str = Form("mp3"),
+    async_job: bool = Form(False),
+):
     allowed_extensions = [".mp4", ".mov", ".avi", ".mkv", ".flv", ".wmv", ".webm"]
     file_ext = os.path.splitext(file.filename)[1].lower()
     if file_ext not in allowed_extensions:
@@ -616,77 +879,421 @@ async def mp4_to_mp3(file: UploadFile = File(...)):
             status_code=400,
             detail=f"Only video files with extensions {allowed_extensions} are supported.",
         )
+    content_type = await _sniff(file)
+    if content_type not in UNTYPED and not content_type.startswith(
+        ("video/", "audio/")
+    ):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    # "auto" keeps AAC audio as a stream-copied .m4a and transcodes the rest to mp3
+    output_format = output_format.lower()
+    if output_format not in ("mp3", "m4a", "auto"):
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported audio format. Only mp3, m4a or auto are supported.",
+        )
 
     try:
-        file_content = await file.read()
-        if len(file_content) > 300 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File exceeds 300MB limit")
-        file_id = str(uuid.uuid4())
-        mp3_bytes = converter.convert_mp4_to_mp3(file_content, file_ext)
-
-        output_filename = os.path.splitext(file.filename)[0] + ".mp3"
-
-        Temp_Storage[file_id] = {
-            "content": mp3_bytes,
-            "media_type": "audio/mpeg",
-            "filename": f"{output_filename}",
-        }
-
-        return {
-            "file_id": file_id,
-            "filename": output_filename,
-            "message": "File Converted successfully",
-            "download_url": f"/api/v1/download/{file_id}",
-        }
+        upload = await _ingest(file, config.MP4_TO_MP3_MAX_BYTES)
+        audio_format = output_format
+        if audio_format == "auto":
+            try:
+                codec = await _run_conversion(
+                    converter.audio_codec, upload.path, file_ext, kind=THREAD
+                )
+            except BaseException:
+                upload.close()
+                raise
+            audio_format = "m4a" if codec == "aac" else "mp3"
+        output_filename = os.path.splitext(file.filename)[0] + f".{audio_format}"
+
+        async def run(progress=None):
+            # ffmpeg writes the audio to a scratch file the store takes over, so it
+            # never passes through memory
+            output_path = result_store.reserve_path()
+            try:
+                # ffmpeg does the work in its own process, so a thread only waits on it
+                with upload:
+                    await _run_conversion(
+                        converter.convert_video_to_audio,
+                        upload.path,
+                        file_ext,
+                        audio_format,
+                        progress=progress,
+                        output_path=output_path,
+                        kind=THREAD,
+                    )
+                media_type = "audio/mpeg" if audio_format == "mp3" else "audio/mp4"
+                return _store_result(output_path, media_type, output_filename)
+            finally:
+                # put_file took the file over unless the conversion failed first
+                if os.path.exists(output_path):
+                    os.unlink(output_path)
+
+        if async_job:
+            return _start_job("mp4-to-mp3", run, upload)
+        return await run()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
+# compress a video into a scratch file the store takes over, so the encoded result
+# never passes through memory
+async def _compress_video(
+    upload: IngestedUpload,
+    compressor: FileCompressor,
+    mime_type: str,
+    filename: str,
+    progress=None,
+) -> dict:
+    output_path = result_store.reserve_path()
+    try:
+        # ffmpeg encodes video in its own process; a thread only waits on it
+        with upload:
+            await _run_conversion(
+                compressor.compress,
+                upload.path,
+                mime_type,
+                filename,
+                progress=progress,
+                output_path=output_path,
+                kind=THREAD,
+            )
+        return _store_result(
+            output_path,
+            mime_type,
+            f"compressed_{filename}",
+            message="File compressed successfully",
+        )
+    finally:
+        # put_file took the file over unless the compression failed first
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+
+
 # file compressor
 @router.post("/compress")
-async def compress_file(file: UploadFile = File(...), percent: int = Form(...)):
-    contents = await file.read()
-
-    if len(contents) > 500 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File exceeds 500MB limit")
-    file_id = str(uuid.uuid4())
-    mime_type, _ = mimetypes.guess_type(file.filename)
-    if mime_type is None or not any(
+async def compress_file(
+    file: UploadFile = File(...),
+    percent: Optional[int] = Form(None),
+    preset: Optional[str] = Form(None),
+    max_height: Optional[int] = Form(None),
+    max_fps: Optional[float] = Form(None),
+    target_size: Optional[int] = Form(None),
+    min_ssim: Optional[float] = Form(None),
+    allow_webp: bool = Form(False),
+    linearize: bool = Form(False),
+    async_job: bool = Form(False),
+):
+    mime_type = await _sniff(file, mimetypes.guess_type(file.filename)[0])
+    if not any(
         mime_type.startswith(typ)
         for typ in ["image", "audio", "video", "application/pdf"]
     ):
         raise HTTPException(status_code=400, detail="Unsupported file type")
 
+    # image-only settings: a size in bytes and/or a similarity floor to search the
+    # encoder quality against, in place of the percentage
+    adaptive = target_size is not None or min_ssim is not None
+    if adaptive and not mime_type.startswith("image/"):
+        raise HTTPException(
+            status_code=400, detail="target_size and min_ssim only apply to images"
+        )
+    if percent is None and not adaptive:
+        raise HTTPException(status_code=400, detail="percent is required")
+    if target_size is not None and target_size < 1:
+        raise HTTPException(status_code=400, detail="target_size must be positive")
+    if min_ssim is not None and not 0 < min_ssim <= 1:
+        raise HTTPException(status_code=400, detail="min_ssim must be between 0 and 1")
+    if linearize and mime_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="linearize only applies to PDFs")
+
+    # video-only settings: x264 speed preset, downscale and frame rate cap
+    preset = (preset or config.VIDEO_COMPRESS_PRESET).lower()
+    if preset not in VIDEO_PRESETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported preset. Use one of {', '.join(VIDEO_PRESETS)}.",
+        )
+    if max_height is not None and max_height < 16:
+        raise HTTPException(status_code=400, detail="max_height must be at least 16")
+    if max_fps is not None and max_fps <= 0:
+        raise HTTPException(status_code=400, detail="max_fps must be positive")
+
     try:
-        compressor = FileCompressor(compression_percentage=percent)
-        compressed = compressor.compress(contents, mime_type, file.filename)
+        upload = await _ingest(file, config.COMPRESS_MAX_BYTES)
+        compressor = FileCompressor(
+            compression_percentage=percent if percent is not None else 0,
+            video_preset=preset,
+            max_height=max_height,
+            max_fps=max_fps,
+            threads=config.VIDEO_COMPRESS_THREADS,
+            target_bytes=target_size,
+            min_ssim=min_ssim,
+            allow_webp=allow_webp,
+            linearize=linearize,
+            pdf_workers=config.PDF_OPTIMIZE_WORKERS,
+        )
+
+        async def run(progress=None):
+            if mime_type.startswith("video/"):
+                return await _compress_video(
+                    upload, compressor, mime_type, file.filename, progress
+                )
+            with upload:
+                compressed = await _convert(
+                    upload,
+                    compressor.compress,
+                    mime_type,
+                    file.filename,
+                    progress=progress,
+                )
+            media_type, filename = mime_type, f"compressed_{file.filename}"
+            # images may come back as WebP when the client allows it
+            if mime_type.startswith("image/"):
+                output_type = detect(compressed[:SNIFF_BYTES]) or mime_type
+                output_format = normalize_format(output_type)
+                if output_format != normalize_format(mime_type):
+                    stem = os.path.splitext(file.filename)[0]
+                    media_type = output_type
+                    filename = f"compressed_{stem}.{extension_of(output_format)}"
+            return _store_result(
+                compressed,
+                media_type,
+                filename,
+                message="File compressed successfully",
+            )
+
+        if async_job:
+            return _start_job("compress", run, upload)
+        return await run()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    Temp_Storage[file_id] = {
-        "content": compressed,
-        "media_type": mime_type,
-        "filename": f"compressed_{file.filename}",
-    }
 
-    return {
-        "file_id": file_id,
-        "message": "File compressed successfully",
-        "filename": f"compressed_{file.filename}",
-        "download_url": f"/api/v1/download/{file_id}",
-    }
+# start converting one file of a batch; files that cannot be converted are reported
+# in ``item`` without a task. Uploads are spooled up front because the form's files
+# are closed once the handler returns, before a streamed archive is sent
+async def _start_batch_item(
+    file: UploadFile, target: str, slots: asyncio.Semaphore
+) -> tuple[dict, Optional[asyncio.Task]]:
+    item = {"filename": file.filename}
+    try:
+        plan = _plan(format_of(await _sniff(file), file.filename), target)
+        upload = await _ingest(file, _upload_limit(plan))
+    except HTTPException as e:
+        item.update(status="failed", error=e.detail)
+        return item, None
+
+    async def run():
+        with upload:
+            async with slots:
+                return await _convert_planned(
+                    upload, plan, os.path.splitext(file.filename or "file")[0]
+                )
+
+    return item, asyncio.create_task(run())
+
+
+# wait for one batch item, turning a failed conversion into an entry of the report;
+# a successful one comes with its content, media type and file name
+async def _finish_batch_item(
+    item: dict, task: Optional[asyncio.Task]
+) -> tuple[dict, Optional[tuple[bytes, str, str]]]:
+    if task is None:
+        return item, None
+    try:
+        result = await task
+    except HTTPException as e:
+        item.update(status="failed", error=e.detail)
+        return item, None
+    except Exception as e:
+        item.update(status="failed", error=str(e))
+        return item, None
+    item.update(status="done", output_filename=result[2])
+    return item, result
+
+
+# remove the scratch file of a batch item whose result was never written out
+def _discard_batch_file(task: asyncio.Task) -> None:
+    if task.cancelled() or task.exception() is not None:
+        return
+    content = task.result()[0]
+    if isinstance(content, str) and os.path.exists(content):
+        os.unlink(content)
+
+
+def _unique_name(name: str, taken: set) -> str:
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 2
+    while candidate in taken:
+        candidate = f"{stem}_{n}{ext}"
+        n += 1
+    taken.add(candidate)
+    return candidate
+
+
+# batch conversion
+@router.post("/convert/batch")
+async def convert_batch(
+    files: list[UploadFile] = File(...),
+    target_format: str = Form(...),
+    output: str = Form("manifest"),
+):
+    target = normalize_format(target_format)
+    if target not in graph.formats:
+        raise HTTPException(status_code=400, detail="Unsupported target format")
+    if output not in ("manifest", "zip"):
+        raise HTTPException(status_code=400, detail="output must be manifest or zip")
+    if len(files) > config.BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch takes at most {config.BATCH_MAX_FILES} files",
+        )
+
+    # bound how much of the worker pool one batch can take at a time
+    slots = asyncio.Semaphore(config.BATCH_MAX_CONCURRENCY)
+    started = [await _start_batch_item(file, target, slots) for file in files]
+
+    if output == "manifest":
+        results = []
+        for item, result in await asyncio.gather(
+            *(_finish_batch_item(item, task) for item, task in started)
+        ):
+            if result is not None:
+                # a result over the store's budget fails only its own item
+                try:
+                    stored = _store_result(*result)
+                except Exception as e:
+                    item.pop("output_filename")
+                    item.update(status="failed", error=str(e))
+                else:
+                    item.update(
+                        file_id=stored["file_id"], download_url=stored["download_url"]
+                    )
+            results.append(item)
+        failed = sum(1 for item in results if item["status"] == "failed")
+        return {
+            "results": results,
+            "succeeded": len(results) - failed,
+            "failed": failed,
+        }
+
+    async def archive():
+        # entries follow upload order; each is written as soon as it and those
+        # before it are done, and a manifest of outcomes closes the archive
+        writer = ZipStreamWriter()
+        taken, report = set(), []
+        try:
+            for item, task in started:
+                item, result = await _finish_batch_item(item, task)
+                if result is not None:
+                    content = result[0]
+                    name = _unique_name(item.pop("output_filename"), taken)
+                    if isinstance(content, str):
+                        # pages written to a scratch ZIP are copied over in chunks
+                        try:
+                            for chunk in writer.add_file(name, content):
+                                yield chunk
+                        finally:
+                            os.unlink(content)
+                    else:
+                        for chunk in writer.add(name, content):
+                            yield chunk
+                    item["archive_name"] = name
+                report.append(item)
+            manifest = json.dumps(report, indent=2).encode("utf-8")
+            for chunk in writer.add("manifest.json", manifest):
+                yield chunk
+            for chunk in writer.close():
+                yield chunk
+        finally:
+            for _, task in started:
+                if task is not None:
+                    task.cancel()
+                    task.add_done_callback(_discard_batch_file)
+
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=converted.zip"},
+    )
+
+
+class _SpooledResponse(StreamingResponse):
+    "Streams a spooled result and releases it however the response ends."
+
+    def __init__(self, entry: StoredFile, stream, **kwargs):
+        super().__init__(stream, **kwargs)
+        self.entry = entry
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # also runs when the client is gone before the body starts
+            result_store.release(self.entry)
 
 
 @router.post("/download/{file_id}")
 async def download_file(file_id: str):
-    file_data = Temp_Storage.get(file_id)
+    file_data = result_store.get(file_id)
     if not file_data:
         raise HTTPException(status_code=404, detail="File not found")
 
-    return StreamingResponse(
-        io.BytesIO(file_data["content"]),
-        media_type=file_data["media_type"],
-        headers={
-            "Content-Disposition": f"attachment; filename={file_data['filename']}"
-        },
+    headers = {"Content-Disposition": f"attachment; filename={file_data.filename}"}
+    metrics.DOWNLOAD_BYTES.inc(file_data.size)
+
+    if file_data.on_disk:
+        # spooled results are memory-mapped and streamed without a copy into bytes
+        headers["Content-Length"] = str(file_data.size)
+        try:
+            stream = result_store.open_stream(file_data)
+        except Exception:
+            result_store.release(file_data)
+            raise
+        return _SpooledResponse(
+            file_data, stream, media_type=file_data.media_type, headers=headers
+        )
+
+    return Response(
+        content=file_data.content,
+        media_type=file_data.media_type,
+        headers=headers,
     )
+
+
+# background job status
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+# result store introspection
+@router.get("/storage/stats")
+async def storage_stats():
+    return result_store.stats()
+
+
+# conversion cache introspection
+@router.get("/cache/stats")
+async def cache_stats():
+    return conversion_cache.stats()
+
+
+# upload type detection introspection
+@router.get("/uploads/stats")
+async def upload_stats():
+    return sniffer.stats()
+
+
+# conversion executor introspection
+@router.get("/executor/stats")
+async def executor_stats():
+    return executor.stats()
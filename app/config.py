@@ -0,0 +1,85 @@
+import os  # for reading settings from the environment
+import tempfile  # for the default spool location
+from dotenv import load_dotenv  # for loading settings from a local .env file
+
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# result store
+RESULT_STORE_MAX_BYTES = _env_int("RESULT_STORE_MAX_BYTES", 1024 * 1024 * 1024)
+RESULT_STORE_TTL_SECONDS = _env_int("RESULT_STORE_TTL_SECONDS", 60 * 60)
+RESULT_STORE_DELETE_ON_DOWNLOAD = _env_bool("RESULT_STORE_DELETE_ON_DOWNLOAD", False)
+RESULT_STORE_SPOOL_DIR = os.getenv(
+    "RESULT_STORE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "fileconverter-spool")
+)
+RESULT_STORE_SPILL_THRESHOLD = _env_int("RESULT_STORE_SPILL_THRESHOLD", 8 * 1024 * 1024)
+RESULT_STORE_MAX_DISK_BYTES = _env_int(
+    "RESULT_STORE_MAX_DISK_BYTES", 10 * 1024 * 1024 * 1024
+)
+
+# conversion executor
+EXECUTOR_PROCESS_WORKERS = _env_int("EXECUTOR_PROCESS_WORKERS", os.cpu_count() or 2)
+EXECUTOR_THREAD_WORKERS = _env_int("EXECUTOR_THREAD_WORKERS", 4)
+EXECUTOR_MAX_QUEUE = _env_int("EXECUTOR_MAX_QUEUE", 16)
+EXECUTOR_RETRY_AFTER_SECONDS = _env_int("EXECUTOR_RETRY_AFTER_SECONDS", 5)
+EXECUTOR_START_METHOD = os.getenv("EXECUTOR_START_METHOD", "spawn")
+EXECUTOR_MAX_TASKS_PER_CHILD = _env_int("EXECUTOR_MAX_TASKS_PER_CHILD", 50)
+
+# PDF page rendering
+PDF_RENDER_WORKERS = _env_int("PDF_RENDER_WORKERS", min(4, os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = _env_int("PDF_PARALLEL_MIN_PAGES", 8)
+
+# DOCX to PDF; "builtin" lays documents out in Python, "word" needs Microsoft Word
+DOCX_PDF_ENGINE = os.getenv("DOCX_PDF_ENGINE", "builtin")
+DOCX_PDF_TIMEOUT_SECONDS = _env_int("DOCX_PDF_TIMEOUT_SECONDS", 60)
+DOCX_PDF_MAX_CONCURRENCY = _env_int(
+    "DOCX_PDF_MAX_CONCURRENCY", max(1, EXECUTOR_PROCESS_WORKERS // 2)
+)
+DOCX_PDF_FONT_DIR = os.getenv("DOCX_PDF_FONT_DIR", "/usr/share/fonts/truetype/dejavu")
+
+# PDF compression; threads recompressing one PDF's images
+PDF_OPTIMIZE_WORKERS = _env_int("PDF_OPTIMIZE_WORKERS", min(4, os.cpu_count() or 1))
+
+# video compression
+VIDEO_COMPRESS_PRESET = os.getenv("VIDEO_COMPRESS_PRESET", "veryfast")
+VIDEO_COMPRESS_THREADS = _env_int("VIDEO_COMPRESS_THREADS", 0)
+
+# background jobs
+JOBS_MAX_RUNNING = _env_int("JOBS_MAX_RUNNING", EXECUTOR_PROCESS_WORKERS)
+JOBS_MAX_QUEUED = _env_int("JOBS_MAX_QUEUED", 100)
+JOBS_TTL_SECONDS = _env_int("JOBS_TTL_SECONDS", RESULT_STORE_TTL_SECONDS)
+
+# uploads
+UPLOAD_MAX_BYTES = _env_int("UPLOAD_MAX_BYTES", 100 * 1024 * 1024)
+MP4_TO_MP3_MAX_BYTES = _env_int("MP4_TO_MP3_MAX_BYTES", 300 * 1024 * 1024)
+COMPRESS_MAX_BYTES = _env_int("COMPRESS_MAX_BYTES", 500 * 1024 * 1024)
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", RESULT_STORE_SPOOL_DIR)
+
+# batch conversion
+BATCH_MAX_FILES = _env_int("BATCH_MAX_FILES", 50)
+BATCH_MAX_CONCURRENCY = _env_int("BATCH_MAX_CONCURRENCY", EXECUTOR_PROCESS_WORKERS)
+BATCH_MAX_BYTES = _env_int("BATCH_MAX_BYTES", 500 * 1024 * 1024)
+
+# conversion cache
+CONVERSION_CACHE_MAX_BYTES = _env_int("CONVERSION_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+CONVERSION_CACHE_DIR = os.getenv("CONVERSION_CACHE_DIR") or None
+CONVERSION_CACHE_MAX_DISK_BYTES = _env_int(
+    "CONVERSION_CACHE_MAX_DISK_BYTES", 5 * 1024 * 1024 * 1024
+)
+
+# conversion planning; a JSON file of measured "source->target" edge costs
+CONVERSION_COSTS_FILE = os.getenv("CONVERSION_COSTS_FILE") or None
@@ -1,8 +1,33 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router
+from app.api.routes import router, converter, executor, job_manager
+from app.api.middleware import MetricsMiddleware, UploadLimitMiddleware
+from app.services import metrics
+from app import config
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # cancel background jobs, then let running conversions finish and stop the pools
+    job_manager.shutdown()
+    executor.shutdown()
+    converter.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# added first so it sits inside CORS and its 413 responses still carry CORS headers
+app.add_middleware(
+    UploadLimitMiddleware,
+    default_limit=config.UPLOAD_MAX_BYTES,
+    limits={
+        "/api/v1/convert/mp4-to-mp3": config.MP4_TO_MP3_MAX_BYTES,
+        "/api/v1/compress": config.COMPRESS_MAX_BYTES,
+        "/api/v1/convert/batch": config.BATCH_MAX_BYTES,
+    },
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,6 +37,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# outermost, so rejected and failed requests are timed too
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+
 app.include_router(router, prefix="/api/v1")
 
 
@@ -20,6 +48,11 @@ def root():
     return {"message": "File Converter API is running"}
 
 
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/convert/all")
 def allConvert():
     return {
@@ -42,6 +75,11 @@ def allConvert():
             # "/api/v1/convert/pdf-to-svg",
             "/api/v1/convert/svg-to-image",
             "/api/v1/convert/mp4-to-mp3",
+            "/api/v1/convert",
+            "/api/v1/convert/formats",
+            "/api/v1/convert/batch",
+            "/api/v1/convert/svg-render",
+            "/api/v1/jobs/{job_id}",
             "compression of all accepted formats of files",
         ],
         "Incoming endpoints": [
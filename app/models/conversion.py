@@ -0,0 +1,35 @@
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class ConversionEdge:
+    "One FileConverter method, seen as a step from one format to another."
+
+    source: str
+    target: str
+    # name of the FileConverter method; it takes the content as its first argument
+    method: str
+    # estimated milliseconds per megabyte of input; the planner minimises the sum
+    cost: float
+    options: dict = field(default_factory=dict, hash=False, compare=False)
+    # executor pool to run on; converters that wait on a subprocess use "thread"
+    kind: str = "process"
+    # the method returns one result per page instead of a single file
+    per_page: bool = False
+    # the output is re-encoded with loss, e.g. as JPEG
+    lossy: bool = False
+    # the output is only worth returning, not converting further; an image wrapped
+    # in an SVG would be rasterized right back
+    terminal: bool = False
+    # the method spreads a large PDF's pages over the converter's render pool, which
+    # it can only reach when run on a thread of this process
+    fans_out: bool = False
+
+    @property
+    def final(self) -> bool:
+        return self.per_page or self.terminal
+
+    @property
+    def step(self) -> tuple[str, dict]:
+        "What FileConverter.convert_chain needs to run this edge."
+        return self.method, self.options
@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+from typing import Optional, Union
+
+
+@dataclass
+class StoredFile:
+    "A converted file held by the result store until it is downloaded or expires."
+
+    file_id: str
+    content: Optional[Union[bytes, list[bytes]]]
+    media_type: str
+    filename: str
+    size: int
+    created_at: float
+    expires_at: float
+    # set when the content was spilled to the spool directory instead of memory
+    path: Optional[str] = None
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
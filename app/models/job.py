@@ -0,0 +1,44 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    "A conversion running in the background whose status is polled via /jobs/{job_id}."
+
+    job_id: str
+    kind: str
+    status: str
+    created_at: float
+    updated_at: float
+    progress: float = 0.0
+    # units of work completed so far, e.g. rendered pages or encoded frames
+    done: int = 0
+    total: Optional[int] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    finished_at: Optional[float] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "done": self.done,
+            "total": self.total,
+        }
+        if self.result is not None:
+            data.update(self.result)
+        if self.error is not None:
+            data["error"] = self.error
+        return data
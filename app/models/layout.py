@@ -0,0 +1,64 @@
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+
+@dataclass
+class TextRun:
+    "A stretch of text in one font, size and colour."
+
+    text: str
+    font: str
+    # points
+    size: float
+    bold: bool = False
+    italic: bool = False
+    superscript: bool = False
+    # sRGB as 0xRRGGBB
+    color: int = 0
+
+
+@dataclass
+class TextBlock:
+    "A paragraph of text as PyMuPDF groups it, with its box on the page in points."
+
+    bbox: tuple[float, float, float, float]
+    runs: list[TextRun] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "".join(run.text for run in self.runs)
+
+
+@dataclass
+class PageImage:
+    "An image drawn on a page, encoded in a format Word can embed."
+
+    bbox: tuple[float, float, float, float]
+    data: bytes
+    # "png", "jpeg", ...
+    ext: str
+
+
+@dataclass
+class PageLayout:
+    """What one PDF page holds, in reading order; extracted in a worker process.
+
+    Sizes and boxes are in points, with the origin at the top left of the page.
+    """
+
+    number: int
+    width: float
+    height: float
+    items: list[Union[TextBlock, PageImage]] = field(default_factory=list)
+
+    @property
+    def content_box(self) -> Optional[tuple[float, float, float, float]]:
+        "The box around everything on the page, or None for a blank page."
+        if not self.items:
+            return None
+        return (
+            min(item.bbox[0] for item in self.items),
+            min(item.bbox[1] for item in self.items),
+            max(item.bbox[2] for item in self.items),
+            max(item.bbox[3] for item in self.items),
+        )
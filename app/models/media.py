@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class MediaInfo:
+    "What ffmpeg reports about an input file's container and first audio and video streams."
+
+    # seconds, when the container declares it
+    duration: Optional[float] = None
+    audio_codec: Optional[str] = None
+    video_codec: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+    @property
+    def has_video(self) -> bool:
+        return self.video_codec is not None
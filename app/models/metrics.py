@@ -0,0 +1,12 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ConversionSamples:
+    "What a converter recorded while it ran on a worker, carried back to be merged."
+
+    # (stage, seconds) in the order the stages finished
+    stages: list[tuple[str, float]] = field(default_factory=list)
+    pages: int = 0
+    # time the call took on the worker, without the time it spent queued
+    seconds: float = 0.0
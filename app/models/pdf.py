@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+from typing import Optional
+
+# images are never downsampled below this, even at the strongest compression
+MIN_IMAGE_DPI = 72
+
+
+@dataclass(frozen=True)
+class PdfOptimizeOptions:
+    "How far PDF compression may go with embedded images, and the file's layout."
+
+    # images drawn at more pixels per inch than this are downsampled; None keeps
+    # every image at its resolution
+    max_dpi: Optional[int] = None
+    # JPEG quality for recompressed images; None leaves JPEG data as it is
+    jpeg_quality: Optional[int] = None
+    # write a linearized ("fast web view") file that viewers can show page by page
+    linearize: bool = False
+
+    @classmethod
+    def from_percent(
+        cls, percent: int, linearize: bool = False
+    ) -> "PdfOptimizeOptions":
+        """Options for a compression percentage from 0 to 100.
+
+        ``0`` only rewrites the file's structure. Higher values lower the image
+        resolution from 300 DPI towards 72 and the JPEG quality from 90 to 40.
+        """
+        if percent <= 0:
+            return cls(linearize=linearize)
+        max_dpi = max(MIN_IMAGE_DPI, round(300 - 2.28 * percent))
+        return cls(max_dpi, round(90 - 0.5 * percent), linearize)
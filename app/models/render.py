@@ -0,0 +1,32 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+
+# 2x zoom of PDF's 72 points per inch, the long-standing default
+DEFAULT_DPI = 144
+MIN_DPI = 18
+MAX_DPI = 600
+
+THUMBNAIL = "thumbnail"
+
+
+@dataclass(frozen=True)
+class RenderOptions:
+    "How PDF pages are rasterized: resolution, colour, transparency and size limits."
+
+    dpi: int = DEFAULT_DPI
+    grayscale: bool = False
+    alpha: bool = False
+    # longest side in pixels; pages that would come out larger are rendered smaller
+    max_dimension: Optional[int] = None
+    jpg_quality: int = 95
+
+    @classmethod
+    def preset(cls, name: str) -> "RenderOptions":
+        if name == THUMBNAIL:
+            # low resolution and a size cap keep previews cheap to render and encode
+            return cls(dpi=72, max_dimension=256, jpg_quality=75)
+        raise ValueError(f"Unknown render preset: {name}")
+
+    def with_overrides(self, **overrides) -> "RenderOptions":
+        "Copy these options, replacing only the settings that were given."
+        return replace(self, **{k: v for k, v in overrides.items() if v is not None})
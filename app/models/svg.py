@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+from typing import Optional
+
+# formats an SVG renders to, with the extension of each
+SVG_TARGET_FORMATS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp", "PDF": "pdf"}
+_ALIASES = {"JPG": "JPEG"}
+
+# limits on one render request
+MAX_SVG_TARGETS = 32
+MAX_SVG_DIMENSION = 8192
+
+
+@dataclass(frozen=True)
+class SvgTarget:
+    """One rendition of an SVG: a format and a size in pixels.
+
+    With only one side given the other follows the drawing's aspect ratio, and
+    with neither the SVG's own size is used.
+    """
+
+    fmt: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+    @property
+    def extension(self) -> str:
+        return SVG_TARGET_FORMATS[self.fmt]
+
+    def filename(self, stem: str) -> str:
+        if self.width and self.height:
+            return f"{stem}_{self.width}x{self.height}.{self.extension}"
+        if self.width:
+            return f"{stem}_{self.width}w.{self.extension}"
+        if self.height:
+            return f"{stem}_{self.height}h.{self.extension}"
+        return f"{stem}.{self.extension}"
+
+    @classmethod
+    def parse(cls, spec: str) -> "SvgTarget":
+        """One target from ``format[:size]``, where size is ``W``, ``WxH`` or ``xH``.
+
+        ``png:32`` is 32 pixels wide, ``png:32x32`` exactly 32 by 32.
+        """
+        fmt, _, size = spec.strip().partition(":")
+        fmt = fmt.strip().upper()
+        fmt = _ALIASES.get(fmt, fmt)
+        if fmt not in SVG_TARGET_FORMATS:
+            raise ValueError(f"Unsupported render format: {fmt.lower() or spec}")
+        width = height = None
+        size = size.strip().lower()
+        if size:
+            first, sep, second = size.partition("x")
+            try:
+                width = int(first) if first else None
+                height = int(second) if sep and second else None
+            except ValueError:
+                raise ValueError(f"Invalid render size: {size}")
+            if width is None and height is None:
+                raise ValueError(f"Invalid render size: {size}")
+            for side in (width, height):
+                if side is not None and not 1 <= side <= MAX_SVG_DIMENSION:
+                    raise ValueError(
+                        f"Render sizes must be between 1 and {MAX_SVG_DIMENSION} pixels"
+                    )
+        return cls(fmt, width, height)
+
+    @classmethod
+    def parse_list(cls, spec: str) -> list["SvgTarget"]:
+        "Comma-separated targets such as ``png:16,png:32,png:512,pdf``; repeats once."
+        targets: list[SvgTarget] = []
+        for part in spec.split(","):
+            if part.strip():
+                target = cls.parse(part)
+                if target not in targets:
+                    targets.append(target)
+        if not targets:
+            raise ValueError("No render targets given")
+        if len(targets) > MAX_SVG_TARGETS:
+            raise ValueError(f"At most {MAX_SVG_TARGETS} render targets are allowed")
+        return targets
+
+
+# how images become SVG: wrapped as they are, or traced into paths
+IMAGE_SVG_MODES = ("embed", "trace")
+
+# limits of image tracing's settings
+MIN_TRACE_COLORS = 2
+MAX_TRACE_COLORS = 64
+
+
+@dataclass(frozen=True)
+class TraceOptions:
+    """How an image is traced into vector paths.
+
+    ``colors`` is how many flat colours the image is reduced to. ``detail`` runs
+    from 0, which smooths outlines and drops small specks, to 1, which follows
+    every pixel step at full resolution.
+    """
+
+    colors: int = 8
+    detail: float = 0.5
+
+    def __post_init__(self):
+        if not MIN_TRACE_COLORS <= self.colors <= MAX_TRACE_COLORS:
+            raise ValueError(
+                f"colors must be between {MIN_TRACE_COLORS} and {MAX_TRACE_COLORS}"
+            )
+        if not 0 <= self.detail <= 1:
+            raise ValueError("detail must be between 0 and 1")
+
+    @property
+    def max_side(self) -> int:
+        "Longest side, in pixels, images are traced at; larger ones are scaled down."
+        return round(512 + 1536 * self.detail)
+
+    @property
+    def tolerance(self) -> float:
+        "How far, in pixels, a simplified outline may stray from the pixel edges."
+        return 2.0 * (1 - self.detail)
+
+    @property
+    def min_area(self) -> int:
+        "Shapes smaller than this many pixels are dropped."
+        return max(1, round(64 * (1 - self.detail) ** 2))
+
+    @property
+    def smoothing(self) -> int:
+        "Size of the majority filter run over colour labels; 0 for none."
+        if self.detail < 1 / 3:
+            return 5
+        if self.detail < 2 / 3:
+            return 3
+        return 0
@@ -0,0 +1,204 @@
+import hashlib  # for content-addressed cache keys
+import json  # for a stable encoding of conversion parameters
+import os  # for the on-disk tier
+import threading  # for guarding the cache across concurrent requests
+import uuid  # for unique temporary file names
+from collections import OrderedDict  # for least-recently-used ordering
+from typing import Any, Optional, Union
+
+from app.services.storage import PARTIAL_SUFFIX, pid_alive
+
+DISK_SUFFIX = ".bin"
+
+Result = Union[bytes, list[bytes]]
+
+
+class ConversionCache:
+    """Size-bounded LRU of conversion results keyed by input hash and parameters.
+
+    Results live in memory up to ``max_bytes``. When ``disk_dir`` is set, byte
+    results are also written there (bounded by ``max_disk_bytes``) so they survive
+    restarts and are promoted back into memory on their next hit.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 0,
+    ):
+        self.max_bytes = max_bytes
+        # a single huge result should not flush everything else out of memory
+        self.max_entry_bytes = max_bytes // 4
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, Result]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def key(input_hash: str, conversion: str, params: Any = None) -> str:
+        "Build the cache key for converting content with ``input_hash``."
+        encoded = json.dumps(
+            [input_hash, conversion, params], sort_keys=True, default=str
+        )
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _size(value: Result) -> int:
+        if isinstance(value, (list, tuple)):
+            return sum(len(part) for part in value)
+        return len(value)
+
+    def get(self, key: str) -> Optional[Result]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._counters["hits"] += 1
+                return value
+
+            on_disk = key in self._disk
+            if on_disk:
+                self._disk.move_to_end(key)
+
+        if on_disk:
+            value = self._read_disk(key)
+            if value is not None:
+                with self._lock:
+                    self._counters["hits"] += 1
+                    self._counters["disk_hits"] += 1
+                    self._put_memory(key, value)
+                return value
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, key: str, value: Result) -> None:
+        size = self._size(value)
+        with self._lock:
+            self._counters["stores"] += 1
+            self._put_memory(key, value)
+
+        # only whole byte strings go to disk; multi-part results stay in memory
+        if self.disk_dir and isinstance(value, bytes) and size <= self.max_disk_bytes:
+            self._write_disk(key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes if self.disk_dir else 0,
+                "hit_ratio": (
+                    round(self._counters["hits"] / lookups, 4) if lookups else 0.0
+                ),
+                **self._counters,
+            }
+
+    # callers must hold the lock
+    def _put_memory(self, key: str, value: Result) -> None:
+        size = self._size(value)
+        if size > self.max_entry_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._size(self._memory.pop(key))
+        while self._memory and self._memory_bytes + size > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= self._size(evicted)
+            self._counters["evictions"] += 1
+        self._memory[key] = value
+        self._memory_bytes += size
+
+    # disk tier
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + DISK_SUFFIX)
+
+    def _load_disk_index(self) -> None:
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if not name.endswith(DISK_SUFFIX):
+                # leftovers of writes interrupted by a crash; workers sharing the
+                # directory name theirs "<pid>-...", and live ones keep them
+                owner = name.split("-", 1)[0]
+                other = owner.isdigit() and int(owner) != os.getpid()
+                if other and pid_alive(int(owner)):
+                    continue
+                _unlink(path)
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, name[: -len(DISK_SUFFIX)], stat.st_size))
+        # oldest first, so the most recently written entries are evicted last
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        with self._lock:
+            self._evict_disk(0)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            with self._lock:
+                size = self._disk.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+            return None
+
+    def _write_disk(self, key: str, value: bytes) -> None:
+        temp_name = f"{os.getpid()}-{uuid.uuid4().hex}{PARTIAL_SUFFIX}"
+        temp_path = os.path.join(self.disk_dir, temp_name)
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(value)
+            os.replace(temp_path, self._disk_path(key))
+        except OSError:
+            # the disk tier is best effort; a failed write only costs a future miss
+            _unlink(temp_path)
+            return
+
+        with self._lock:
+            previous = self._disk.pop(key, None)
+            if previous is not None:
+                self._disk_bytes -= previous
+            self._evict_disk(len(value))
+            self._disk[key] = len(value)
+            self._disk_bytes += len(value)
+
+    def _evict_disk(self, incoming: int) -> None:
+        while self._disk and self._disk_bytes + incoming > self.max_disk_bytes:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._counters["disk_evictions"] += 1
+            _unlink(self._disk_path(key))
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
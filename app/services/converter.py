@@ -6,9 +6,10 @@ from reportlab.pdfgen import canvas  # for pdf generation
 from reportlab.lib.pagesizes import letter, A4  # for defining page size
 from reportlab.lib.utils import ImageReader  # for reading images in reportlab
 import fitz  # PyMuPDF for PDF manipulation pdf to image conversion
-from docx2pdf import convert  # for converting Word documents to PDF
+from docx2pdf import convert  # for converting Word documents to PDF through Word
 import tempfile  # for creating temporary files
 import os  # for file path operations
+import shutil  # for copying a kept original to a result's scratch path
 import base64  # for encoding and decoding base64 strings
 from xml.etree.cElementTree import (
     Element,
@@ -20,41 +21,437 @@ import xml.etree.ElementTree as ET  # for XML parsing and manipulation
 # from cairosvg import svg2png  # for converting SVG to PNG
 # import svglib.svglib as svglib  # for SVG to PDF conversion
 from reportlab.graphics import renderPM  # for rendering SVG to PDF
-from cairosvg import svg2png, svg2pdf
 from svglib.svglib import svg2rlg
 from reportlab.graphics import renderPM
-from docx import Document
-from moviepy import VideoFileClip
+from contextlib import contextmanager
+from collections import deque  # for the window of in-flight page renders
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing  # for the start method of the page render pool
+import threading  # for creating the page render pool once
+from typing import Callable, Iterator, Optional, Union
 
 # from pydub import AudioSegment
 import pikepdf  # for PDF manipulation and compression
+from app.models.layout import PageLayout
+from app.models.pdf import PdfOptimizeOptions
+from app.models.render import RenderOptions
+from app.models.svg import SVG_TARGET_FORMATS, SvgTarget, TraceOptions
+from app.services.archive import write_zip
+from app.services.docx_pdf import DocxPdfRenderer
+from app.services.imaging import DecodedImage, normalize_format
+from app.services.image_compression import ADAPTIVE_FORMATS, optimize_image
+from app.services.image_pdf import ImagePdfBuilder
+from app.services.pdf_layout import DocxBuilder, extract_page
+from app.services.pdf_optimizer import optimize_pdf
+from app.services.svg_render import render_svg, render_target, render_targets
+from app.services.tracing import TraceTooLargeError, trace_image
+from app.services.metrics import add_pages, stage
+from app.services import ffmpeg
+
+
+# converters take either raw bytes or the path of a spooled upload
+Source = Union[bytes, str, os.PathLike]
+
+
+def _is_path(source: Source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def _as_stream(source: Source):
+    # PIL, reportlab and pikepdf open a path or a file object alike
+    return source if _is_path(source) else io.BytesIO(source)
+
+
+def _read_source(source: Source) -> bytes:
+    if _is_path(source):
+        with stage("read"), open(source, "rb") as f:
+            return f.read()
+    return source
+
+
+def _open_pdf(source: Source) -> fitz.Document:
+    if _is_path(source):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+@contextmanager
+def _source_path(source: Source, suffix: str) -> Iterator[str]:
+    "Yield a filesystem path for tools that need one, spooling bytes to a temp file."
+    if _is_path(source):
+        yield os.fspath(source)
+        return
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp:
+        temp.write(source)
+        temp_path = temp.name
+    try:
+        yield temp_path
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+# x264 speed presets, fastest first; slower presets compress better at the same CRF
+VIDEO_PRESETS = [
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+]
+
+# video extension -> ffmpeg muxer, video encoder, audio encoder with its bitrate in
+# kbps at 0%, and the audio codecs the container carries as they are
+VIDEO_CONTAINERS = {
+    ".mp4": {"muxer": "mp4", "video": "libx264", "audio": ("aac", 128),
+             "copy_audio": {"aac", "mp3", "ac3", "eac3"}},
+    ".mov": {"muxer": "mov", "video": "libx264", "audio": ("aac", 128),
+             "copy_audio": {"aac", "mp3", "ac3", "alac", "pcm_s16le"}},
+    ".mkv": {"muxer": "matroska", "video": "libx264", "audio": ("aac", 128),
+             "copy_audio": {"aac", "mp3", "ac3", "eac3", "opus", "vorbis", "flac"}},
+    ".avi": {"muxer": "avi", "video": "libx264", "audio": ("libmp3lame", 128),
+             "copy_audio": {"mp3", "ac3", "pcm_s16le"}},
+    ".flv": {"muxer": "flv", "video": "libx264", "audio": ("aac", 128),
+             "copy_audio": {"aac", "mp3"}},
+    ".webm": {"muxer": "webm", "video": "libvpx-vp9", "audio": ("libopus", 96),
+              "copy_audio": {"opus", "vorbis"}},
+    ".wmv": {"muxer": "asf", "video": "wmv2", "audio": ("wmav2", 128),
+             "copy_audio": {"wmav1", "wmav2"}},
+}
+# re-encoded audio never goes below this bitrate, in kbps
+MIN_AUDIO_KBPS = 32
+
+# audio format -> (ffmpeg muxer, codec that can be stream-copied, encoder arguments)
+AUDIO_FORMATS = {
+    "mp3": ("mp3", "mp3", ["-c:a", "libmp3lame", "-q:a", "2"]),
+    "m4a": ("ipod", "aac", ["-c:a", "aac", "-b:a", "192k"]),
+}
+
+
+def _render_page(page: fitz.Page, fmt: str, options: RenderOptions) -> bytes:
+    zoom = options.dpi / 72
+    if options.max_dimension:
+        # scale the render itself down rather than resizing a full-size pixmap
+        longest = max(page.rect.width, page.rect.height)
+        zoom = min(zoom, options.max_dimension / longest)
+    pix = page.get_pixmap(
+        matrix=fitz.Matrix(zoom, zoom),
+        colorspace=fitz.csGRAY if options.grayscale else fitz.csRGB,
+        # JPEG has no alpha channel
+        alpha=options.alpha and fmt == "png",
+    )
+    if fmt == "jpg":
+        return pix.tobytes(fmt, jpg_quality=options.jpg_quality)
+    return pix.tobytes(fmt)
+
+
+def _render_pages(
+    source: Source, page_numbers: list[int], fmt: str, options: RenderOptions
+) -> list[bytes]:
+    "Rasterize the given 0-based pages of a PDF; runs in the render pool."
+    pdf_document = _open_pdf(source)
+    try:
+        return [
+            _render_page(pdf_document.load_page(page_num), fmt, options)
+            for page_num in page_numbers
+        ]
+    finally:
+        pdf_document.close()
+
+
+def _extract_pages(source: Source, page_numbers: list[int]) -> list[PageLayout]:
+    "Text blocks, fonts and images of the given 0-based pages; runs in the render pool."
+    pdf_document = _open_pdf(source)
+    try:
+        return [
+            extract_page(pdf_document.load_page(page_num))
+            for page_num in page_numbers
+        ]
+    finally:
+        pdf_document.close()
+
+
+def parse_page_range(spec: Optional[str], page_count: int) -> list[int]:
+    """Turn a 1-based page selection such as ``"1-5,10,12-"`` into 0-based page numbers.
+
+    An empty selection means every page. Pages keep the order they are listed in,
+    and a page listed again is only taken the first time.
+    """
+    if spec is None or not spec.strip():
+        return list(range(page_count))
+
+    pages = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        try:
+            start = int(first) if first.strip() else 1
+            end = (int(last) if last.strip() else page_count) if sep else start
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part}")
+        if start < 1 or end > page_count or start > end:
+            raise ValueError(
+                f"Page range {part} is outside the document's {page_count} pages"
+            )
+        pages.extend(range(start - 1, end))
+    if not pages:
+        raise ValueError(f"Invalid page range: {spec}")
+    # each page is one archive entry, and entry names must be unique
+    return list(dict.fromkeys(pages))
+
+
+# pages rendered or extracted per render-pool task, and tasks kept in flight per
+# worker
+PAGES_PER_TASK = 4
+TASKS_PER_WORKER = 2
 
 
 class FileConverter:
     "Class to handle various file conversion operations."
 
-    def __init__(self):
+    def __init__(
+        self,
+        render_workers: int = 1,
+        parallel_min_pages: int = 8,
+        start_method: str = "spawn",
+        docx_engine: str = "builtin",
+        docx_timeout: Optional[float] = None,
+        docx_font_dir: Optional[str] = None,
+    ):
         self.temp_dir = tempfile.gettempdir()
+        # PDF rasterization and text extraction split pages across at most this
+        # many processes
+        self.render_workers = render_workers
+        self.parallel_min_pages = parallel_min_pages
+        self.start_method = start_method
+        # DOCX to PDF: "builtin" lays documents out with reportlab, "word" drives
+        # Microsoft Word through docx2pdf
+        self.docx_engine = docx_engine
+        self.docx_timeout = docx_timeout
+        self.docx_font_dir = docx_font_dir
+        self._render_pool: Optional[ProcessPoolExecutor] = None
+        self._render_lock = threading.Lock()
+
+    def __getstate__(self):
+        # the converter is pickled into worker processes; its render pool stays here
+        state = self.__dict__.copy()
+        state["_render_pool"] = None
+        del state["_render_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._render_lock = threading.Lock()
+
+    def pdf_page_count(self, pdf_content: Source) -> int:
+        pdf_document = _open_pdf(pdf_content)
+        try:
+            return len(pdf_document)
+        finally:
+            pdf_document.close()
+
+    def renders_in_parallel(self, page_count: int) -> bool:
+        "Whether rasterizing this many pages fans them out to the render pool."
+        if self.render_workers <= 1 or multiprocessing.parent_process() is not None:
+            # never start a nested pool from inside a worker process
+            return False
+        return page_count >= self.parallel_min_pages
+
+    def shutdown(self) -> None:
+        with self._render_lock:
+            if self._render_pool is not None:
+                self._render_pool.shutdown(wait=True, cancel_futures=True)
+                self._render_pool = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._render_lock:
+            if self._render_pool is None:
+                self._render_pool = ProcessPoolExecutor(
+                    max_workers=self.render_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self._render_pool
+
+    def iter_pdf_pages(
+        self,
+        pdf_content: Source,
+        fmt: str,
+        pages: Optional[list[int]] = None,
+        progress=None,
+        options: Optional[RenderOptions] = None,
+    ) -> Iterator[bytes]:
+        """Yield the selected pages of a PDF encoded as ``fmt``, in selection order.
+
+        Pages are rendered lazily, so a serial render holds one page at a time. A
+        parallel render keeps a small window of tasks in flight rather than the
+        whole document.
+        """
+        options = options or RenderOptions()
+        pdf_document = _open_pdf(pdf_content)
+        if pages is None:
+            pages = list(range(len(pdf_document)))
+        total = len(pages)
+
+        if not self.renders_in_parallel(total):
+            try:
+                for done, page_num in enumerate(pages, start=1):
+                    with stage("render"):
+                        page = pdf_document.load_page(page_num)
+                        image = _render_page(page, fmt, options)
+                    add_pages(1)
+                    yield image
+                    if progress:
+                        progress(done, total)
+            finally:
+                pdf_document.close()
+            return
+        pdf_document.close()
+
+        done = 0
+        batches = self._map_page_batches(
+            _render_pages, pdf_content, pages, "render", fmt, options
+        )
+        for rendered in batches:
+            for image in rendered:
+                yield image
+                done += 1
+                if progress:
+                    progress(done, total)
+
+    def _map_page_batches(
+        self,
+        task: Callable,
+        pdf_content: Source,
+        pages: list[int],
+        stage_name: str,
+        *args,
+    ) -> Iterator[list]:
+        """Run ``task(pdf_content, batch, *args)`` on the render pool, page batch by batch.
+
+        Results come back in page order. A small window of tasks is kept in flight
+        rather than the whole document, and time spent waiting on the pool is
+        recorded as ``stage_name``.
+        """
+        batches = [
+            pages[i : i + PAGES_PER_TASK] for i in range(0, len(pages), PAGES_PER_TASK)
+        ]
+        window = self.render_workers * TASKS_PER_WORKER
+        pool = self._pool()
+        pending = deque()
+        try:
+            for batch in batches[:window]:
+                pending.append(pool.submit(task, pdf_content, batch, *args))
+            submitted = len(pending)
+            # waiting on batches in submission order keeps the output deterministic
+            while pending:
+                # the pool's processes record nothing themselves
+                with stage(stage_name):
+                    results = pending.popleft().result()
+                add_pages(len(results))
+                if submitted < len(batches):
+                    pending.append(
+                        pool.submit(task, pdf_content, batches[submitted], *args)
+                    )
+                    submitted += 1
+                yield results
+        except BrokenProcessPool:
+            # a crashed worker takes the pool with it; start fresh next time
+            with self._render_lock:
+                self._render_pool = None
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def convert_pdf_to_archive(
+        self,
+        pdf_content: Source,
+        fmt: str,
+        archive_path: str,
+        entry_prefix: str,
+        pages: Optional[list[int]] = None,
+        progress=None,
+        options: Optional[RenderOptions] = None,
+    ) -> Optional[bytes]:
+        """Stream pages into a ZIP at ``archive_path`` as they are rendered.
+
+        Entries are named ``<entry_prefix>_page_<n>.<fmt>``. A selection of a single
+        page returns that image instead and leaves ``archive_path`` alone.
+        """
+        if pages is None:
+            pages = list(range(self.pdf_page_count(pdf_content)))
+        images = self.iter_pdf_pages(pdf_content, fmt, pages, progress, options)
+        try:
+            if len(pages) == 1:
+                return next(images)
+            write_zip(
+                archive_path,
+                (
+                    (f"{entry_prefix}_page_{page_num + 1}.{fmt}", image)
+                    for page_num, image in zip(pages, images)
+                ),
+            )
+            return None
+        except Exception as e:
+            raise Exception(f"Error converting PDF to {fmt.upper()}: {str(e)}")
+        finally:
+            images.close()
+
+    # chained conversions
+    def convert_chain(
+        self, content: Source, steps: list[tuple[str, dict]]
+    ) -> Union[bytes, list[bytes]]:
+        """Run converter methods one after another, as planned by the format graph.
+
+        ``steps`` are ``(method name, keyword arguments)`` pairs. Each method gets the
+        previous one's output, so intermediate formats stay in memory.
+        """
+        result = content
+        for method, options in steps:
+            result = getattr(self, method)(result, **options)
+        return result
+
+    def convert_chain_to_archive(
+        self,
+        content: Source,
+        steps: list[tuple[str, dict]],
+        fmt: str,
+        archive_path: str,
+        entry_prefix: str,
+    ) -> Optional[bytes]:
+        """Run a planned chain that ends in per-page images, streaming them into a ZIP.
+
+        Every step but the last runs as in ``convert_chain``. The last one's PDF is
+        rendered like ``convert_pdf_to_archive``: page by page into ``archive_path``,
+        or as the image itself when it has a single page.
+        """
+        pdf_content = self.convert_chain(content, steps[:-1])
+        return self.convert_pdf_to_archive(pdf_content, fmt, archive_path, entry_prefix)
 
     # png to pdf
-    def convert_png_to_pdf(self, png_file_path: bytes) -> bytes:
+    def convert_png_to_pdf(self, png_file_path: Source) -> bytes:
         return self.convert_image_to_pdf(png_file_path, image_format="PNG")
 
     # jpg to pdf
     @staticmethod
-    def convert_jpg_to_pdf(jpg_file_path: bytes) -> bytes:
+    def convert_jpg_to_pdf(jpg_file_path: Source) -> bytes:
         try:
-            image = Image.open(io.BytesIO(jpg_file_path))
-
-            if image.mode != "RGB":
-                image = image.convert("RGB")
+            # only the header is parsed for the size; reportlab embeds the JPEG data
+            data = _read_source(jpg_file_path)
+            img_width, img_height = DecodedImage(data).size
 
             pdf_buffer = io.BytesIO()
-            img_width, img_height = image.size
             page_width = min(img_width, A4[0])
             page_height = min(img_height, A4[1])
             c = canvas.Canvas(pdf_buffer, pagesize=(page_width, page_height))
-            img_reader = ImageReader(io.BytesIO(jpg_file_path))
+            img_reader = ImageReader(io.BytesIO(data))
             c.drawImage(img_reader, 0, 0, width=page_width, height=page_height)
             c.save()
             return pdf_buffer.getvalue()
@@ -62,19 +459,28 @@ class FileConverter:
             raise Exception(f"Error converting JPG to PDF: {str(e)}")
 
     # doc to pdf
-    def convert_docx_to_pdf(self, docx_content: bytes) -> bytes:
+    def convert_docx_to_pdf(self, docx_content: Source) -> bytes:
+        if self.docx_engine == "word":
+            return self._convert_docx_with_word(docx_content)
         try:
-            # Create temporary files
-            with tempfile.NamedTemporaryFile(suffix=".docx", delete=False) as temp_docx:
-                temp_docx.write(docx_content)
-                temp_docx_path = temp_docx.name
+            renderer = DocxPdfRenderer(self.docx_timeout, self.docx_font_dir)
+            return renderer.render(_read_source(docx_content))
+        except TimeoutError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error converting DOCX to PDF: {str(e)}")
 
+    # doc to pdf through Microsoft Word, on Windows and macOS hosts that have it
+    def _convert_docx_with_word(self, docx_content: Source) -> bytes:
+        try:
             with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_pdf:
                 temp_pdf_path = temp_pdf.name
 
             try:
                 # Convert DOCX to PDF
-                convert(temp_docx_path, temp_pdf_path)
+                with _source_path(docx_content, ".docx") as temp_docx_path:
+                    with stage("render"):
+                        convert(temp_docx_path, temp_pdf_path)
 
                 # Read the converted PDF
                 with open(temp_pdf_path, "rb") as pdf_file:
@@ -83,8 +489,6 @@ class FileConverter:
                 return pdf_content
 
             finally:
-                if os.path.exists(temp_docx_path):
-                    os.unlink(temp_docx_path)
                 if os.path.exists(temp_pdf_path):
                     os.unlink(temp_pdf_path)
 
@@ -93,94 +497,78 @@ class FileConverter:
 
     # image to pdf
     def convert_image_to_pdf(
-        self, image_content: bytes, image_format: str = "PNG"
+        self, image_content: Source, image_format: str = "PNG"
     ) -> bytes:
         try:
-            image = Image.open(io.BytesIO(image_content))
-
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-
-            pdf_buffer = io.BytesIO()
-            image.save(pdf_buffer, format="PDF", resolution=100.0)
-
-            return pdf_buffer.getvalue()
+            builder = ImagePdfBuilder()
+            builder.add(_read_source(image_content))
+            return builder.save()
 
         except Exception as e:
             raise Exception(f"Error converting {image_format} to PDF: {str(e)}")
 
+    # images to one pdf
+    def convert_images_to_pdf(self, image_contents: list[Source]) -> bytes:
+        "One page per image, in order, with JPEG and PNG data embedded as-is."
+        try:
+            builder = ImagePdfBuilder()
+            for image_content in image_contents:
+                builder.add(_read_source(image_content))
+            return builder.save()
+        except Exception as e:
+            raise Exception(f"Error converting images to PDF: {str(e)}")
+
     # svg to pdf
-    def convert_svg_to_pdf(self, svg_content: bytes) -> bytes:
+    def convert_svg_to_pdf(self, svg_content: Source) -> bytes:
         try:
-            pdf_bytes = svg2pdf(bytestring=svg_content)
-            return pdf_bytes
+            return render_target(_read_source(svg_content), SvgTarget("PDF"))
         except Exception as e:
             raise Exception(f"Error converting SVG to PDF: {str(e)}")
         
     #png to jpeg
-    def convert_png_to_jpeg(self, png_content: bytes) -> bytes: 
+    def convert_png_to_jpeg(self, png_content: Source) -> bytes: 
         try:
-            image = Image.open(io.BytesIO(png_content))
-
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-
-            jpg_buffer = io.BytesIO()
-            image.save(jpg_buffer, format="JPEG")
-            return jpg_buffer.getvalue()
+            return DecodedImage(_read_source(png_content)).encode("JPEG")
         except Exception as e:
             raise Exception(f"Error converting png to jpeg: {str(e)}")
         
     #jpeg to png
-    def convert_jpeg_to_png(self, jpg_content: bytes) -> bytes:
+    def convert_jpeg_to_png(self, jpg_content: Source) -> bytes:
         try:
-            image = Image.open(io.BytesIO(jpg_content))
-
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-
-            png_buffer = io.BytesIO()
-            image.save(png_buffer, format="PNG")
-            return png_buffer.getvalue()
+            image = DecodedImage(_read_source(jpg_content))
+            if image.format != "PNG" and image.mode != "RGB":
+                image = DecodedImage.from_raster(image.pixels().convert("RGB"))
+            return image.encode("PNG")
         except Exception as e:
             raise Exception(f"Error converting jpeg to png: {str(e)}")   
 
 
     # pdf to png
-    def convert_pdf_to_png(self, pdf_content: bytes) -> list[bytes]:
+    def convert_pdf_to_png(
+        self, pdf_content: Source, pages: Optional[list[int]] = None, progress=None
+    ) -> list[bytes]:
         try:
-            pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-            images = []
-            mat = fitz.Matrix(2.0, 2.0)
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                pix = page.get_pixmap(matrix=mat)
-                png_data = pix.tobytes("png")
-                images.append(png_data)
-            pdf_document.close()
-            return images
+            return list(self.iter_pdf_pages(pdf_content, "png", pages, progress))
         except Exception as e:
             raise Exception(f"Error converting PDF to PNG: {str(e)}")
 
     # pdf to jpg
-    def convert_pdf_to_jpg(self, pdf_content: bytes) -> list[bytes]:
+    def convert_pdf_to_jpg(
+        self, pdf_content: Source, pages: Optional[list[int]] = None, progress=None
+    ) -> list[bytes]:
         try:
-            pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-            images = []
-            mat = fitz.Matrix(2.0, 2.0)  # Zoom for better quality
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                pix = page.get_pixmap(matrix=mat)
-                jpg_data = pix.tobytes("jpg")
-                images.append(jpg_data)
-            pdf_document.close()
-            return images
+            return list(self.iter_pdf_pages(pdf_content, "jpg", pages, progress))
         except Exception as e:
             raise Exception(f"Error converting PDF to JPG: {str(e)}")
 
     # pdf to image
     def convert_pdf_to_image(
-        self, pdf_content: bytes, image_format: str = "PNG"
+        self,
+        pdf_content: Source,
+        image_format: str = "PNG",
+        pages: Optional[list[int]] = None,
+        progress=None,
+        options: Optional[RenderOptions] = None,
     ) -> list[bytes]:
         supported_formats = ["PNG", "JPG", "JPEG"]
         fmt = image_format.lower()
@@ -190,62 +578,68 @@ class FileConverter:
             raise ValueError(f"Unsupported image format: {image_format}")
 
         try:
-            pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-            images = []
-            mat = fitz.Matrix(2.0, 2.0)
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes(fmt)
-                images.append(img_data)
-            pdf_document.close()
-            return images
+            return list(
+                self.iter_pdf_pages(pdf_content, fmt, pages, progress, options)
+            )
         except Exception as e:
             raise Exception(f"Error converting PDF to image: {str(e)}")
 
     # pdf to docx
-    def convert_pdf_to_docx(self, pdf_content: bytes) -> bytes:
+    def convert_pdf_to_docx(self, pdf_content: Source) -> bytes:
+        """Rebuild a PDF's text, fonts and images as an editable Word document.
+
+        Pages are extracted on the render pool when there are enough of them, and
+        added to the document in page order as their batches come back.
+        """
         try:
-            pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-
-            doc = Document()
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                text = page.get_text()
-                doc.add_paragraph(text)
-                doc.add_page_break()
-            pdf_document.close()
-            docx_stream = io.BytesIO()
-            doc.save(docx_stream)
-            docx_stream.seek(0)
-            return docx_stream.read()
+            builder = DocxBuilder()
+            pdf_document = _open_pdf(pdf_content)
+            pages = list(range(len(pdf_document)))
+            if not self.renders_in_parallel(len(pages)):
+                try:
+                    for page_num in pages:
+                        with stage("extract"):
+                            layout = extract_page(pdf_document.load_page(page_num))
+                        with stage("write"):
+                            builder.add(layout)
+                    add_pages(len(pages))
+                finally:
+                    pdf_document.close()
+            else:
+                pdf_document.close()
+                batches = self._map_page_batches(
+                    _extract_pages, pdf_content, pages, "extract"
+                )
+                for layouts in batches:
+                    with stage("write"):
+                        for layout in layouts:
+                            builder.add(layout)
+            with stage("write"):
+                return builder.save()
         except Exception as e:
             raise Exception(f"Error converting PDF to DOCX: {str(e)}")
 
     # image to svg
     def convert_image_to_svg(
-        self, image_content: bytes, image_format: str = "PNG"
+        self,
+        image_content: Source,
+        image_format: str = "PNG",
+        trace: Optional[TraceOptions] = None,
     ) -> bytes:
         try:
-            image = Image.open(io.BytesIO(image_content))
+            image = DecodedImage(_read_source(image_content))
             width, height = image.size
 
-            # Convert image to base64 string
-            svg_buffer = io.BytesIO()
-
-            if image_format.upper() == "PNG":
-                image.save(svg_buffer, format="PNG")
-                mime_type = "image/png"
-            elif image_format.upper() in ["JPG", "JPEG"]:
-                if image.mode in ("RGBA", "LA", "P"):
-                    image = image.convert("RGB")
-                image.save(svg_buffer, format="JPEG")
+            # Convert image to base64 string; PNG and JPEG uploads are embedded as-is
+            if image_format.upper() in ["JPG", "JPEG"]:
+                embedded = image.encode("JPEG")
                 mime_type = "image/jpeg"
             else:
-                image.save(svg_buffer, format="PNG")
+                embedded = image.encode("PNG")
                 mime_type = "image/png"
 
-            img_base64 = base64.b64encode(svg_buffer.getvalue()).decode("utf-8")
+            with stage("encode"):
+                img_base64 = base64.b64encode(embedded).decode("utf-8")
 
             # create SVG elements
             svg = Element("svg")
@@ -268,123 +662,190 @@ class FileConverter:
             # convert SVG to bytes string with xml declaration
             svg_string = '<?xml version="1.0" encoding="UTF-8"?>\n'
             svg_string += tostring(svg, encoding="unicode")
+            embedded_svg = svg_string.encode("utf-8")
+
+            # traced into flat-coloured paths rather than wrapping the pixels,
+            # unless the paths come out larger than the embedded image
+            if trace is not None:
+                try:
+                    return trace_image(image.pixels(), trace, len(embedded_svg))
+                except TraceTooLargeError:
+                    pass
 
-            return svg_string.encode("utf-8")
+            return embedded_svg
 
         except Exception as e:
             raise Exception(f"Error converting {image_format} to SVG: {str(e)}")
 
     # png to svg
-    def convert_png_to_svg(self, png_content: bytes) -> bytes:
+    def convert_png_to_svg(self, png_content: Source) -> bytes:
         return self.convert_image_to_svg(png_content, image_format="PNG")
 
     # jpg to svg
-    def convert_jpg_to_svg(self, jpg_content: bytes) -> bytes:
+    def convert_jpg_to_svg(self, jpg_content: Source) -> bytes:
         return self.convert_image_to_svg(jpg_content, image_format="JPG")
 
     # svg to image
     def convert_svg_to_image(
         self,
-        svg_content: bytes,
+        svg_content: Source,
         output_format: str = "PNG",
         width: int = None,
         height: int = None,
     ) -> bytes:
         try:
-            if output_format.upper() == "PNG":
-                png_data = svg2png(
-                    bytestring=svg_content, output_width=width, output_height=height
-                )
-                return png_data
-            else:
-                png_data = svg2png(
-                    bytestring=svg_content, output_width=width, output_height=height
-                )
-                image = Image.open(io.BytesIO(png_data))
-
-                output_buffer = io.BytesIO()
-
-                if output_format.upper() in ["JPG", "JPEG"]:
-                    # Convert to RGB for JPEG (remove alpha channel)
-                    if image.mode in ("RGBA", "LA"):
-                        background = Image.new("RGB", image.size, (255, 255, 255))
-                        background.paste(
-                            image,
-                            mask=image.split()[-1] if image.mode == "RGBA" else None,
-                        )
-                        image = background
-                    image.save(output_buffer, format="JPEG", quality=95)
-                else:
-                    image.save(output_buffer, format=output_format.upper())
-
-                return output_buffer.getvalue()
+            svg_content = _read_source(svg_content)
+            fmt = normalize_format(output_format)
+            if fmt in SVG_TARGET_FORMATS:
+                return render_target(svg_content, SvgTarget(fmt, width, height))
+            # other formats are encoded from the rendered pixels
+            image = DecodedImage.from_raster(render_svg(svg_content, width, height))
+            return image.encode(fmt)
 
         except Exception as e:
             raise Exception(f"Error converting SVG to {output_format}: {str(e)}")
 
+    # svg to several sizes and formats
+    def convert_svg_to_renditions(
+        self, svg_content: Source, targets: list[SvgTarget]
+    ) -> list[bytes]:
+        "Render one SVG at every target, in order, parsing it once."
+        try:
+            return render_targets(_read_source(svg_content), targets)
+        except Exception as e:
+            raise Exception(f"Error rendering SVG: {str(e)}")
+
     # svg to png
     def convert_svg_to_png(
-        self, svg_content: bytes, width: int = None, height: int = None
+        self, svg_content: Source, width: int = None, height: int = None
     ) -> bytes:
         return self.convert_svg_to_image(svg_content, "PNG", width, height)
 
     # svg to jpg
     def convert_svg_to_jpg(
-        self, svg_content: bytes, width: int = None, height: int = None
+        self, svg_content: Source, width: int = None, height: int = None
     ) -> bytes:
         return self.convert_svg_to_image(svg_content, "JPG", width, height)
 
     # mp4 to mp3
-    def convert_mp4_to_mp3(self, mp4_content: bytes, ext: str) -> bytes:
+    def convert_mp4_to_mp3(self, mp4_content: Source, ext: str, progress=None) -> bytes:
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp_video:
-                temp_video.write(mp4_content)
-                temp_video_path = temp_video.name
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_audio:
-                temp_audio_path = temp_audio.name
-
-            video = VideoFileClip(temp_video_path)
-            video.audio.write_audiofile(temp_audio_path)
-            video.close()
-
-            with open(temp_audio_path, "rb") as f:
-                mp3_bytes = f.read()
+            return self._extract_audio(mp4_content, ext, "mp3", progress)
+        except Exception as e:
+            raise Exception(f"Error converting MP4 to MP3: {str(e)}")
 
-            os.remove(temp_video_path)
-            os.remove(temp_audio_path)
+    # video to audio
+    def convert_video_to_audio(
+        self,
+        video_content: Source,
+        ext: str,
+        audio_format: str = "mp3",
+        progress=None,
+        output_path: Optional[str] = None,
+    ) -> Union[bytes, str]:
+        try:
+            return self._extract_audio(
+                video_content, ext, audio_format, progress, output_path
+            )
+        except Exception as e:
+            raise Exception(
+                f"Error converting video to {audio_format.upper()}: {str(e)}"
+            )
 
-            return mp3_bytes
+    def audio_codec(self, media_content: Source, ext: str) -> Optional[str]:
+        "Codec of the first audio stream, e.g. ``aac`` or ``mp3``."
+        with _source_path(media_content, ext) as media_path:
+            return ffmpeg.probe(media_path).audio_codec
 
-        except Exception as e:
-            raise Exception(f"Error converting MP4 to MP3: {str(e)}")
+    def _extract_audio(
+        self,
+        video_content: Source,
+        ext: str,
+        audio_format: str,
+        progress=None,
+        output_path: Optional[str] = None,
+    ) -> Union[bytes, str]:
+        """Extract the first audio track; written to ``output_path`` when one is given.
+
+        The path is returned then, so large results never pass through memory.
+        """
+        if audio_format not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported audio format: {audio_format}")
+        muxer, native_codec, encode = AUDIO_FORMATS[audio_format]
+
+        with _source_path(video_content, ext) as video_path:
+            info = ffmpeg.probe(video_path)
+            if not info.has_audio:
+                raise ValueError("The video has no audio track")
+            # copy the audio stream as-is when it already is the requested codec
+            codec = ["-c:a", "copy"] if info.audio_codec == native_codec else encode
+            args = ["-i", video_path, "-map", "0:a:0", "-vn", "-sn", "-dn", *codec]
+            if muxer == "ipod":
+                # MP4 normally seeks back to write its index; fragments let it stream
+                args += ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+            output = output_path or "pipe:1"
+            result = ffmpeg.run([*args, "-f", muxer, output], info.duration, progress)
+            return output_path or result
 
 
 class FileCompressor:
 
-    def __init__(self, compression_percentage: int):
+    def __init__(
+        self,
+        compression_percentage: int,
+        video_preset: str = "veryfast",
+        max_height: Optional[int] = None,
+        max_fps: Optional[float] = None,
+        threads: int = 0,
+        target_bytes: Optional[int] = None,
+        min_ssim: Optional[float] = None,
+        allow_webp: bool = False,
+        linearize: bool = False,
+        pdf_workers: int = 1,
+    ):
+        self.compression_percentage = min(max(compression_percentage, 0), 100)
         self.quality = max(10, 100 - compression_percentage)
-
-    def compress_image(self, file: bytes) -> bytes:
-        with tempfile.NamedTemporaryFile(delete=False) as temp_in:
-            temp_in.write(file)
-            temp_in.flush()
-
-            img = Image.open(temp_in.name)
-            format = img.format
-
-            with tempfile.NamedTemporaryFile(
-                suffix=f".{format.lower()}", delete=False
-            ) as temp_out:
-                if format.upper() == "JPEG":
-                    img.save(temp_out.name, format, quality=self.quality)
-                elif format.upper() == "PNG":
-                    compress_level = int((100 - self.quality) / 10)
-                    img.save(temp_out.name, format, compress_level=compress_level)
-                else:
-                    img.save(temp_out.name, format)
-                temp_out.seek(0)
-                return temp_out.read()
+        # video encoding: x264 speed preset, optional downscale and frame rate cap,
+        # and encoder threads (0 lets ffmpeg pick)
+        self.video_preset = video_preset
+        self.max_height = max_height
+        self.max_fps = max_fps
+        self.threads = threads
+        # images: a byte budget and/or similarity floor to search encoder quality
+        # against instead of using the percentage, and whether WebP may be returned
+        self.target_bytes = target_bytes
+        self.min_ssim = min_ssim
+        self.allow_webp = allow_webp
+        # PDFs: write a linearized file, and threads for recompressing its images
+        self.linearize = linearize
+        self.pdf_workers = pdf_workers
+
+    def compress_image(self, file: Source) -> bytes:
+        data = _read_source(file)
+        image = DecodedImage(data)
+        if self.target_bytes is not None or self.min_ssim is not None:
+            return optimize_image(
+                image, self.target_bytes, self.min_ssim, self.allow_webp
+            )
+
+        candidates = [self._encode_image(image, image.format)]
+        if self.allow_webp and image.format in ADAPTIVE_FORMATS:
+            candidates.append(self._encode_image(image, "WEBP"))
+        output = min(candidates, key=len)
+        # re-encoding an already small file can grow it; keep the original then
+        return output if len(output) < len(data) else data
+
+    def _encode_image(self, image: DecodedImage, format: str) -> bytes:
+        if format == "JPEG":
+            return image.encode(
+                format, quality=self.quality, optimize=True, progressive=True
+            )
+        elif format == "PNG":
+            compress_level = int((100 - self.quality) / 10)
+            return image.encode(format, compress_level=compress_level)
+        elif format == "WEBP":
+            return image.encode(format, quality=self.quality, method=4)
+        return image.data
 
     # def compress_audio(self, file: bytes) -> bytes:
     #     with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_in:
@@ -398,59 +859,122 @@ class FileCompressor:
     #             temp_out.seek(0)
     #             return temp_out.read()
 
-    def compress_video(self, file: bytes, ext: str) -> bytes:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp_in:
-            temp_in.write(file)
-            temp_in.flush()
-
-            video = VideoFileClip(temp_in.name)
-            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as temp_out:
-                video.write_videofile(
-                    temp_out.name,
-                    bitrate=f"{self.quality*1000}k",
-                    audio_codec="aac",
-                    logger=None,
-                )
-                return open(temp_out.name, "rb").read()
-
-    def compress_pdf(self, file: bytes) -> bytes:
-        temp_in_path = None
-        temp_out_path = None
-
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_in:
-                temp_in.write(file)
-                temp_in_path = temp_in.name
-
-            temp_out_fd, temp_out_path = tempfile.mkstemp(suffix=".pdf")
-            os.close(temp_out_fd)
-
-            with pikepdf.open(temp_in_path) as pdf:
-                pdf.save(
-                    temp_out_path,
-                    compress_streams=True,
-                    object_stream_mode=pikepdf.ObjectStreamMode.generate,
+    def compress_video(
+        self,
+        file: Source,
+        ext: str,
+        progress=None,
+        output_path: Optional[str] = None,
+    ) -> Union[bytes, str]:
+        """Re-encode a video; written to ``output_path`` when one is given.
+
+        The path is returned then, so large results never pass through memory.
+        """
+        container = VIDEO_CONTAINERS.get(ext, VIDEO_CONTAINERS[".mp4"])
+        with _source_path(file, ext) as temp_in_path:
+            info = ffmpeg.probe(temp_in_path)
+            if not info.has_video:
+                raise ValueError("The file has no video stream")
+
+            filters = []
+            if self.max_height and info.height and info.height > self.max_height:
+                # -2 keeps the aspect ratio with an even width, which x264 requires
+                filters.append(f"scale=-2:{self.max_height}")
+            if self.max_fps and info.fps and info.fps > self.max_fps:
+                filters.append(f"fps={self.max_fps:g}")
+
+            args = ["-i", temp_in_path, "-map", "0:v:0", "-map", "0:a:0?"]
+            args += self._video_codec_args(container["video"])
+            if filters:
+                args += ["-vf", ",".join(filters)]
+            args += ["-threads", str(self.threads)]
+            args += self._audio_codec_args(container, info.audio_codec)
+            if container["muxer"] in ("mp4", "mov"):
+                # move the index to the front so players can start before the download ends
+                args += ["-movflags", "+faststart"]
+
+            temp_out_path = output_path
+            if temp_out_path is None:
+                with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as temp_out:
+                    temp_out_path = temp_out.name
+            try:
+                ffmpeg.run(
+                    [*args, "-f", container["muxer"], temp_out_path],
+                    info.duration,
+                    progress,
                 )
-
-            with open(temp_out_path, "rb") as f:
-                compressed_data = f.read()
-
-            return compressed_data
-
-        finally:
-            if temp_in_path and os.path.exists(temp_in_path):
-                try:
-                    os.unlink(temp_in_path)
-                except PermissionError:
-                    pass
-
-            if temp_out_path and os.path.exists(temp_out_path):
-                try:
+                grew = os.path.getsize(temp_out_path) >= os.path.getsize(temp_in_path)
+                if grew and not filters:
+                    # re-encoding an already efficient file can grow it; keep the
+                    # original, unless it was asked to be made smaller or slower
+                    if output_path is not None:
+                        shutil.copyfile(temp_in_path, output_path)
+                        return output_path
+                    with open(temp_in_path, "rb") as f:
+                        return f.read()
+                if output_path is not None:
+                    return output_path
+                with open(temp_out_path, "rb") as f:
+                    return f.read()
+            finally:
+                if output_path is None:
                     os.unlink(temp_out_path)
-                except PermissionError:
-                    pass
 
-    def compress(self, file: bytes, mime_type: str, filename: str) -> bytes:
+    def _audio_codec_args(
+        self, container: dict, source_codec: Optional[str]
+    ) -> list[str]:
+        if source_codec in container["copy_audio"]:
+            # audio is already compressed; re-encoding it costs quality for little gain
+            return ["-c:a", "copy"]
+        encoder, kbps = container["audio"]
+        # 0% keeps the encoder's usual bitrate; 100% takes 60% off it
+        kbps = round(kbps * (1 - 0.006 * self.compression_percentage))
+        return ["-c:a", encoder, "-b:a", f"{max(kbps, MIN_AUDIO_KBPS)}k"]
+
+    def _video_codec_args(self, codec: str) -> list[str]:
+        percent = self.compression_percentage
+        if codec == "libx264":
+            # CRF 18 is visually lossless; every 6 steps roughly halves the bitrate
+            crf = round(18 + percent * 0.2)
+            return [
+                "-c:v", "libx264", "-preset", self.video_preset,
+                "-crf", str(crf), "-pix_fmt", "yuv420p",
+            ]
+        if codec == "libvpx-vp9":
+            crf = round(24 + percent * 0.3)
+            # the x264 preset names map onto libvpx's speed levels
+            cpu_used = {"ultrafast": 8, "superfast": 7, "veryfast": 6, "faster": 5,
+                        "fast": 4, "medium": 3, "slow": 2, "slower": 1, "veryslow": 0}
+            speed = cpu_used.get(self.video_preset, 4)
+            return [
+                "-c:v", "libvpx-vp9", "-crf", str(crf), "-b:v", "0",
+                # libvpx only reaches its fastest speeds in realtime mode
+                "-deadline", "realtime" if speed >= 5 else "good",
+                "-cpu-used", str(speed), "-row-mt", "1",
+            ]
+        # older codecs take a fixed quantizer from 2 (best) to 31 (worst)
+        return ["-c:v", codec, "-q:v", str(round(2 + percent * 0.29))]
+
+    def compress_pdf(self, file: Source) -> bytes:
+        data = _read_source(file)
+        options = PdfOptimizeOptions.from_percent(
+            self.compression_percentage, self.linearize
+        )
+        output = optimize_pdf(data, options, self.pdf_workers)
+        # a linearized file was asked for even if it comes out a little larger
+        if options.linearize or len(output) < len(data):
+            return output
+        return data
+
+    def compress(
+        self,
+        file: Source,
+        mime_type: str,
+        filename: str,
+        progress=None,
+        output_path: Optional[str] = None,
+    ) -> Union[bytes, str]:
+        "Compress by type; only video is written to ``output_path``, when one is given."
         if mime_type.startswith("image/"):
             return self.compress_image(file)
         elif mime_type.startswith("audio/"):
@@ -471,7 +995,9 @@ class FileCompressor:
 
             if not file_ext in allowed_extensions:
                 raise ValueError(400, "Unsupported video format")
-            return self.compress_video(file, file_ext)
+            return self.compress_video(
+                file, file_ext, progress=progress, output_path=output_path
+            )
         elif mime_type == "application/pdf":
             return self.compress_pdf(file)
         else:
@@ -0,0 +1,564 @@
+import io  # for reading embedded images and writing the PDF in memory
+import os  # for locating font files
+import time  # for the per-document deadline
+from typing import Callable, Optional
+from xml.sax.saxutils import escape  # for run text inside reportlab's markup
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.table import Table as DocxTable
+from docx.text.hyperlink import Hyperlink
+from docx.text.paragraph import Paragraph as DocxParagraph
+from reportlab.lib.fonts import tt2ps
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import (
+    Image,
+    PageBreak,
+    Paragraph,
+    SimpleDocTemplate,
+    Spacer,
+    Table,
+    TableStyle,
+)
+
+from app.services.metrics import add_pages, stage
+
+# Word's defaults for documents that leave them unset
+DEFAULT_FONT_SIZE = 11.0
+LINE_HEIGHT = 1.15
+LIST_INDENT = 18.0
+DEFAULT_MARGIN = 72.0
+
+# points per EMU, the unit of drawing sizes
+EMU_PER_POINT = 12700
+
+# reportlab lays out what is left of a paragraph or table again on every page it
+# spills onto, so longer ones are laid out in parts of about this size
+PARAGRAPH_CHUNK_CHARS = 8000
+TABLE_CHUNK_ROWS = 100
+
+_ALIGNMENTS = {
+    WD_ALIGN_PARAGRAPH.LEFT: TA_LEFT,
+    WD_ALIGN_PARAGRAPH.CENTER: TA_CENTER,
+    WD_ALIGN_PARAGRAPH.RIGHT: TA_RIGHT,
+    WD_ALIGN_PARAGRAPH.JUSTIFY: TA_JUSTIFY,
+}
+
+# font families are drawn with the closest of three faces
+_SERIF = ("times", "georgia", "cambria", "garamond", "palatino", "book", "serif")
+_MONO = ("courier", "consolas", "mono", "menlo", "code")
+
+# built-in PDF fonts, which only cover Latin-1, and TrueType faces that replace
+# them when their files are found: (regular, bold, italic, bold italic)
+_STANDARD_FONTS = {
+    "sans": (
+        "Helvetica",
+        "Helvetica-Bold",
+        "Helvetica-Oblique",
+        "Helvetica-BoldOblique",
+    ),
+    "serif": ("Times-Roman", "Times-Bold", "Times-Italic", "Times-BoldItalic"),
+    "mono": ("Courier", "Courier-Bold", "Courier-Oblique", "Courier-BoldOblique"),
+}
+_TRUETYPE_FONTS = {
+    "sans": ("DejaVuSans", "-Bold", "-Oblique", "-BoldOblique"),
+    "serif": ("DejaVuSerif", "-Bold", "-Italic", "-BoldItalic"),
+    "mono": ("DejaVuSansMono", "-Bold", "-Oblique", "-BoldOblique"),
+}
+
+# font directory -> the family registered for each face; fonts are registered
+# once per process
+_registered: dict[Optional[str], dict[str, str]] = {}
+
+
+def register_fonts(font_dir: Optional[str]) -> dict[str, str]:
+    """Register the TrueType faces found in ``font_dir`` with reportlab.
+
+    Returns the font family to draw each face with. Faces whose files are missing
+    fall back to the built-in PDF fonts.
+    """
+    if font_dir in _registered:
+        return _registered[font_dir]
+    families = {}
+    for face, (family, *suffixes) in _TRUETYPE_FONTS.items():
+        regular = os.path.join(font_dir, f"{family}.ttf") if font_dir else ""
+        if not os.path.isfile(regular):
+            families[face] = _STANDARD_FONTS[face][0]
+            continue
+        names = [family]
+        pdfmetrics.registerFont(TTFont(family, regular))
+        for suffix in suffixes:
+            path = os.path.join(font_dir, f"{family}{suffix}.ttf")
+            if os.path.isfile(path):
+                pdfmetrics.registerFont(TTFont(family + suffix, path))
+                names.append(family + suffix)
+            else:
+                names.append(family)
+        pdfmetrics.registerFontFamily(
+            family, normal=names[0], bold=names[1], italic=names[2], boldItalic=names[3]
+        )
+        families[face] = family
+    _registered[font_dir] = families
+    return families
+
+
+def _face(name: Optional[str]) -> str:
+    lowered = (name or "").lower()
+    if any(hint in lowered for hint in _MONO):
+        return "mono"
+    if any(hint in lowered for hint in _SERIF):
+        return "serif"
+    return "sans"
+
+
+def _inherited(style, attr: str):
+    "A font attribute from a style or the styles it is based on."
+    while style is not None:
+        value = getattr(style.font, attr)
+        if value is not None:
+            return value
+        style = style.base_style
+    return None
+
+
+def _inherited_format(style, attr: str):
+    "A paragraph format attribute from a style or the styles it is based on."
+    while style is not None:
+        value = getattr(style.paragraph_format, attr)
+        if value is not None:
+            return value
+        style = style.base_style
+    return None
+
+
+class _TimedDocTemplate(SimpleDocTemplate):
+    "Checks a deadline before laying out each flowable, or what a page left of one."
+
+    check_deadline: Callable[[], None] = staticmethod(lambda: None)
+
+    def handle_flowable(self, flowables):
+        self.check_deadline()
+        super().handle_flowable(flowables)
+
+
+def _pieces(markup: str, limit: int) -> list[str]:
+    "Split escaped run text at spaces into pieces of about ``limit`` characters."
+    pieces = []
+    while len(markup) > limit:
+        cut = markup.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = markup.find(" ", limit)
+        if cut <= 0:
+            break
+        pieces.append(markup[: cut + 1])
+        markup = markup[cut + 1 :]
+    pieces.append(markup)
+    return pieces
+
+
+class DocxPdfRenderer:
+    """Lays a Word document out as a PDF with reportlab, without an office suite.
+
+    Paragraphs keep their style's and runs' fonts, sizes, bold, italics,
+    underlining, colours, alignment, indents and spacing; lists get bullets or
+    numbers, and tables and inline images are drawn at their sizes. Page size and
+    margins come from the first section. Headers, footers, floating shapes and
+    fields are not drawn.
+
+    Rendering stops with ``TimeoutError`` once it has taken ``timeout`` seconds.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, font_dir: Optional[str] = None):
+        self.timeout = timeout
+        self.fonts = register_fonts(font_dir)
+        self._deadline: Optional[float] = None
+
+    def _check_deadline(self, *_) -> None:
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise TimeoutError(f"Rendering took longer than {self.timeout:g}s")
+
+    def render(self, data: bytes) -> bytes:
+        if self.timeout:
+            self._deadline = time.monotonic() + self.timeout
+        self.document = Document(io.BytesIO(data))
+        self._numbering = self._numbering_formats()
+        self._counters: dict[tuple[str, int], int] = {}
+        self._default_size = self._document_font_size()
+        self._styles: dict = {}
+
+        section = self.document.sections[0]
+
+        def points(length, default: float) -> float:
+            return length.pt if length is not None else default
+
+        output = io.BytesIO()
+        template = _TimedDocTemplate(
+            output,
+            pagesize=(
+                points(section.page_width, letter[0]),
+                points(section.page_height, letter[1]),
+            ),
+            leftMargin=points(section.left_margin, DEFAULT_MARGIN),
+            rightMargin=points(section.right_margin, DEFAULT_MARGIN),
+            topMargin=points(section.top_margin, DEFAULT_MARGIN),
+            bottomMargin=points(section.bottom_margin, DEFAULT_MARGIN),
+        )
+        template.check_deadline = self._check_deadline
+        self._frame_width = template.width
+        with stage("decode"):
+            story = self._blocks(self.document.element.body, self._frame_width)
+        with stage("render"):
+            # the template checks the deadline at every flowable, so long layouts
+            # stop on time too
+            template.build(story or [Spacer(1, 1)])
+        add_pages(template.page)
+        return output.getvalue()
+
+    def _style(self, style_id: Optional[str], style_type):
+        "A style by id, or the default of its type; python-docx searches every time."
+        key = (style_id, style_type)
+        if key not in self._styles:
+            self._styles[key] = self.document.part.get_style(style_id, style_type)
+        return self._styles[key]
+
+    # document-wide settings
+    def _document_font_size(self) -> float:
+        defaults = self.document.styles.element.find(qn("w:docDefaults"))
+        size = None
+        if defaults is not None:
+            size = defaults.find(f".//{qn('w:rPr')}/{qn('w:sz')}")
+        if size is not None:
+            return int(size.get(qn("w:val"))) / 2
+        return DEFAULT_FONT_SIZE
+
+    def _numbering_formats(self) -> dict[tuple[str, int], str]:
+        "Number format of each list level, by numbering id and level."
+        try:
+            numbering = self.document.part.numbering_part.element
+        except (KeyError, NotImplementedError):
+            return {}
+        abstract = {}
+        for definition in numbering.findall(qn("w:abstractNum")):
+            levels = {}
+            for level in definition.findall(qn("w:lvl")):
+                fmt = level.find(qn("w:numFmt"))
+                levels[int(level.get(qn("w:ilvl")))] = (
+                    fmt.get(qn("w:val")) if fmt is not None else "bullet"
+                )
+            abstract[definition.get(qn("w:abstractNumId"))] = levels
+        formats = {}
+        for num in numbering.findall(qn("w:num")):
+            ref = num.find(qn("w:abstractNumId"))
+            if ref is None:
+                continue
+            for level, fmt in abstract.get(ref.get(qn("w:val")), {}).items():
+                formats[(num.get(qn("w:numId")), level)] = fmt
+        return formats
+
+    # block content
+    def _blocks(self, container, width: float) -> list:
+        "Flowables for the paragraphs and tables directly inside a body or cell."
+        story = []
+        parent = self.document.part
+        for child in container.iterchildren():
+            self._check_deadline()
+            if child.tag == qn("w:p"):
+                story.extend(self._paragraph(DocxParagraph(child, parent), width))
+            elif child.tag == qn("w:tbl"):
+                story.extend(self._table(DocxTable(child, parent), width))
+        return story
+
+    def _list_label(self, paragraph: DocxParagraph) -> Optional[str]:
+        numbering = paragraph._p.pPr.numPr if paragraph._p.pPr is not None else None
+        style = self._style(paragraph._p.style, WD_STYLE_TYPE.PARAGRAPH)
+        style_name = style.name if style is not None else ""
+        if numbering is not None and numbering.numId is not None:
+            num_id = str(numbering.numId.val)
+            level = numbering.ilvl.val if numbering.ilvl is not None else 0
+            fmt = self._numbering.get((num_id, level), "bullet")
+        elif style_name.startswith("List Bullet"):
+            num_id, level, fmt = style_name, 0, "bullet"
+        elif style_name.startswith("List Number"):
+            num_id, level, fmt = style_name, 0, "decimal"
+        else:
+            return None
+        if fmt in ("bullet", "none"):
+            return "•" if fmt == "bullet" else ""
+        key = (num_id, level)
+        self._counters[key] = self._counters.get(key, 0) + 1
+        # a deeper level starts over under each new item above it
+        for other in list(self._counters):
+            if other[0] == num_id and other[1] > level:
+                del self._counters[other]
+        number = self._counters[key]
+        if fmt == "lowerLetter":
+            return f"{chr(ord('a') + (number - 1) % 26)}."
+        if fmt == "upperLetter":
+            return f"{chr(ord('A') + (number - 1) % 26)}."
+        return f"{number}."
+
+    def _paragraph(self, paragraph: DocxParagraph, width: float) -> list:
+        style = self._style(paragraph._p.style, WD_STYLE_TYPE.PARAGRAPH)
+        fmt = paragraph.paragraph_format
+        story = []
+        if fmt.page_break_before or _inherited_format(style, "page_break_before"):
+            story.append(PageBreak())
+
+        # the label goes on the paragraph's first line of text
+        label = self._list_label(paragraph)
+        parts: list[str] = []
+        sizes: list[float] = []
+        for item in paragraph.iter_inner_content():
+            self._check_deadline()
+            runs = item.runs if isinstance(item, Hyperlink) else [item]
+            for run in runs:
+                for piece in self._run(run, paragraph, width, sizes):
+                    if isinstance(piece, str):
+                        parts.append(piece)
+                    else:
+                        # page breaks and images end the text so far
+                        text = self._text(paragraph, parts, sizes, label)
+                        if text:
+                            story.extend(text)
+                            label = None
+                        parts, sizes = [], []
+                        story.append(piece)
+        text = self._text(paragraph, parts, sizes, label)
+        if text:
+            story.extend(text)
+        elif not story:
+            # an empty paragraph still takes up a line
+            size = self._style_size(style)
+            story.append(Spacer(1, size * LINE_HEIGHT))
+        return story
+
+    def _text(
+        self,
+        paragraph: DocxParagraph,
+        parts: list[str],
+        sizes: list[float],
+        label: Optional[str],
+    ) -> list:
+        if not "".join(parts).strip():
+            return []
+        style = self._style(paragraph._p.style, WD_STYLE_TYPE.PARAGRAPH)
+        size = max(sizes) if sizes else self._style_size(style)
+        fmt = paragraph.paragraph_format
+
+        def length(attr: str) -> float:
+            value = getattr(fmt, attr)
+            if value is None:
+                value = _inherited_format(style, attr)
+            return value.pt if value is not None else 0.0
+
+        spacing = fmt.line_spacing or _inherited_format(style, "line_spacing")
+        if spacing is None:
+            leading = size * LINE_HEIGHT
+        elif isinstance(spacing, float):
+            leading = size * LINE_HEIGHT * spacing
+        else:
+            leading = spacing.pt
+        alignment = paragraph.alignment
+        if alignment is None:
+            alignment = _inherited_format(style, "alignment")
+
+        left = length("left_indent")
+        if label is not None and left == 0:
+            left = LIST_INDENT
+        paragraph_style = ParagraphStyle(
+            "docx",
+            fontName=self.fonts[_face(_inherited(style, "name"))],
+            fontSize=size,
+            leading=leading,
+            alignment=_ALIGNMENTS.get(alignment, TA_LEFT),
+            leftIndent=left,
+            rightIndent=length("right_indent"),
+            firstLineIndent=length("first_line_indent"),
+            spaceBefore=length("space_before"),
+            spaceAfter=length("space_after"),
+            bulletIndent=max(left - LIST_INDENT, 0),
+            bulletFontName=self.fonts["sans"],
+            bulletFontSize=size,
+        )
+        chunks = self._chunks(parts)
+        if len(chunks) == 1:
+            return [Paragraph(chunks[0], paragraph_style, bulletText=label or None)]
+        # the parts read as one paragraph: spacing and the first-line indent only
+        # apply at its ends
+        first = ParagraphStyle("docx-first", paragraph_style, spaceAfter=0)
+        middle = ParagraphStyle("docx-middle", first, spaceBefore=0, firstLineIndent=0)
+        last = ParagraphStyle(
+            "docx-last", paragraph_style, spaceBefore=0, firstLineIndent=0
+        )
+        flowables = [Paragraph(chunks[0], first, bulletText=label or None)]
+        flowables += [Paragraph(chunk, middle) for chunk in chunks[1:-1]]
+        flowables.append(Paragraph(chunks[-1], last))
+        return flowables
+
+    @staticmethod
+    def _chunks(parts: list[str]) -> list[str]:
+        "A paragraph's markup in pieces of about ``PARAGRAPH_CHUNK_CHARS``."
+        chunks, current, size = [], [], 0
+        for part in parts:
+            if current and size + len(part) > PARAGRAPH_CHUNK_CHARS:
+                chunks.append("".join(current))
+                current, size = [], 0
+            current.append(part)
+            size += len(part)
+        chunks.append("".join(current))
+        return chunks
+
+    def _style_size(self, style) -> float:
+        size = _inherited(style, "size")
+        return size.pt if size is not None else self._default_size
+
+    def _run(self, run, paragraph: DocxParagraph, width: float, sizes: list[float]):
+        "Markup for a run's text, and flowables for its page breaks and images."
+        font = run.font
+        styles = [
+            self._style(run._r.style, WD_STYLE_TYPE.CHARACTER),
+            self._style(paragraph._p.style, WD_STYLE_TYPE.PARAGRAPH),
+        ]
+
+        def attr(name: str):
+            # the run's own formatting, then its character style, then the
+            # paragraph's style
+            value = getattr(font, name)
+            for style in styles:
+                if value is not None:
+                    return value
+                value = _inherited(style, name)
+            return value
+
+        size_value = attr("size")
+        size = size_value.pt if size_value is not None else self._default_size
+        # the face is picked here; reportlab's <b> and <i> do not apply inside a
+        # <font> that names one
+        name = tt2ps(
+            self.fonts[_face(attr("name"))], bool(attr("bold")), bool(attr("italic"))
+        )
+        opening, closing = [f'<font name="{name}" size="{size:g}"'], []
+        color = font.color.rgb if font.color.type is not None else None
+        for style in styles:
+            while color is None and style is not None:
+                if style.font.color.type is not None:
+                    color = style.font.color.rgb
+                style = style.base_style
+        if color is not None:
+            opening[0] += f' color="#{color}"'
+        opening[0] += ">"
+        closing.append("</font>")
+        for tag, on in (
+            ("u", attr("underline")),
+            ("strike", attr("strike")),
+            ("super", attr("superscript")),
+            ("sub", attr("subscript")),
+        ):
+            if on:
+                opening.append(f"<{tag}>")
+                closing.insert(0, f"</{tag}>")
+
+        text: list[str] = []
+
+        def flush():
+            if text:
+                sizes.append(size)
+                for piece in _pieces("".join(text), PARAGRAPH_CHUNK_CHARS):
+                    yield "".join(opening) + piece + "".join(closing)
+                text.clear()
+
+        for child in run._r.iterchildren():
+            if child.tag == qn("w:t"):
+                text.append(escape(child.text or ""))
+            elif child.tag == qn("w:tab"):
+                text.append("&nbsp;" * 4)
+            elif child.tag in (qn("w:br"), qn("w:cr")):
+                if child.get(qn("w:type")) == "page":
+                    yield from flush()
+                    yield PageBreak()
+                else:
+                    text.append("<br/>")
+            elif child.tag == qn("w:drawing"):
+                image = self._image(child, width)
+                if image is not None:
+                    yield from flush()
+                    yield image
+        yield from flush()
+
+    def _image(self, drawing, width: float) -> Optional[Image]:
+        blip = drawing.find(f".//{qn('a:blip')}")
+        extent = drawing.find(f".//{qn('wp:extent')}")
+        if blip is None or extent is None:
+            return None
+        part = self.document.part.related_parts.get(blip.get(qn("r:embed")))
+        if part is None:
+            return None
+        data = part.blob
+        try:
+            # EMF and WMF pictures have no reportlab reader
+            ImageReader(io.BytesIO(data)).getSize()
+        except Exception:
+            return None
+        image_width = int(extent.get("cx")) / EMU_PER_POINT
+        image_height = int(extent.get("cy")) / EMU_PER_POINT
+        if image_width <= 0 or image_height <= 0:
+            return None
+        scale = min(1.0, width / image_width)
+        return Image(
+            io.BytesIO(data), width=image_width * scale, height=image_height * scale
+        )
+
+    def _table(self, table: DocxTable, width: float) -> list[Table]:
+        grid = [column.width for column in table.columns]
+        if grid and all(w is not None for w in grid):
+            widths = [w.pt for w in grid]
+            scale = min(1.0, width / sum(widths)) if sum(widths) else 1.0
+            widths = [w * scale for w in widths]
+        else:
+            widths = [width / max(len(table.columns), 1)] * len(table.columns)
+
+        rows, spans = [], []
+        for row_index, row in enumerate(table.rows):
+            self._check_deadline()
+            cells = []
+            for tc in row._tr.tc_lst:
+                column = len(cells)
+                span = tc.grid_span
+                cell_width = sum(widths[column : column + span]) or width
+                cells.append(self._blocks(tc, cell_width - 6) or "")
+                cells.extend([""] * (span - 1))
+                if span > 1:
+                    spans.append((row_index, column, column + span - 1))
+            cells.extend([""] * (len(widths) - len(cells)))
+            rows.append(cells[: len(widths)])
+
+        commands = [
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 3),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 3),
+        ]
+        borders = table._tbl.tblPr.find(qn("w:tblBorders"))
+        style_name = table.style.name if table.style is not None else ""
+        if borders is not None or "Grid" in style_name:
+            commands.append(("GRID", (0, 0), (-1, -1), 0.5, "#000000"))
+        rows = rows or [[""]]
+        # the parts stack without a gap, so they read as the one table
+        tables = []
+        for start in range(0, len(rows), TABLE_CHUNK_ROWS):
+            chunk = rows[start : start + TABLE_CHUNK_ROWS]
+            chunk_commands = commands + [
+                ("SPAN", (first, row - start), (last, row - start))
+                for row, first, last in spans
+                if start <= row < start + len(chunk)
+            ]
+            tables.append(
+                Table(chunk, colWidths=widths or None, style=TableStyle(chunk_commands))
+            )
+        return tables
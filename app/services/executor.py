@@ -0,0 +1,166 @@
+import asyncio  # for awaiting pool futures from async route handlers
+import functools  # for binding call arguments before submitting to a pool
+import multiprocessing  # for choosing the worker start method
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+PROCESS = "process"
+THREAD = "thread"
+
+
+class ExecutorSaturatedError(Exception):
+    "Raised when a pool already has as many calls running and queued as it accepts."
+
+    def __init__(self, kind: str, retry_after: int):
+        super().__init__(f"The {kind} pool is saturated, retry in {retry_after}s")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class ConversionExecutor:
+    """Runs blocking converter calls off the event loop.
+
+    CPU-bound work goes to a process pool so a large render cannot stall other
+    requests; the thread pool is for calls that mostly wait on I/O or subprocesses.
+    Each pool accepts at most ``workers + max_queue`` calls at once and rejects
+    the rest with ``ExecutorSaturatedError``, unless the caller asks to wait for
+    a call to finish instead.
+    """
+
+    def __init__(
+        self,
+        process_workers: int,
+        thread_workers: int,
+        max_queue: int,
+        retry_after: int = 5,
+        start_method: str = "spawn",
+        max_tasks_per_child: Optional[int] = None,
+    ):
+        self.process_workers = process_workers
+        self.thread_workers = thread_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.start_method = start_method
+        self.max_tasks_per_child = max_tasks_per_child
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._in_flight = {PROCESS: 0, THREAD: 0}
+        self._finished = {PROCESS: 0, THREAD: 0}
+        self._rejected = {PROCESS: 0, THREAD: 0}
+        self._waiting = {PROCESS: 0, THREAD: 0}
+        # created on first use, inside the event loop
+        self._freed: dict[str, Optional[asyncio.Condition]] = {
+            PROCESS: None,
+            THREAD: None,
+        }
+
+    def _capacity(self, kind: str) -> int:
+        workers = self.process_workers if kind == PROCESS else self.thread_workers
+        return workers + self.max_queue
+
+    def _pool(self, kind: str):
+        # pools are created lazily so importing the app does not spawn workers
+        if kind == PROCESS:
+            if self._process_pool is None:
+                kwargs = {}
+                if self.max_tasks_per_child and self.start_method != "fork":
+                    kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    **kwargs,
+                )
+            return self._process_pool
+        if kind == THREAD:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self.thread_workers,
+                    thread_name_prefix="converter",
+                )
+            return self._thread_pool
+        raise ValueError(f"Unknown executor kind: {kind}")
+
+    def _condition(self, kind: str) -> asyncio.Condition:
+        if self._freed[kind] is None:
+            self._freed[kind] = asyncio.Condition()
+        return self._freed[kind]
+
+    async def _wait_for_capacity(self, kind: str) -> None:
+        freed = self._condition(kind)
+        self._waiting[kind] += 1
+        try:
+            async with freed:
+                await freed.wait_for(
+                    lambda: self._in_flight[kind] < self._capacity(kind)
+                )
+                self._in_flight[kind] += 1
+        finally:
+            self._waiting[kind] -= 1
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        kind: str = PROCESS,
+        wait: bool = False,
+        **kwargs,
+    ) -> Any:
+        """Run ``fn(*args, **kwargs)`` on the ``kind`` pool and return its result.
+
+        A saturated pool raises ``ExecutorSaturatedError``, or with ``wait`` holds
+        the call back until another one finishes.
+        """
+        pool = self._pool(kind)
+        if self._in_flight[kind] < self._capacity(kind):
+            self._in_flight[kind] += 1
+        elif wait:
+            await self._wait_for_capacity(kind)
+        else:
+            self._rejected[kind] += 1
+            raise ExecutorSaturatedError(kind, self.retry_after)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                pool, functools.partial(fn, *args, **kwargs)
+            )
+        except BrokenProcessPool:
+            # a worker died (e.g. OOM killed); start a fresh pool for the next call
+            self._reset_process_pool()
+            raise Exception("Conversion worker crashed")
+        finally:
+            self._in_flight[kind] -= 1
+            self._finished[kind] += 1
+            if self._waiting[kind]:
+                freed = self._condition(kind)
+                async with freed:
+                    freed.notify_all()
+
+    def _reset_process_pool(self) -> None:
+        pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=True, cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=True, cancel_futures=True)
+            self._thread_pool = None
+
+    def stats(self) -> dict:
+        return {
+            kind: {
+                "workers": (
+                    self.process_workers if kind == PROCESS else self.thread_workers
+                ),
+                "capacity": self._capacity(kind),
+                "in_flight": self._in_flight[kind],
+                "finished": self._finished[kind],
+                "rejected": self._rejected[kind],
+                "waiting": self._waiting[kind],
+            }
+            for kind in (PROCESS, THREAD)
+        }
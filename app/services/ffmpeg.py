@@ -0,0 +1,132 @@
+import re  # for parsing ffmpeg's stream descriptions and progress lines
+import subprocess  # for running the ffmpeg binary
+import threading  # for reading progress while the output is piped
+from collections import deque  # for keeping the tail of ffmpeg's error output
+from typing import Callable, Optional
+
+import imageio_ffmpeg  # ships a static ffmpeg build, so no system install is needed
+
+from app.models.media import MediaInfo
+from app.services.metrics import stage
+
+_DURATION = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+_STREAM = re.compile(r"Stream #\d+:\d+.*?: (Audio|Video): (\w+)")
+_SIZE = re.compile(r", (\d{2,5})x(\d{2,5})")
+_FPS = re.compile(r", (\d+(?:\.\d+)?) fps")
+_PROGRESS = re.compile(r"^(\w+)=(.*)$")
+
+
+class FFmpegError(Exception):
+    "Raised when ffmpeg exits with an error; carries the tail of its error output."
+
+
+def ffmpeg_exe() -> str:
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def probe(path: str) -> MediaInfo:
+    "Read the duration and first audio and video streams of a media file."
+    # the bundled build has no ffprobe; `ffmpeg -i` without an output prints the same
+    # stream summary and exits with an error we can ignore
+    with stage("probe"):
+        result = subprocess.run(
+            [ffmpeg_exe(), "-hide_banner", "-nostdin", "-i", path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+        )
+    info = MediaInfo()
+    for line in result.stderr.splitlines():
+        duration = _DURATION.search(line)
+        if duration and info.duration is None:
+            hours, minutes, seconds = duration.groups()
+            info.duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+            continue
+        stream = _STREAM.search(line)
+        if not stream:
+            continue
+        kind, codec = stream.groups()
+        if kind == "Audio" and info.audio_codec is None:
+            info.audio_codec = codec
+        elif kind == "Video" and info.video_codec is None:
+            info.video_codec = codec
+            size = _SIZE.search(line)
+            if size:
+                info.width, info.height = int(size.group(1)), int(size.group(2))
+            fps = _FPS.search(line)
+            if fps:
+                info.fps = float(fps.group(1))
+    if info.duration is None and not info.has_audio and not info.has_video:
+        raise FFmpegError(_tail(result.stderr.splitlines()) or "Unreadable media file")
+    return info
+
+
+def run(
+    args: list[str],
+    duration: Optional[float] = None,
+    progress: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> bytes:
+    """Run ffmpeg with ``args`` and return whatever it writes to stdout.
+
+    Outputs named ``pipe:1`` come back as bytes without touching the disk. Progress
+    is read from ffmpeg's ``-progress`` report and passed on as milliseconds of
+    output written out of the input's total ``duration``.
+    """
+    command = [
+        ffmpeg_exe(),
+        "-hide_banner",
+        "-nostdin",
+        "-loglevel",
+        "error",
+        "-nostats",
+        "-progress",
+        "pipe:2",
+        "-y",
+        *args,
+    ]
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    errors: deque = deque(maxlen=20)
+    total_ms = int(duration * 1000) if duration else None
+
+    def read_progress():
+        for raw in process.stderr:
+            line = raw.decode("utf-8", "replace").strip()
+            match = _PROGRESS.match(line)
+            if not match:
+                if line:
+                    errors.append(line)
+                continue
+            key, value = match.groups()
+            if key == "out_time_us" and progress and value.isdigit():
+                done_ms = int(value) // 1000
+                progress(min(done_ms, total_ms) if total_ms else done_ms, total_ms)
+
+    reader = threading.Thread(target=read_progress, name="ffmpeg-progress", daemon=True)
+    reader.start()
+    try:
+        with stage("ffmpeg"):
+            output = process.stdout.read()
+            process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        reader.join()
+        process.stdout.close()
+        process.stderr.close()
+
+    if process.returncode != 0:
+        raise FFmpegError(
+            _tail(errors) or f"ffmpeg exited with status {process.returncode}"
+        )
+    if progress and total_ms:
+        progress(total_ms, total_ms)
+    return output
+
+
+def _tail(lines) -> str:
+    return "; ".join(line.strip() for line in list(lines)[-3:] if line.strip())
@@ -0,0 +1,178 @@
+import io  # for encoding candidates in memory
+from typing import Callable, Optional
+
+import numpy as np  # for the structural similarity index
+from PIL import Image
+
+from app.services.imaging import DecodedImage, flatten
+from app.services.metrics import stage
+
+# encoder settings to search, from smallest output to best quality. PNG is
+# quantized to a palette of that many colours, None keeping every colour; finer
+# steps than these change the size too little to pay for the extra quantizing
+LEVELS = {
+    "JPEG": list(range(5, 96)),
+    "WEBP": list(range(5, 96)),
+    "PNG": [2, 4, 8, 16, 24, 32, 48, 64, 96, 128, 192, 256, None],
+}
+
+# formats that can be re-encoded at a chosen quality
+ADAPTIVE_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+# similarity is measured on a copy no larger than this on its longest side
+SSIM_SIZE = 512
+SSIM_WINDOW = 7
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+
+
+def prepare(image: Image.Image, fmt: str) -> Image.Image:
+    "Convert pixels to a mode ``fmt`` encodes and the palette quantizer accepts."
+    if fmt == "JPEG":
+        return image if image.mode in ("RGB", "L") else flatten(image)
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    return image.convert("RGBA" if _has_alpha(image) else "RGB")
+
+
+def encode(image: Image.Image, fmt: str, level) -> bytes:
+    "Encode prepared pixels as ``fmt`` at one of its ``LEVELS``."
+    buffer = io.BytesIO()
+    with stage("encode"):
+        if fmt == "JPEG":
+            image.save(buffer, "JPEG", quality=level, optimize=True, progressive=True)
+        elif fmt == "WEBP":
+            image.save(buffer, "WEBP", quality=level, method=4)
+        else:
+            if level is not None:
+                # octree handles alpha and is far faster than median cut, which
+                # matters when every probe of the search quantizes again
+                image = image.quantize(colors=level, method=Image.Quantize.FASTOCTREE)
+            image.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _luma(image: Image.Image, size: Optional[tuple[int, int]] = None) -> np.ndarray:
+    image = flatten(image) if _has_alpha(image) else image.convert("RGB")
+    if size is None:
+        image = image.copy()
+        image.thumbnail((SSIM_SIZE, SSIM_SIZE), Image.Resampling.BILINEAR)
+    elif image.size != size:
+        image = image.resize(size, Image.Resampling.BILINEAR)
+    return np.asarray(image.convert("L"), dtype=np.float64)
+
+
+def _box_mean(values: np.ndarray, k: int) -> np.ndarray:
+    # mean over every k x k window, from an integral image
+    total = np.pad(values.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    return (total[k:, k:] - total[:-k, k:] - total[k:, :-k] + total[:-k, :-k]) / (k * k)
+
+
+def ssim(reference: np.ndarray, candidate: np.ndarray) -> float:
+    "Mean structural similarity of two equally sized luma arrays; 1.0 is identical."
+    k = min(SSIM_WINDOW, *reference.shape)
+    mean_x = _box_mean(reference, k)
+    mean_y = _box_mean(candidate, k)
+    var_x = _box_mean(reference * reference, k) - mean_x * mean_x
+    var_y = _box_mean(candidate * candidate, k) - mean_y * mean_y
+    covariance = _box_mean(reference * candidate, k) - mean_x * mean_y
+    index = ((2 * mean_x * mean_y + _C1) * (2 * covariance + _C2)) / (
+        (mean_x * mean_x + mean_y * mean_y + _C1) * (var_x + var_y + _C2)
+    )
+    return float(index.mean())
+
+
+def _first(count: int, passes: Callable[[int], bool]) -> Optional[int]:
+    "Lowest index below ``count`` that passes, for tests that keep passing above it."
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if passes(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low if low < count else None
+
+
+def _search(
+    image: Image.Image,
+    fmt: str,
+    reference: np.ndarray,
+    target_bytes: Optional[int],
+    min_ssim: Optional[float],
+) -> tuple[bytes, bool, bool]:
+    """The smallest encoding of ``image`` as ``fmt`` that meets the constraints.
+
+    Returns it with whether it fits ``target_bytes`` and whether it reaches
+    ``min_ssim``. Size is the hard limit: when the similarity floor needs more
+    bytes than the target allows, the best quality that fits wins.
+    """
+    levels = LEVELS[fmt]
+    pixels = prepare(image, fmt)
+    encoded: dict[int, bytes] = {}
+    scores: dict[int, float] = {}
+
+    def at(i: int) -> bytes:
+        if i not in encoded:
+            encoded[i] = encode(pixels, fmt, levels[i])
+        return encoded[i]
+
+    def fits(i: int) -> bool:
+        return target_bytes is None or len(at(i)) <= target_bytes
+
+    def similar(i: int) -> bool:
+        if min_ssim is None:
+            return True
+        if i not in scores:
+            with stage("compare"):
+                candidate = Image.open(io.BytesIO(at(i)))
+                size = (reference.shape[1], reference.shape[0])
+                scores[i] = ssim(reference, _luma(candidate, size))
+        return scores[i] >= min_ssim
+
+    # lowest level that looks good enough, or the best one when none does
+    chosen = len(levels) - 1
+    if min_ssim is not None:
+        good = _first(len(levels), similar)
+        chosen = len(levels) - 1 if good is None else good
+    if not fits(chosen):
+        # highest level within the target, or the smallest when none is
+        too_big = _first(len(levels), lambda i: not fits(i))
+        chosen = max((len(levels) if too_big is None else too_big) - 1, 0)
+    return at(chosen), fits(chosen), similar(chosen)
+
+
+def optimize_image(
+    image: DecodedImage,
+    target_bytes: Optional[int] = None,
+    min_ssim: Optional[float] = None,
+    allow_webp: bool = False,
+) -> bytes:
+    """Re-encode ``image`` as small as the constraints allow.
+
+    Encoder quality, or for PNG the palette size, is binary-searched against a
+    byte budget and a floor on the structural similarity to the original. WebP is
+    tried too when ``allow_webp`` is set. The original bytes come back whenever
+    no encoding is smaller, so the result is never larger than the input.
+    """
+    if image.format not in ADAPTIVE_FORMATS:
+        return image.data
+    pixels = image.pixels()
+    # animations would lose every frame but the first
+    if getattr(pixels, "n_frames", 1) > 1:
+        return image.data
+    reference = _luma(pixels) if min_ssim is not None else None
+    formats = [image.format]
+    if allow_webp and image.format != "WEBP":
+        formats.append("WEBP")
+
+    candidates = [
+        _search(pixels, fmt, reference, target_bytes, min_ssim) for fmt in formats
+    ]
+    # meeting the byte target matters most, then the similarity floor, then size
+    best, _, _ = min(candidates, key=lambda c: (not c[1], not c[2], len(c[0])))
+    return best if len(best) < len(image.data) else image.data
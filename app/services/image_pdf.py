@@ -0,0 +1,202 @@
+import io  # for the output buffer
+import struct  # for reading PNG chunk headers
+import zlib  # for compressing rasters that cannot be embedded as-is
+from typing import Optional
+
+import pikepdf  # for assembling the PDF objects
+
+from app.services.imaging import DecodedImage
+from app.services.metrics import add_pages, stage
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# page size in points is pixels * 72 / resolution, matching Pillow's PDF writer
+DEFAULT_RESOLUTION = 100.0
+
+
+class _PngInfo:
+    "The parts of a PNG needed to hand its compressed pixel data to a PDF reader."
+
+    def __init__(self, data: bytes):
+        self.palette: Optional[bytes] = None
+        self.transparency = False
+        idat = []
+        offset = len(PNG_SIGNATURE)
+        while offset + 8 <= len(data):
+            length, kind = struct.unpack(">I4s", data[offset : offset + 8])
+            body = data[offset + 8 : offset + 8 + length]
+            if kind == b"IHDR":
+                (
+                    self.width,
+                    self.height,
+                    self.bit_depth,
+                    self.color_type,
+                    _,
+                    _,
+                    self.interlace,
+                ) = struct.unpack(">IIBBBBB", body)
+            elif kind == b"PLTE":
+                self.palette = body
+            elif kind == b"tRNS":
+                self.transparency = True
+            elif kind == b"IDAT":
+                idat.append(body)
+            elif kind == b"IEND":
+                break
+            offset += 12 + length
+        # IDAT chunks split one zlib stream, whose rows carry PNG predictor bytes
+        self.idat = b"".join(idat)
+
+    @property
+    def embeddable(self) -> bool:
+        # PDF's Flate predictors match PNG's row filters, but PDF keeps alpha in a
+        # separate mask and has no notion of Adam7 interlacing
+        return (
+            self.interlace == 0
+            and not self.transparency
+            and self.color_type in (0, 2, 3)
+            and (self.color_type != 3 or self.palette is not None)
+        )
+
+
+class ImagePdfBuilder:
+    """Builds a PDF with one image per page, embedding image data without re-encoding.
+
+    JPEG data is wrapped as a DCT stream without touching its pixels, and opaque,
+    non-interlaced PNG data is passed to Flate with PNG predictors as-is. Other
+    images are decoded once and stored losslessly with Flate, with any alpha
+    channel kept as a soft mask.
+    """
+
+    def __init__(self, resolution: float = DEFAULT_RESOLUTION):
+        self.resolution = resolution
+        self.pdf = pikepdf.Pdf.new()
+
+    def add(self, data: bytes) -> None:
+        image = DecodedImage(data)
+        png = _PngInfo(data) if image.format == "PNG" else None
+        if image.format == "JPEG" and image.mode in ("L", "RGB", "CMYK"):
+            xobject = self._jpeg(image)
+        elif png is not None and png.embeddable:
+            xobject = self._png(png)
+        else:
+            xobject = self._raster(image)
+
+        width, height = image.size
+        page_width = width * 72 / self.resolution
+        page_height = height * 72 / self.resolution
+        page = self.pdf.add_blank_page(page_size=(page_width, page_height))
+        page.Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=xobject))
+        page.Contents = pikepdf.Stream(
+            self.pdf,
+            f"q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q".encode(),
+        )
+        add_pages(1)
+
+    def save(self) -> bytes:
+        if len(self.pdf.pages) == 0:
+            raise ValueError("No images to convert")
+        buffer = io.BytesIO()
+        # leave the image streams exactly as they were embedded
+        with stage("write"):
+            self.pdf.save(
+                buffer,
+                compress_streams=True,
+                stream_decode_level=pikepdf.StreamDecodeLevel.none,
+            )
+        return buffer.getvalue()
+
+    def _image_stream(self, data: bytes, width: int, height: int, **entries):
+        stream = pikepdf.Stream(self.pdf, b"")
+        stream.Type = pikepdf.Name.XObject
+        stream.Subtype = pikepdf.Name.Image
+        stream.Width = width
+        stream.Height = height
+        filter_ = entries.pop("Filter")
+        decode_parms = entries.pop("DecodeParms", None)
+        for key, value in entries.items():
+            stream[f"/{key}"] = value
+        stream.write(data, filter=filter_, decode_parms=decode_parms)
+        return stream
+
+    def _jpeg(self, image: DecodedImage):
+        width, height = image.size
+        colorspace = {"L": "/DeviceGray", "RGB": "/DeviceRGB", "CMYK": "/DeviceCMYK"}
+        entries = {}
+        if image.mode == "CMYK" and "adobe" in image.info:
+            # Adobe writes CMYK JPEGs inverted
+            entries["Decode"] = pikepdf.Array([1, 0] * 4)
+        return self._image_stream(
+            image.data,
+            width,
+            height,
+            ColorSpace=pikepdf.Name(colorspace[image.mode]),
+            BitsPerComponent=8,
+            Filter=pikepdf.Name.DCTDecode,
+            **entries,
+        )
+
+    def _png(self, png: _PngInfo):
+        colors = 3 if png.color_type == 2 else 1
+        if png.color_type == 3:
+            colorspace = pikepdf.Array(
+                [
+                    pikepdf.Name.Indexed,
+                    pikepdf.Name.DeviceRGB,
+                    len(png.palette) // 3 - 1,
+                    pikepdf.String(png.palette),
+                ]
+            )
+        else:
+            colorspace = (
+                pikepdf.Name.DeviceRGB if colors == 3 else pikepdf.Name.DeviceGray
+            )
+        return self._image_stream(
+            png.idat,
+            png.width,
+            png.height,
+            ColorSpace=colorspace,
+            BitsPerComponent=png.bit_depth,
+            Filter=pikepdf.Name.FlateDecode,
+            DecodeParms=pikepdf.Dictionary(
+                Predictor=15,
+                Colors=colors,
+                BitsPerComponent=png.bit_depth,
+                Columns=png.width,
+            ),
+        )
+
+    def _raster(self, image: DecodedImage):
+        pixels = image.pixels()
+        width, height = pixels.size
+        mask = None
+        if pixels.mode in ("RGBA", "LA", "PA") or "transparency" in pixels.info:
+            pixels = pixels.convert("LA" if pixels.mode in ("L", "LA") else "RGBA")
+            alpha = pixels.getchannel("A")
+            with stage("encode"):
+                alpha_data = zlib.compress(alpha.tobytes())
+            mask = self._image_stream(
+                alpha_data,
+                width,
+                height,
+                ColorSpace=pikepdf.Name.DeviceGray,
+                BitsPerComponent=8,
+                Filter=pikepdf.Name.FlateDecode,
+            )
+            pixels = pixels.convert("L" if pixels.mode == "LA" else "RGB")
+        elif pixels.mode not in ("L", "RGB", "CMYK"):
+            pixels = pixels.convert("RGB")
+
+        colorspace = {"L": "/DeviceGray", "RGB": "/DeviceRGB", "CMYK": "/DeviceCMYK"}
+        entries = {"SMask": mask} if mask is not None else {}
+        with stage("encode"):
+            data = zlib.compress(pixels.tobytes())
+        return self._image_stream(
+            data,
+            width,
+            height,
+            ColorSpace=pikepdf.Name(colorspace[pixels.mode]),
+            BitsPerComponent=8,
+            Filter=pikepdf.Name.FlateDecode,
+            **entries,
+        )
@@ -0,0 +1,88 @@
+import io  # for wrapping encoded bytes
+from typing import Optional
+
+from PIL import Image  # for decoding and encoding rasters
+
+from app.services.metrics import stage
+
+# Pillow's format names for the extensions and labels clients send
+FORMAT_ALIASES = {"JPG": "JPEG", "TIF": "TIFF"}
+
+# formats without an alpha channel; transparent pixels are flattened onto white
+OPAQUE_FORMATS = {"JPEG", "BMP", "PDF"}
+
+
+def normalize_format(fmt: str) -> str:
+    fmt = fmt.upper().lstrip(".")
+    return FORMAT_ALIASES.get(fmt, fmt)
+
+
+class DecodedImage:
+    """An encoded image that is read once and decoded at most once.
+
+    Opening parses only the header, so size and format are free. Pixels are decoded
+    the first time a stage needs them and then shared by every later stage, and
+    ``encode`` hands back the original bytes when they already are in the
+    requested format.
+    """
+
+    def __init__(self, data: bytes, image: Optional[Image.Image] = None):
+        self.data = data
+        self._image = image if image is not None else Image.open(io.BytesIO(data))
+        self.format = normalize_format(self._image.format or "")
+        # rendered pixels need no decoding
+        self._decoded = image is not None
+
+    @classmethod
+    def from_raster(cls, image: Image.Image) -> "DecodedImage":
+        "Wrap pixels that were produced without an encoded form, e.g. a render."
+        return cls(b"", image)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self._image.size
+
+    @property
+    def mode(self) -> str:
+        return self._image.mode
+
+    @property
+    def info(self) -> dict:
+        return self._image.info
+
+    def pixels(self) -> Image.Image:
+        if not self._decoded:
+            with stage("decode"):
+                self._image.load()
+            self._decoded = True
+        return self._image
+
+    def encode(self, fmt: str, **save_options) -> bytes:
+        """Encode to ``fmt``, passing the original bytes through when nothing would change.
+
+        Any ``save_options`` (quality and the like) force a re-encode.
+        """
+        fmt = normalize_format(fmt)
+        if fmt == self.format and self.data and not save_options:
+            return self.data
+
+        image = self.pixels()
+        with stage("encode"):
+            if fmt in OPAQUE_FORMATS:
+                image = flatten(image)
+            buffer = io.BytesIO()
+            image.save(buffer, format=fmt, **save_options)
+        return buffer.getvalue()
+
+
+def flatten(image: Image.Image, background=(255, 255, 255)) -> Image.Image:
+    "Composite transparency onto ``background`` and return an RGB image."
+    if image.mode == "RGB":
+        return image
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        base = Image.new("RGB", image.size, background)
+        base.paste(image.convert("RGBA"), mask=image.getchannel("A"))
+        return base
+    return image.convert("RGB")
@@ -0,0 +1,178 @@
+import asyncio  # for running jobs as background tasks on the event loop
+import multiprocessing  # for a progress queue that worker processes can write to
+import threading  # for draining progress updates off the event loop
+import time  # for job timestamps and expiry
+import uuid  # for job ids
+from contextvars import ContextVar  # for telling calls made by a job apart
+from typing import Awaitable, Callable, Optional
+
+from app.models.job import DONE, FAILED, QUEUED, RUNNING, Job
+
+# set inside a running job; its client was already answered, so the job's calls wait
+# for the executor rather than be refused
+_in_job: ContextVar[bool] = ContextVar("in_job", default=False)
+
+
+def in_job() -> bool:
+    "Whether the caller runs as part of a background job."
+    return _in_job.get()
+
+
+class JobQueueFullError(Exception):
+    "Raised when too many jobs are already queued or running."
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many jobs in progress, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ProgressReporter:
+    """Picklable ``progress(done, total)`` callback handed to converters.
+
+    Updates travel over a manager queue, so it works the same in a worker process
+    or thread. Calls are throttled to whole-percent steps so per-frame callbacks
+    do not flood the queue.
+    """
+
+    def __init__(self, queue, job_id: str):
+        self._queue = queue
+        self.job_id = job_id
+        self._last = None
+
+    def __call__(self, done: int, total: Optional[int] = None) -> None:
+        step = int(done * 100 / total) if total else done
+        if step == self._last:
+            return
+        self._last = step
+        self._queue.put((self.job_id, done, total))
+
+
+class JobManager:
+    "Runs conversions in the background and tracks their status and progress."
+
+    def __init__(
+        self,
+        max_running: int,
+        max_queued: int,
+        ttl_seconds: int,
+        retry_after: int = 5,
+        start_method: str = "spawn",
+    ):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self.retry_after = retry_after
+        self.start_method = start_method
+        self._jobs: dict[str, Job] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._manager = None
+        self._queue = None
+        self._drainer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(
+        self, kind: str, run: Callable[[ProgressReporter], Awaitable[dict]]
+    ) -> Job:
+        """Queue ``run(progress)`` as a job; its returned dict becomes the job result."""
+        self._purge_finished()
+        pending = sum(1 for job in self._jobs.values() if not job.finished)
+        if pending >= self.max_running + self.max_queued:
+            raise JobQueueFullError(self.retry_after)
+
+        now = time.time()
+        job = Job(
+            job_id=str(uuid.uuid4()),
+            kind=kind,
+            status=QUEUED,
+            created_at=now,
+            updated_at=now,
+        )
+        self._jobs[job.job_id] = job
+
+        task = asyncio.get_running_loop().create_task(self._run(job, run))
+        # keep a reference so the task is not garbage collected while it runs
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge_finished()
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: Job, run) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_running)
+
+        # the task runs in its own copy of the context, so this stays inside the job
+        _in_job.set(True)
+        async with self._slots:
+            job.status = RUNNING
+            job.updated_at = time.time()
+            try:
+                job.result = await run(self._reporter(job.job_id))
+                job.status = DONE
+                job.progress = 1.0
+            except Exception as e:
+                job.status = FAILED
+                job.error = getattr(e, "detail", None) or str(e)
+            finally:
+                job.finished_at = job.updated_at = time.time()
+
+    def _reporter(self, job_id: str) -> ProgressReporter:
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context(self.start_method).Manager()
+                self._queue = self._manager.Queue()
+                self._drainer = threading.Thread(
+                    target=self._drain_progress, name="job-progress", daemon=True
+                )
+                self._drainer.start()
+        return ProgressReporter(self._queue, job_id)
+
+    def _drain_progress(self) -> None:
+        while True:
+            try:
+                update = self._queue.get()
+            except (EOFError, OSError):
+                return
+            if update is None:
+                return
+            job_id, done, total = update
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                continue
+            job.done = done
+            job.total = total
+            if total:
+                # leave the last percent for storing the result
+                job.progress = min(done / total, 0.99)
+            job.updated_at = time.time()
+
+    def _purge_finished(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return counts
+
+    def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        with self._lock:
+            if self._manager is not None:
+                try:
+                    self._queue.put(None)
+                except (EOFError, OSError):
+                    pass
+                self._manager.shutdown()
+                self._manager = None
@@ -0,0 +1,286 @@
+import re  # for checking metric names built from stats keys
+import threading  # for guarding metric values and the per-thread recording
+import time  # for stage timers
+from contextlib import contextmanager
+from contextvars import ContextVar  # for the route of the request being handled
+from typing import Any, Callable, Iterator, Optional
+
+from app.models.metrics import ConversionSamples
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; from a cached image conversion up to a long video encode
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+_NAME = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], Any] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f"{self.name} takes labels {self.labels}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def lines(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    "A value that only goes up, per combination of label values."
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def lines(self) -> Iterator[str]:
+        yield from super().lines()
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(list(zip(self.labels, key)))} {_number(value)}"
+
+
+class Histogram(_Metric):
+    "Observations counted into cumulative buckets, with their sum and count."
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def lines(self) -> Iterator[str]:
+        yield from super().lines()
+        with self._lock:
+            values = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        for key, (counts, total) in values:
+            pairs = list(zip(self.labels, key))
+            for bound, count in zip(self.buckets, counts):
+                le = _labels(pairs + [("le", _number(bound))])
+                yield f"{self.name}_bucket{le} {count}"
+            yield f"{self.name}_sum{_labels(pairs)} {_number(total)}"
+            yield f"{self.name}_count{_labels(pairs)} {counts[-1]}"
+
+
+class MetricsRegistry:
+    """The metrics of one process, rendered in the Prometheus text format.
+
+    Besides counters and histograms it exposes the numbers of existing ``stats()``
+    dicts, such as the cache's or the executor's, as gauges read at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._stats: list[tuple[str, Callable[[], dict]]] = []
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, stats: Callable[[], dict]) -> None:
+        "Expose every number in ``stats()`` as a gauge named ``<prefix>_<key>``."
+        self._stats.append((prefix, stats))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.lines())
+        for prefix, stats in self._stats:
+            for name, value in _flatten(prefix, stats()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(prefix: str, stats: dict) -> Iterator[tuple[str, float]]:
+    # nested dicts become part of the name; keys that are not valid names, such as
+    # media types, are left to the dedicated counters
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if not _NAME.match(name) or isinstance(value, bool):
+            continue
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "fileconverter_request_seconds",
+    "Time to answer a request, including streaming the response.",
+    ("route", "method", "status"),
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "fileconverter_stage_seconds",
+    "Time spent in each stage of handling a request.",
+    ("route", "stage"),
+)
+CONVERSION_SECONDS = REGISTRY.histogram(
+    "fileconverter_conversion_seconds",
+    "Time a conversion ran on a worker, without the time it was queued.",
+    ("conversion",),
+)
+INPUT_BYTES = REGISTRY.counter(
+    "fileconverter_input_bytes_total",
+    "Bytes handed to conversions.",
+    ("conversion",),
+)
+OUTPUT_BYTES = REGISTRY.counter(
+    "fileconverter_output_bytes_total",
+    "Bytes produced by conversions.",
+    ("conversion",),
+)
+PAGES = REGISTRY.counter(
+    "fileconverter_pages_total",
+    "Pages rendered, extracted or written by conversions.",
+    ("conversion",),
+)
+ERRORS = REGISTRY.counter(
+    "fileconverter_errors_total",
+    "Conversions that raised an error.",
+    ("conversion",),
+)
+DOWNLOAD_BYTES = REGISTRY.counter(
+    "fileconverter_download_bytes_total",
+    "Bytes of converted files served for download.",
+)
+UPLOAD_TYPE_MISMATCHES = REGISTRY.counter(
+    "fileconverter_upload_type_mismatches_total",
+    "Uploads whose content did not match their declared type.",
+    ("declared", "detected"),
+)
+
+# route of the request being handled, for stages timed on the event loop
+current_route: ContextVar[str] = ContextVar("current_route", default="none")
+
+# samples of the conversion running on this worker thread or process, if any
+_local = threading.local()
+
+
+def _recording() -> Optional[ConversionSamples]:
+    return getattr(_local, "samples", None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    "Time the enclosed block as stage ``name`` of the current request or conversion."
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        samples = _recording()
+        if samples is not None:
+            samples.stages.append((name, seconds))
+        else:
+            STAGE_SECONDS.observe(seconds, route=current_route.get(), stage=name)
+
+
+def add_pages(count: int = 1) -> None:
+    "Count pages against the conversion running on this worker."
+    samples = _recording()
+    if samples is not None:
+        samples.pages += count
+
+
+def call_recorded(fn: Callable, args: tuple, kwargs: dict):
+    """Run ``fn`` on a worker and return its result with what it recorded.
+
+    Worker processes have their own copy of the metrics, so stage timings and
+    page counts travel back with the result to be merged by the caller.
+    """
+    samples = ConversionSamples()
+    previous, _local.samples = _recording(), samples
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        samples.seconds = time.perf_counter() - start
+        _local.samples = previous
+    return result, samples
+
+
+def merge(samples: ConversionSamples, conversion: str) -> None:
+    "Add what a conversion recorded on a worker to this process's metrics."
+    route = current_route.get()
+    CONVERSION_SECONDS.observe(samples.seconds, conversion=conversion)
+    for name, seconds in samples.stages:
+        STAGE_SECONDS.observe(seconds, route=route, stage=name)
+    if samples.pages:
+        PAGES.inc(samples.pages, conversion=conversion)
@@ -0,0 +1,199 @@
+import io  # for building the document in memory
+import re  # for tidying embedded font names
+from typing import Optional
+
+import fitz  # PyMuPDF, for text blocks, fonts and images with their positions
+from docx import Document
+from docx.enum.section import WD_SECTION
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Pt, RGBColor
+
+from app.models.layout import PageImage, PageLayout, TextBlock, TextRun
+
+# span flags in PyMuPDF's text extraction
+_SUPERSCRIPT = 1
+_ITALIC = 2
+_BOLD = 16
+
+# image formats python-docx embeds; others are redrawn from the page as PNG
+DOCX_IMAGE_FORMATS = {"png", "jpeg", "jpg", "gif", "bmp", "tiff"}
+IMAGE_REDRAW_DPI = 150
+
+# margins are taken from where the content starts, within these bounds
+MIN_MARGIN = 18.0
+MAX_MARGIN = 72.0
+
+# a block this far right of the left margin is indented; closer counts as aligned
+MIN_INDENT = 6.0
+# a block this far below the previous one gets the gap as space before it
+MIN_GAP = 4.0
+# a block whose centre is this close to the page's is centred, unless it is wide
+CENTRE_TOLERANCE = 6.0
+
+_SUBSET_PREFIX = re.compile(r"^[A-Z]{6}\+")
+_STYLE_SUFFIX = re.compile(
+    r"[-,](Bold|Italic|Oblique|BoldItalic|BoldOblique|Regular|Roman)$", re.I
+)
+
+
+def font_name(name: str) -> str:
+    "The family of an embedded font, e.g. ``ABCDEF+Arial-BoldMT`` -> ``Arial``."
+    name = _SUBSET_PREFIX.sub("", name)
+    name = re.sub(r"MT$", "", name)
+    return _STYLE_SUFFIX.sub("", name) or name
+
+
+def _image(page: fitz.Page, block: dict) -> Optional[PageImage]:
+    bbox = tuple(block["bbox"])
+    rect = fitz.Rect(bbox)
+    if rect.is_empty:
+        return None
+    ext = block.get("ext", "").lower()
+    data = block.get("image")
+    if not data or ext not in DOCX_IMAGE_FORMATS:
+        # JPEG 2000, JBIG2 and the like: draw that part of the page instead
+        zoom = IMAGE_REDRAW_DPI / 72
+        data = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=rect).tobytes("png")
+        ext = "png"
+    return PageImage(bbox, data, ext)
+
+
+def _text(block: dict) -> Optional[TextBlock]:
+    runs: list[TextRun] = []
+    for line in block.get("lines", []):
+        if runs:
+            # lines of a block flow into one paragraph; a hyphen at the end of a
+            # line is taken to split a word
+            last = runs[-1]
+            if last.text.endswith("-") and not last.text.endswith(" -"):
+                last.text = last.text[:-1]
+            elif not last.text.endswith(" "):
+                last.text += " "
+        for span in line.get("spans", []):
+            if not span["text"]:
+                continue
+            flags = span.get("flags", 0)
+            run = TextRun(
+                span["text"],
+                font_name(span.get("font", "")),
+                round(span.get("size", 0) * 2) / 2,
+                bold=bool(flags & _BOLD) or "bold" in span.get("font", "").lower(),
+                italic=bool(flags & _ITALIC),
+                superscript=bool(flags & _SUPERSCRIPT),
+                color=span.get("color", 0),
+            )
+            previous = runs[-1] if runs else None
+            if previous is not None and (
+                previous.font,
+                previous.size,
+                previous.bold,
+                previous.italic,
+                previous.superscript,
+                previous.color,
+            ) == (run.font, run.size, run.bold, run.italic, run.superscript, run.color):
+                previous.text += run.text
+            else:
+                runs.append(run)
+    if not runs or not "".join(run.text for run in runs).strip():
+        return None
+    runs[-1].text = runs[-1].text.rstrip()
+    return TextBlock(tuple(block["bbox"]), runs)
+
+
+def extract_page(page: fitz.Page) -> PageLayout:
+    "Text blocks and images of one page, sorted top to bottom, then left to right."
+    layout = PageLayout(page.number, page.rect.width, page.rect.height)
+    content = page.get_text("dict", flags=fitz.TEXTFLAGS_DICT, sort=True)
+    for block in content["blocks"]:
+        item = _text(block) if block["type"] == 0 else _image(page, block)
+        if item is not None:
+            layout.items.append(item)
+    return layout
+
+
+class DocxBuilder:
+    """Builds a Word document from page layouts, one page at a time.
+
+    Each text block becomes a paragraph with a run per font, size and colour, and
+    keeps its indent, its spacing from the block above and centring. Images are
+    placed at their drawn size. Page breaks separate pages, and a page of a new
+    size starts a new section sized to match.
+    """
+
+    def __init__(self):
+        self.document = Document()
+        self._size: Optional[tuple[float, float]] = None
+
+    def _start_page(self, layout: PageLayout) -> None:
+        size = (layout.width, layout.height)
+        if self._size == size:
+            self.document.add_page_break()
+            return
+        if self._size is None:
+            section = self.document.sections[0]
+        else:
+            section = self.document.add_section(WD_SECTION.NEW_PAGE)
+        self._size = size
+        section.page_width, section.page_height = Pt(layout.width), Pt(layout.height)
+        box = layout.content_box or (
+            MAX_MARGIN,
+            MAX_MARGIN,
+            layout.width - MAX_MARGIN,
+            layout.height - MAX_MARGIN,
+        )
+        # the page's content sets the margins, so blocks at the edge are not indented
+        left = min(max(box[0], MIN_MARGIN), MAX_MARGIN)
+        top = min(max(box[1], MIN_MARGIN), MAX_MARGIN)
+        right = min(max(layout.width - box[2], MIN_MARGIN), MAX_MARGIN)
+        bottom = min(max(layout.height - box[3], MIN_MARGIN), MAX_MARGIN)
+        section.left_margin, section.right_margin = Pt(left), Pt(right)
+        section.top_margin, section.bottom_margin = Pt(top), Pt(bottom)
+
+    def add(self, layout: PageLayout) -> None:
+        self._start_page(layout)
+        section = self.document.sections[-1]
+        left = section.left_margin.pt
+        usable = layout.width - left - section.right_margin.pt
+        previous_bottom = section.top_margin.pt
+        for item in layout.items:
+            gap = item.bbox[1] - previous_bottom
+            previous_bottom = max(previous_bottom, item.bbox[3])
+            if isinstance(item, PageImage):
+                paragraph = self.document.add_paragraph()
+                width = min(item.bbox[2] - item.bbox[0], usable)
+                paragraph.add_run().add_picture(io.BytesIO(item.data), width=Pt(width))
+            else:
+                paragraph = self.document.add_paragraph()
+                for run in item.runs:
+                    self._add_run(paragraph, run)
+            fmt = paragraph.paragraph_format
+            fmt.space_after = Pt(0)
+            fmt.space_before = Pt(gap if gap >= MIN_GAP else 0)
+            centre = (item.bbox[0] + item.bbox[2]) / 2
+            if (
+                abs(centre - layout.width / 2) <= CENTRE_TOLERANCE
+                and item.bbox[2] - item.bbox[0] < usable * 0.8
+            ):
+                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            elif item.bbox[0] - left >= MIN_INDENT:
+                fmt.left_indent = Pt(item.bbox[0] - left)
+
+    @staticmethod
+    def _add_run(paragraph, run: TextRun) -> None:
+        text = paragraph.add_run(run.text)
+        font = text.font
+        if run.font:
+            font.name = run.font
+        if run.size > 0:
+            font.size = Pt(run.size)
+        font.bold = run.bold
+        font.italic = run.italic
+        if run.superscript:
+            font.superscript = True
+        if run.color:
+            font.color.rgb = RGBColor.from_string(f"{run.color:06X}")
+
+    def save(self) -> bytes:
+        buffer = io.BytesIO()
+        self.document.save(buffer)
+        return buffer.getvalue()
@@ -0,0 +1,287 @@
+import hashlib  # for finding streams with identical content
+import io  # for decoding and encoding images and the output in memory
+import math  # for the drawn size of images
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import fitz  # PyMuPDF, for where and how large each image is drawn
+import pikepdf  # for rewriting the PDF's objects
+from PIL import Image
+
+from app.models.pdf import PdfOptimizeOptions
+from app.services.metrics import add_pages, stage
+
+# images with fewer pixels than this are left alone; icons and rules are too small
+# for recompression to pay for itself
+MIN_IMAGE_PIXELS = 64 * 64
+
+# images are only downsampled when that drops at least a tenth of each side
+MAX_SCALE = 0.9
+
+# a JPEG that is only recompressed must shrink by this share to replace the original
+MIN_SAVING = 0.1
+
+# quality for JPEGs that are downsampled without a quality being set
+DEFAULT_JPEG_QUALITY = 85
+
+_MODES = {"/DeviceGray": "L", "/DeviceRGB": "RGB"}
+_ICC_MODES = {1: "L", 3: "RGB"}
+
+
+@dataclass
+class _ImageJob:
+    "One image's samples, handed to a worker thread away from the pikepdf objects."
+
+    objgen: tuple[int, int]
+    data: bytes
+    # ``data`` is a JPEG file rather than raw samples
+    jpeg: bool
+    mode: str
+    size: tuple[int, int]
+    scale: float
+
+
+def _filters(image: pikepdf.Stream) -> list[str]:
+    filters = image.get("/Filter")
+    if filters is None:
+        return []
+    if isinstance(filters, pikepdf.Array):
+        return [str(f) for f in filters]
+    return [str(filters)]
+
+
+def _mode(image: pikepdf.Stream) -> Optional[str]:
+    "Pillow mode for an image's colour space, for the spaces that need no conversion."
+    colorspace = image.get("/ColorSpace")
+    if isinstance(colorspace, pikepdf.Name):
+        return _MODES.get(str(colorspace))
+    if (
+        isinstance(colorspace, pikepdf.Array)
+        and len(colorspace) == 2
+        and colorspace[0] == pikepdf.Name.ICCBased
+    ):
+        return _ICC_MODES.get(int(colorspace[1].get("/N", 0)))
+    return None
+
+
+def image_resolutions(data: bytes) -> dict[int, float]:
+    """The lowest pixels per inch each image is drawn at, by object number.
+
+    An image drawn several times keeps the resolution of its largest placement, so
+    downsampling never blurs any of them below the limit.
+    """
+    resolutions: dict[int, float] = {}
+    document = fitz.open(stream=data, filetype="pdf")
+    try:
+        for page in document:
+            for info in page.get_image_info(xrefs=True):
+                xref = info.get("xref")
+                if not xref:
+                    continue
+                a, b, c, d, _, _ = info["transform"]
+                width_inches = math.hypot(a, b) / 72
+                height_inches = math.hypot(c, d) / 72
+                if width_inches <= 0 or height_inches <= 0:
+                    continue
+                dpi = min(info["width"] / width_inches, info["height"] / height_inches)
+                resolutions[xref] = min(resolutions.get(xref, math.inf), dpi)
+    finally:
+        document.close()
+    return resolutions
+
+
+def _job(
+    image: pikepdf.Stream, dpi: Optional[float], options: PdfOptimizeOptions
+) -> Optional[_ImageJob]:
+    "What to do with one image XObject, or None to leave it untouched."
+    if image.get("/ImageMask", False) or "/Decode" in image:
+        return None
+    if image.get("/BitsPerComponent") != 8:
+        return None
+    mode = _mode(image)
+    width, height = int(image.get("/Width", 0)), int(image.get("/Height", 0))
+    if mode is None or width * height < MIN_IMAGE_PIXELS:
+        return None
+
+    scale = 1.0
+    if options.max_dpi and dpi and dpi > options.max_dpi:
+        scale = options.max_dpi / dpi
+    filters = _filters(image)
+    if filters == ["/DCTDecode"] and "/DecodeParms" not in image:
+        if scale > MAX_SCALE and options.jpeg_quality is None:
+            return None
+        return _ImageJob(
+            image.objgen, image.read_raw_bytes(), True, mode, (width, height), scale
+        )
+    if filters in ([], ["/FlateDecode"]) and scale <= MAX_SCALE:
+        # lossless images that keep their size are left to the Flate recompression
+        # of the whole file
+        return _ImageJob(
+            image.objgen, image.read_bytes(), False, mode, (width, height), scale
+        )
+    return None
+
+
+def _optimize_image(
+    job: _ImageJob, quality: Optional[int]
+) -> Optional[tuple[bytes, bool, tuple[int, int]]]:
+    """Downsample and recompress one image; runs on a worker thread.
+
+    Returns the new stream data, whether it is a JPEG, and the new size, or None
+    when the image is better left as it is.
+    """
+    if job.jpeg:
+        image = Image.open(io.BytesIO(job.data))
+        if image.mode != job.mode:
+            # e.g. CMYK JPEGs, whose inverted Adobe variants Pillow cannot round-trip
+            return None
+    else:
+        channels = len(job.mode)
+        if len(job.data) != job.size[0] * job.size[1] * channels:
+            return None
+        image = Image.frombytes(job.mode, job.size, job.data)
+
+    if job.scale <= MAX_SCALE:
+        size = (
+            max(1, round(job.size[0] * job.scale)),
+            max(1, round(job.size[1] * job.scale)),
+        )
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    # flat artwork stays lossless; JPEG would blur its edges and often grow it
+    if not job.jpeg and (quality is None or image.getcolors(256) is not None):
+        return image.tobytes(), False, image.size
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality or DEFAULT_JPEG_QUALITY, optimize=True)
+    data = buffer.getvalue()
+    if (
+        job.jpeg
+        and job.scale > MAX_SCALE
+        and len(data) > len(job.data) * (1 - MIN_SAVING)
+    ):
+        return None
+    return data, True, image.size
+
+
+def _optimize_images(
+    pdf: pikepdf.Pdf, data: bytes, options: PdfOptimizeOptions, workers: int
+) -> int:
+    "Downsample and recompress image XObjects in place; returns how many changed."
+    resolutions = image_resolutions(data) if options.max_dpi else {}
+    jobs = []
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Stream) and obj.get("/Subtype") == "/Image":
+            job = _job(obj, resolutions.get(obj.objgen[0]), options)
+            if job is not None:
+                jobs.append(job)
+    if not jobs:
+        return 0
+
+    # pikepdf objects stay on this thread; Pillow releases the GIL while it
+    # decodes, resamples and encodes, so the images themselves run in parallel
+    if workers > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(
+                pool.map(lambda job: _optimize_image(job, options.jpeg_quality), jobs)
+            )
+    else:
+        results = [_optimize_image(job, options.jpeg_quality) for job in jobs]
+
+    changed = 0
+    for job, result in zip(jobs, results):
+        if result is None:
+            continue
+        content, jpeg, (width, height) = result
+        image = pdf.get_object(job.objgen)
+        if jpeg:
+            image.write(content, filter=pikepdf.Name.DCTDecode)
+        else:
+            # stored raw here and compressed with Flate when the file is saved
+            image.write(content)
+        image.Width, image.Height = width, height
+        changed += 1
+    return changed
+
+
+def _stream_key(stream: pikepdf.Stream) -> tuple[bytes, bytes]:
+    # the stream's dictionary, without its length, with indirect objects as
+    # references, so equal images with different masks stay apart
+    entries = pikepdf.Dictionary(
+        {key: stream.stream_dict[key] for key in stream.stream_dict.keys()}
+    )
+    if "/Length" in entries:
+        del entries.Length
+    return hashlib.sha256(stream.read_raw_bytes()).digest(), entries.unparse()
+
+
+def _repoint(obj, duplicates: dict) -> None:
+    "Replace references to duplicate streams inside ``obj`` and its direct children."
+    if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        items = [(key, obj[key]) for key in obj.keys()]
+    elif isinstance(obj, pikepdf.Array):
+        items = list(enumerate(obj))
+    else:
+        return
+    for key, value in items:
+        # numbers, booleans and strings come back as Python values
+        if not isinstance(value, pikepdf.Object):
+            continue
+        if value.is_indirect:
+            if value.objgen in duplicates:
+                obj[key] = duplicates[value.objgen]
+        else:
+            _repoint(value, duplicates)
+
+
+def deduplicate_streams(pdf: pikepdf.Pdf) -> int:
+    """Point every reference to a stream at one copy of its content.
+
+    Producers that embed the same logo or font once per page end up with one
+    object for it; the copies are dropped when the file is saved.
+    """
+    first: dict[tuple[bytes, bytes], pikepdf.Stream] = {}
+    duplicates: dict[tuple[int, int], pikepdf.Stream] = {}
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Stream):
+            original = first.setdefault(_stream_key(obj), obj)
+            if original.objgen != obj.objgen:
+                duplicates[obj.objgen] = original
+    if duplicates:
+        for obj in pdf.objects:
+            _repoint(obj, duplicates)
+        _repoint(pdf.trailer, duplicates)
+    return len(duplicates)
+
+
+def optimize_pdf(
+    data: bytes, options: PdfOptimizeOptions = PdfOptimizeOptions(), workers: int = 1
+) -> bytes:
+    """Rewrite a PDF to be smaller, entirely in memory.
+
+    Images drawn above ``options.max_dpi`` are downsampled and JPEGs recompressed
+    at ``options.jpeg_quality``, on up to ``workers`` threads. Identical streams are
+    stored once, resources no page uses and embedded page thumbnails are dropped,
+    and streams are recompressed into object streams.
+    """
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        add_pages(len(pdf.pages))
+        if options.max_dpi or options.jpeg_quality:
+            with stage("encode"):
+                _optimize_images(pdf, data, options, workers)
+        deduplicate_streams(pdf)
+        pdf.remove_unreferenced_resources()
+        for page in pdf.pages:
+            if "/Thumb" in page.obj:
+                del page.obj.Thumb
+
+        output = io.BytesIO()
+        with stage("write"):
+            pdf.save(
+                output,
+                compress_streams=True,
+                recompress_flate=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                linearize=options.linearize,
+            )
+        return output.getvalue()
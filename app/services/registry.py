@@ -0,0 +1,293 @@
+import heapq  # for picking the cheapest partial route first
+import itertools  # for breaking ties between equally cheap routes
+import json  # for reading measured edge costs
+import os  # for file extensions
+from dataclasses import replace
+from typing import Iterable, Optional
+
+from app.models.conversion import ConversionEdge
+from app.services.executor import PROCESS, THREAD
+
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# the formats the converters know, by the name clients use for them
+MEDIA_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf",
+    "docx": DOCX_TYPE,
+    "mp4": "video/mp4",
+    "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
+}
+
+# file extensions written for each format, where they differ from its name
+EXTENSIONS = {"jpeg": "jpg"}
+
+# other spellings of format names, media types and file extensions
+FORMAT_ALIASES = {
+    "jpg": "jpeg",
+    "image/jpg": "jpeg",
+    "image/pjpeg": "jpeg",
+    "audio/mp3": "mp3",
+    "audio/x-m4a": "m4a",
+}
+
+# costs are milliseconds per megabyte of input on one core, measured on a
+# 1600x1200 photo and its PDF; SVG, DOCX and media costs are estimates
+DEFAULT_EDGES = [
+    # an image's PDF or SVG only wraps the raster, so neither is converted further
+    ConversionEdge(
+        "png",
+        "pdf",
+        "convert_image_to_pdf",
+        3,
+        {"image_format": "PNG"},
+        terminal=True,
+    ),
+    ConversionEdge(
+        "jpeg",
+        "pdf",
+        "convert_image_to_pdf",
+        1.5,
+        {"image_format": "JPEG"},
+        terminal=True,
+    ),
+    ConversionEdge(
+        "webp",
+        "pdf",
+        "convert_image_to_pdf",
+        580,
+        {"image_format": "WEBP"},
+        terminal=True,
+    ),
+    ConversionEdge("svg", "pdf", "convert_svg_to_pdf", 50),
+    ConversionEdge("docx", "pdf", "convert_docx_to_pdf", 3000),
+    ConversionEdge("pdf", "docx", "convert_pdf_to_docx", 5, fans_out=True),
+    ConversionEdge(
+        "pdf",
+        "png",
+        "convert_pdf_to_image",
+        135,
+        {"image_format": "PNG"},
+        per_page=True,
+    ),
+    ConversionEdge(
+        "pdf",
+        "jpeg",
+        "convert_pdf_to_image",
+        180,
+        {"image_format": "JPG"},
+        per_page=True,
+        lossy=True,
+    ),
+    ConversionEdge("png", "jpeg", "convert_png_to_jpeg", 15, lossy=True),
+    ConversionEdge("jpeg", "png", "convert_jpeg_to_png", 510),
+    ConversionEdge(
+        "png",
+        "svg",
+        "convert_image_to_svg",
+        9,
+        {"image_format": "PNG"},
+        terminal=True,
+    ),
+    ConversionEdge(
+        "jpeg",
+        "svg",
+        "convert_image_to_svg",
+        4,
+        {"image_format": "JPEG"},
+        terminal=True,
+    ),
+    ConversionEdge(
+        "webp",
+        "svg",
+        "convert_image_to_svg",
+        780,
+        {"image_format": "PNG"},
+        terminal=True,
+    ),
+    # both methods encode whatever Pillow can decode
+    ConversionEdge("webp", "png", "convert_jpeg_to_png", 780),
+    ConversionEdge("webp", "jpeg", "convert_png_to_jpeg", 120, lossy=True),
+    ConversionEdge("svg", "png", "convert_svg_to_image", 100, {"output_format": "PNG"}),
+    ConversionEdge(
+        "svg",
+        "jpeg",
+        "convert_svg_to_image",
+        80,
+        {"output_format": "JPG"},
+        lossy=True,
+    ),
+    # only uploads detected as MP4 are planned from here; ``ext`` names the temp
+    # file a bytes input would be spooled to, and ffmpeg reads the container from
+    # the content either way
+    ConversionEdge(
+        "mp4",
+        "mp3",
+        "convert_video_to_audio",
+        300,
+        {"ext": ".mp4", "audio_format": "mp3"},
+        kind=THREAD,
+        lossy=True,
+    ),
+    ConversionEdge(
+        "mp4",
+        "m4a",
+        "convert_video_to_audio",
+        40,
+        {"ext": ".mp4", "audio_format": "m4a"},
+        kind=THREAD,
+    ),
+]
+
+
+# added to the cost of every lossy step, so routes that re-encode with loss more
+# often than needed are never the cheapest
+LOSSY_STEP_COST = 10_000
+
+
+class NoConversionPathError(ValueError):
+    "Raised when no chain of conversions leads from one format to another."
+
+
+def normalize_format(name: str) -> str:
+    "Map a format name, media type or file extension to the registry's format name."
+    name = name.strip().lower().lstrip(".")
+    name = FORMAT_ALIASES.get(name, name)
+    for fmt, media_type in MEDIA_TYPES.items():
+        if name == media_type:
+            return fmt
+    return name
+
+
+def format_of(content_type: Optional[str], filename: Optional[str]) -> Optional[str]:
+    "The format an upload claims to be, from its content type or else its extension."
+    for hint in (content_type, os.path.splitext(filename or "")[1]):
+        if hint:
+            fmt = normalize_format(hint.split(";")[0])
+            if fmt in MEDIA_TYPES:
+                return fmt
+    return None
+
+
+def media_type_of(fmt: str) -> str:
+    return MEDIA_TYPES.get(fmt, "application/octet-stream")
+
+
+def extension_of(fmt: str) -> str:
+    return EXTENSIONS.get(fmt, fmt)
+
+
+def plan_kind(plan: list[ConversionEdge]) -> str:
+    "Executor pool for a whole plan; a worker thread only when every step waits on I/O."
+    return THREAD if plan and all(edge.kind == THREAD for edge in plan) else PROCESS
+
+
+class ConversionGraph:
+    """Formats as nodes and converter methods as weighted edges between them.
+
+    ``plan`` finds the cheapest chain of conversions between two formats, so pairs
+    without a direct converter go through the cheapest intermediates, e.g. DOCX to
+    PNG through PDF. Costs add up per step, each taken as if the step's input were
+    the original's size.
+    """
+
+    def __init__(self, edges: Iterable[ConversionEdge] = ()):
+        self._edges: dict[str, dict[str, ConversionEdge]] = {}
+        for edge in edges:
+            self.add(edge)
+
+    def add(self, edge: ConversionEdge) -> None:
+        "Register ``edge``, replacing any existing one between the same formats."
+        self._edges.setdefault(edge.source, {})[edge.target] = edge
+
+    def edge(self, source: str, target: str) -> Optional[ConversionEdge]:
+        return self._edges.get(source, {}).get(target)
+
+    @property
+    def edges(self) -> list[ConversionEdge]:
+        return [edge for targets in self._edges.values() for edge in targets.values()]
+
+    @property
+    def formats(self) -> set[str]:
+        return set(self._edges) | {edge.target for edge in self.edges}
+
+    def set_cost(self, source: str, target: str, cost: float) -> None:
+        edge = self.edge(source, target)
+        if edge is None:
+            raise KeyError(f"No conversion from {source} to {target}")
+        self.add(replace(edge, cost=cost))
+
+    def load_costs(self, path: str) -> None:
+        """Override edge costs with measured ones.
+
+        The file maps ``"source->target"`` to milliseconds per megabyte, as written
+        by the benchmark harness; edges it does not know keep their estimates.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            costs = json.load(f)
+        for name, cost in costs.items():
+            source, _, target = name.partition("->")
+            if self.edge(source, target) is not None:
+                self.set_cost(source, target, float(cost))
+
+    def plan(self, source: str, target: str) -> list[ConversionEdge]:
+        """Cheapest chain of edges from ``source`` to ``target``.
+
+        Lossy steps count extra and ties go to the route with fewer steps. Raises NoConversionPathError when
+        ``target`` cannot be reached, or when both are the same format.
+        """
+        if source == target:
+            raise NoConversionPathError(f"File is already {source.upper()}")
+        order = itertools.count()
+        queue = [(0.0, 0, next(order), source, [])]
+        # final results are not converted any further, so reaching a format through
+        # a final step is kept apart from reaching it as a convertible file
+        settled = set()
+        while queue:
+            cost, steps, _, fmt, path = heapq.heappop(queue)
+            if fmt == target:
+                return path
+            final = bool(path) and path[-1].final
+            if (fmt, final) in settled:
+                continue
+            settled.add((fmt, final))
+            if final:
+                continue
+            for edge in self._edges.get(fmt, {}).values():
+                if (edge.target, edge.final) in settled:
+                    continue
+                heapq.heappush(
+                    queue,
+                    (
+                        cost + edge.cost + (LOSSY_STEP_COST if edge.lossy else 0),
+                        steps + 1,
+                        next(order),
+                        edge.target,
+                        path + [edge],
+                    ),
+                )
+        raise NoConversionPathError(
+            f"Cannot convert {source.upper()} to {target.upper()}"
+        )
+
+    def targets(self, source: str) -> set[str]:
+        "Every format reachable from ``source``."
+        reachable = set()
+        for target in self.formats - {source}:
+            try:
+                self.plan(source, target)
+            except NoConversionPathError:
+                continue
+            reachable.add(target)
+        return reachable
+
+
+def default_graph(costs_path: Optional[str] = None) -> ConversionGraph:
+    graph = ConversionGraph(DEFAULT_EDGES)
+    if costs_path:
+        graph.load_costs(costs_path)
+    return graph
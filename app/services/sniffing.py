@@ -0,0 +1,176 @@
+import re  # for finding the root element of SVG documents
+import threading  # for guarding the counters across concurrent requests
+from collections import Counter  # for counting mismatches per type pair
+from typing import Optional
+
+from app.services.metrics import UPLOAD_TYPE_MISMATCHES
+from app.services.registry import DOCX_TYPE, MEDIA_TYPES, normalize_format
+
+try:
+    import magic  # libmagic, for formats without a built-in signature
+except ImportError:  # python-magic raises this too when libmagic itself is missing
+    magic = None
+
+# enough for every signature below, libmagic's usual tests and a DOCX's first entries
+SNIFF_BYTES = 8 * 1024
+# the end of a ZIP, where its central directory lists every entry
+ZIP_TAIL_BYTES = 64 * 1024
+
+# declared types that say nothing about the content
+UNTYPED = {"", "application/octet-stream", "binary/octet-stream"}
+
+# ISO base media brands of still images; other brands are video or audio
+_IMAGE_BRANDS = {
+    b"avif": "image/avif",
+    b"avis": "image/avif",
+    b"heic": "image/heic",
+    b"heix": "image/heic",
+    b"heim": "image/heic",
+    b"heis": "image/heic",
+    b"mif1": "image/heif",
+    b"msf1": "image/heif",
+}
+_AUDIO_BRANDS = {b"M4A ", b"M4B ", b"M4P "}
+_VIDEO_BRANDS = {
+    b"isom",
+    b"iso2",
+    b"iso4",
+    b"iso5",
+    b"iso6",
+    b"mp41",
+    b"mp42",
+    b"avc1",
+    b"M4V ",
+    b"M4VH",
+    b"M4VP",
+    b"dash",
+    b"f4v ",
+    b"3gp4",
+    b"3gp5",
+    b"3gp6",
+    b"3g2a",
+    b"MSNV",
+    b"mmp4",
+    b"XAVC",
+}
+
+_SVG_ROOT = re.compile(rb"<svg[\s>]", re.IGNORECASE)
+# what may come before an SVG's root element
+_SVG_PROLOG = (b"<?xml", b"<svg", b"<!--", b"<!doctype svg")
+
+
+def _iso_media_type(head: bytes) -> Optional[str]:
+    # the major brand, then the compatible brands listed in the rest of the box
+    size = int.from_bytes(head[:4], "big")
+    brands = [head[8:12]]
+    brands += [head[i : i + 4] for i in range(16, min(size, len(head)) - 3, 4)]
+    # an AVIF image may also claim the generic HEIF brand, so it is checked first
+    for image_type in ("image/avif", "image/heic", "image/heif"):
+        if any(_IMAGE_BRANDS.get(brand) == image_type for brand in brands):
+            return image_type
+    if brands[0] in _AUDIO_BRANDS:
+        return "audio/mp4"
+    if brands[0] == b"qt  ":
+        return "video/quicktime"
+    if any(brand in _VIDEO_BRANDS for brand in brands):
+        return "video/mp4"
+    # unknown brands are left to libmagic or the declared type
+    return None
+
+
+def detect(head: bytes, tail: bytes = b"") -> Optional[str]:
+    """Media type of the content that starts with ``head``, from built-in signatures.
+
+    ``tail`` is the end of the content, which is only read for ZIP archives.
+    """
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    # readers accept a PDF header anywhere in the first kilobyte
+    if b"%PDF-" in head[:1024]:
+        return "application/pdf"
+    if head[4:8] == b"ftyp":
+        return _iso_media_type(head)
+    if head.startswith(b"PK\x03\x04"):
+        # Word writes its parts near the start of the archive; other writers may put
+        # them anywhere, but the central directory at the end names them all
+        if b"word/" in head or b"word/document.xml" in tail:
+            return DOCX_TYPE
+        return "application/zip"
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if text.lower().startswith(_SVG_PROLOG) and _SVG_ROOT.search(text):
+        return "image/svg+xml"
+    return None
+
+
+def _series(media_type: str) -> str:
+    # clients can declare anything; keep the metric to the types we know
+    return media_type if normalize_format(media_type) in MEDIA_TYPES else "other"
+
+
+class ContentSniffer:
+    """Tells the type of an upload from its first bytes instead of trusting the client.
+
+    Built-in signatures cover the formats the converters handle and are checked
+    first; libmagic, when it is installed, covers the rest. Uploads whose declared
+    type disagrees with their content are counted per declared and detected pair.
+    """
+
+    def __init__(self, use_magic: bool = True):
+        self.use_magic = use_magic and magic is not None
+        self._lock = threading.Lock()
+        self._mismatches: Counter = Counter()
+        self._counters = {
+            "sniffed": 0,
+            "signature_matches": 0,
+            "magic_matches": 0,
+            "unrecognised": 0,
+            "mismatches": 0,
+        }
+
+    def sniff(self, head: bytes, tail: bytes = b"") -> tuple[Optional[str], str]:
+        "The detected media type, if any, and what detected it."
+        media_type = detect(head, tail)
+        if media_type is not None:
+            return media_type, "signature_matches"
+        if self.use_magic and head:
+            media_type = magic.from_buffer(head, mime=True)
+            if media_type and media_type not in UNTYPED:
+                return media_type, "magic_matches"
+        return None, "unrecognised"
+
+    def check(self, declared: Optional[str], head: bytes, tail: bytes = b"") -> str:
+        """The media type to handle an upload as.
+
+        That is the detected type, or the declared one when the content is not
+        recognised. ``tail`` is the end of the upload, which ZIP archives need.
+        """
+        declared = (declared or "").split(";")[0].strip().lower()
+        detected, source = self.sniff(head, tail)
+        mismatch = (
+            detected is not None
+            and declared not in UNTYPED
+            and normalize_format(declared) != normalize_format(detected)
+        )
+        with self._lock:
+            self._counters["sniffed"] += 1
+            self._counters[source] += 1
+            if mismatch:
+                self._counters["mismatches"] += 1
+                self._mismatches[f"{declared}->{detected}"] += 1
+        if mismatch:
+            UPLOAD_TYPE_MISMATCHES.inc(
+                declared=_series(declared), detected=_series(detected)
+            )
+        return detected or declared
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "libmagic": self.use_magic,
+                **self._counters,
+                "mismatches_by_type": dict(self._mismatches.most_common()),
+            }
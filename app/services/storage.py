@@ -0,0 +1,347 @@
+import mmap  # for serving spooled files without copying them into Python bytes
+import os  # for spool file operations
+import tempfile  # for scratch paths of results written by converters
+import threading  # for guarding the store across concurrent requests
+import time  # for entry timestamps and expiry
+import uuid  # for unique temporary spool names
+from collections import OrderedDict  # for least-recently-used ordering
+from typing import Iterator, Optional, Union
+
+from app.models.file import StoredFile
+
+SPOOL_SUFFIX = ".result"
+PARTIAL_SUFFIX = ".part"
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class ResultStore:
+    """Holds converted files for download with a byte budget, per-entry TTL and LRU eviction.
+
+    Results larger than ``spill_threshold`` are written to ``spool_dir`` and only their
+    path is kept in memory, so large outputs are bounded by ``max_disk_bytes`` instead
+    of the worker's RAM.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: int,
+        delete_on_download: bool = False,
+        spool_dir: Optional[str] = None,
+        spill_threshold: Optional[int] = None,
+        max_disk_bytes: int = 0,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.delete_on_download = delete_on_download
+        self.spool_dir = spool_dir
+        self.spill_threshold = spill_threshold
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, StoredFile]" = OrderedDict()
+        # spooled results handed out for a final download, until ``release``
+        self._downloading: dict[str, StoredFile] = {}
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._evictions = {"expired": 0, "lru": 0, "downloaded": 0}
+        self._rejected = 0
+        self._orphans_removed = 0
+
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._orphans_removed = self._remove_orphans()
+
+    @staticmethod
+    def _content_size(content: Union[bytes, list[bytes]]) -> int:
+        if isinstance(content, (list, tuple)):
+            return sum(len(part) for part in content)
+        return len(content)
+
+    def _should_spill(self, content: Union[bytes, list[bytes]], size: int) -> bool:
+        return (
+            self.spool_dir is not None
+            and self.spill_threshold is not None
+            and isinstance(content, (bytes, bytearray, memoryview))
+            and size >= self.spill_threshold
+        )
+
+    def put(
+        self,
+        file_id: str,
+        content: Union[bytes, list[bytes]],
+        media_type: str,
+        filename: str,
+    ) -> StoredFile:
+        size = self._content_size(content)
+        spill = self._should_spill(content, size)
+        budget = self.max_disk_bytes if spill else self.max_bytes
+        if size > budget:
+            with self._lock:
+                self._rejected += 1
+            raise ValueError(
+                f"Result of {size} bytes exceeds the storage budget of {budget} bytes"
+            )
+
+        path = self._write_spool_file(file_id, content) if spill else None
+        return self._add(
+            file_id, None if spill else content, media_type, filename, size, path
+        )
+
+    def reserve_path(self) -> str:
+        "A scratch path a converter can write a large result to before ``put_file``."
+        directory = self.spool_dir or tempfile.gettempdir()
+        fd, path = tempfile.mkstemp(
+            prefix=f"{os.getpid()}-", suffix=PARTIAL_SUFFIX, dir=directory
+        )
+        os.close(fd)
+        return path
+
+    def put_file(
+        self, file_id: str, path: str, media_type: str, filename: str
+    ) -> StoredFile:
+        """Store a result that was already written to ``path``, taking over the file.
+
+        Files below the spill threshold are read into memory like ``put`` would keep
+        them; larger ones are moved into the spool directory without being read.
+        """
+        size = os.path.getsize(path)
+        if self.spool_dir is None or (
+            self.spill_threshold is not None and size < self.spill_threshold
+        ):
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+            finally:
+                self._unlink(path)
+            return self.put(file_id, content, media_type, filename)
+
+        if size > self.max_disk_bytes:
+            self._unlink(path)
+            with self._lock:
+                self._rejected += 1
+            raise ValueError(
+                f"Result of {size} bytes exceeds the storage budget of "
+                f"{self.max_disk_bytes} bytes"
+            )
+        final_path = self._spool_path(file_id)
+        try:
+            os.replace(path, final_path)
+        except Exception:
+            self._unlink(path)
+            raise
+        return self._add(file_id, None, media_type, filename, size, final_path)
+
+    def _add(
+        self,
+        file_id: str,
+        content: Optional[Union[bytes, list[bytes]]],
+        media_type: str,
+        filename: str,
+        size: int,
+        path: Optional[str],
+    ) -> StoredFile:
+        now = time.monotonic()
+        entry = StoredFile(
+            file_id=file_id,
+            content=content,
+            media_type=media_type,
+            filename=filename,
+            size=size,
+            created_at=now,
+            expires_at=now + self.ttl_seconds,
+            path=path,
+        )
+
+        with self._lock:
+            self._purge_expired(now)
+            if file_id in self._entries:
+                self._discard(self._remove(file_id))
+            self._evict_for(entry)
+            self._entries[file_id] = entry
+            if entry.on_disk:
+                self._disk_bytes += size
+            else:
+                self._memory_bytes += size
+
+        return entry
+
+    def get(self, file_id: str) -> Optional[StoredFile]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                self._discard(self._remove(file_id))
+                self._evictions["expired"] += 1
+                return None
+            if self.delete_on_download:
+                self._remove(file_id)
+                self._evictions["downloaded"] += 1
+                if entry.on_disk:
+                    # the spool file stays on disk, and counted, until ``release``
+                    self._disk_bytes += entry.size
+                    self._downloading[file_id] = entry
+            else:
+                self._entries.move_to_end(file_id)
+            return entry
+
+    def open_stream(self, entry: StoredFile) -> Iterator[memoryview]:
+        """Map a spooled result and yield it in chunks without copying it into bytes.
+
+        The file is opened eagerly, so a concurrent eviction that unlinks it does not
+        interrupt a download that has already started.
+        """
+        f = open(entry.path, "rb")
+        try:
+            mapped = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if entry.size
+                else None
+            )
+        finally:
+            f.close()
+
+        def chunks() -> Iterator[memoryview]:
+            if mapped is None:
+                return
+            # the mapping is released once the server drops the last chunk it was handed
+            view = memoryview(mapped)
+            for offset in range(0, entry.size, STREAM_CHUNK_SIZE):
+                yield view[offset : offset + STREAM_CHUNK_SIZE]
+
+        return chunks()
+
+    def release(self, entry: StoredFile) -> None:
+        """Remove a spooled result that ``get`` handed out for its final download.
+
+        Call it once the response has ended, whether or not the body was sent; an
+        open mapping keeps serving a stream that is still running.
+        """
+        with self._lock:
+            if self._downloading.pop(entry.file_id, None) is None:
+                return
+            self._disk_bytes -= entry.size
+        self._unlink(entry.path)
+
+    def delete(self, file_id: str) -> bool:
+        with self._lock:
+            if file_id not in self._entries:
+                return False
+            self._discard(self._remove(file_id))
+            return True
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_expired(time.monotonic())
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return {
+                "entries": len(self._entries),
+                "entries_on_disk": sum(1 for e in self._entries.values() if e.on_disk),
+                "total_bytes": self._memory_bytes + self._disk_bytes,
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+                "max_bytes": self.max_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "spill_threshold": self.spill_threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "delete_on_download": self.delete_on_download,
+                "evictions": dict(self._evictions),
+                "rejected": self._rejected,
+                "orphans_removed": self._orphans_removed,
+            }
+
+    # callers must hold the lock
+    def _remove(self, file_id: str) -> StoredFile:
+        entry = self._entries.pop(file_id)
+        if entry.on_disk:
+            self._disk_bytes -= entry.size
+        else:
+            self._memory_bytes -= entry.size
+        return entry
+
+    def _evict_for(self, incoming: StoredFile) -> None:
+        # evict least recently used entries of the same tier until the new one fits
+        if incoming.on_disk:
+            used, budget = (lambda: self._disk_bytes), self.max_disk_bytes
+        else:
+            used, budget = (lambda: self._memory_bytes), self.max_bytes
+        for fid in list(self._entries):
+            if used() + incoming.size <= budget:
+                break
+            if self._entries[fid].on_disk == incoming.on_disk:
+                self._discard(self._remove(fid))
+                self._evictions["lru"] += 1
+
+    def _purge_expired(self, now: float) -> int:
+        expired = [fid for fid, e in self._entries.items() if e.expires_at <= now]
+        for fid in expired:
+            self._discard(self._remove(fid))
+        self._evictions["expired"] += len(expired)
+        return len(expired)
+
+    def _discard(self, entry: StoredFile) -> None:
+        if entry.on_disk:
+            self._unlink(entry.path)
+
+    # spool directory
+    def _spool_path(self, file_id: str) -> str:
+        # the owning pid prefixes every name so startup cleanup can tell live files apart
+        return os.path.join(self.spool_dir, f"{os.getpid()}-{file_id}{SPOOL_SUFFIX}")
+
+    def _write_spool_file(self, file_id: str, content: bytes) -> str:
+        final_path = self._spool_path(file_id)
+        temp_path = os.path.join(
+            self.spool_dir, f"{os.getpid()}-{uuid.uuid4().hex}{PARTIAL_SUFFIX}"
+        )
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(content)
+            # rename is atomic, so a crash never leaves a half-written result behind
+            os.replace(temp_path, final_path)
+        except Exception:
+            self._unlink(temp_path)
+            raise
+        return final_path
+
+    def _remove_orphans(self) -> int:
+        removed = 0
+        # every file in the spool directory is named "<owner pid>-..."
+        for name in os.listdir(self.spool_dir):
+            owner = name.split("-", 1)[0]
+            if not owner.isdigit():
+                continue
+            if int(owner) != os.getpid() and pid_alive(int(owner)):
+                continue
+            if self._unlink(os.path.join(self.spool_dir, name)):
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _unlink(path: str) -> bool:
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except PermissionError:
+            return False
+
+
+def pid_alive(pid: int) -> bool:
+    "Whether a process with ``pid`` is running, for files named after their owner."
+    if os.name == "nt":
+        # signal 0 terminates the process on Windows, so never probe there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,121 @@
+import hashlib  # for keying parsed documents by their content
+import io  # for rendering into memory
+import threading  # for guarding the parsed-document cache
+from collections import OrderedDict
+from typing import Optional
+
+from cairosvg.parser import Tree  # for parsing SVG documents
+from cairosvg.surface import PDFSurface, PNGSurface  # for drawing a parsed document
+from PIL import Image
+
+from app.models.svg import SvgTarget
+from app.services.imaging import DecodedImage
+from app.services.metrics import stage
+
+# parsed documents kept per process, and the most SVG source they may add up to
+TREE_CACHE_ENTRIES = 64
+TREE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# CairoSVG's pixels per inch, which sizes in pixels are relative to
+SVG_DPI = 96
+
+
+class SvgTreeCache:
+    """Parsed SVG documents by the SHA-256 of their source, least recently used out first.
+
+    Each worker process has its own; a document exported at several sizes, or
+    converted again, is parsed once per process. CairoSVG resets a tree's state
+    for every surface it draws, but not under concurrent draws, so renders of a
+    cached tree take its lock.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TREE_CACHE_ENTRIES,
+        max_bytes: int = TREE_CACHE_MAX_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._trees: OrderedDict[str, tuple[Tree, threading.Lock, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, svg: bytes) -> tuple[Tree, threading.Lock]:
+        key = hashlib.sha256(svg).hexdigest()
+        with self._lock:
+            entry = self._trees.get(key)
+            if entry is not None:
+                self._trees.move_to_end(key)
+                return entry[0], entry[1]
+
+        with stage("decode"):
+            tree = Tree(bytestring=svg)
+        entry = (tree, threading.Lock(), len(svg))
+        if len(svg) > self.max_bytes or self.max_entries <= 0:
+            return entry[0], entry[1]
+        with self._lock:
+            if key not in self._trees:
+                self._trees[key] = entry
+                self._bytes += len(svg)
+            while len(self._trees) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, size) = self._trees.popitem(last=False)
+                self._bytes -= size
+            tree, lock, _ = self._trees[key]
+        return tree, lock
+
+
+tree_cache = SvgTreeCache()
+
+
+def _pixels(tree: Tree, width: Optional[int], height: Optional[int]) -> Image.Image:
+    "Rasterize a parsed SVG straight into a Pillow image, without a PNG round trip."
+    surface = PNGSurface(tree, None, SVG_DPI, output_width=width, output_height=height)
+    cairo_surface = surface.cairo
+    cairo_surface.flush()
+    # cairo stores premultiplied ARGB32 as B, G, R, A bytes on little-endian hosts
+    return Image.frombuffer(
+        "RGBA",
+        (cairo_surface.get_width(), cairo_surface.get_height()),
+        bytes(cairo_surface.get_data()),
+        "raw",
+        "BGRa",
+        cairo_surface.get_stride(),
+        1,
+    )
+
+
+def render_svg(
+    svg: bytes, width: Optional[int] = None, height: Optional[int] = None
+) -> Image.Image:
+    "Rasterize an SVG into a Pillow image, parsing it only if it is not cached."
+    tree, lock = tree_cache.get(svg)
+    with lock, stage("render"):
+        return _pixels(tree, width, height)
+
+
+def render_target(svg: bytes, target: SvgTarget) -> bytes:
+    "Render an SVG as one target's format and size."
+    tree, lock = tree_cache.get(svg)
+    if target.fmt in ("PNG", "PDF"):
+        surface_class = PNGSurface if target.fmt == "PNG" else PDFSurface
+        output = io.BytesIO()
+        with lock, stage("render"):
+            surface_class(
+                tree,
+                output,
+                SVG_DPI,
+                output_width=target.width,
+                output_height=target.height,
+            ).finish()
+        return output.getvalue()
+
+    with lock, stage("render"):
+        image = DecodedImage.from_raster(_pixels(tree, target.width, target.height))
+    if target.fmt == "JPEG":
+        return image.encode("JPEG", quality=95)
+    return image.encode(target.fmt)
+
+
+def render_targets(svg: bytes, targets: list[SvgTarget]) -> list[bytes]:
+    "Render an SVG at every target, parsing it once."
+    return [render_target(svg, target) for target in targets]
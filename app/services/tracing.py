@@ -0,0 +1,289 @@
+from typing import Optional
+
+import numpy as np  # for edge extraction and contour linking over whole layers
+from PIL import Image, ImageFilter
+
+from app.models.svg import TraceOptions
+from app.services.metrics import stage
+
+# pixels with less opacity than this are left out of every shape
+ALPHA_THRESHOLD = 128
+
+# the palette is chosen on a copy no larger than this on its longest side
+PALETTE_SAMPLE_SIZE = 256
+
+# outline directions on the pixel-corner grid, with y pointing down; turning
+# right on screen is the next direction, turning left the previous one
+_DX = np.array([1, 0, -1, 0])
+_DY = np.array([0, 1, 0, -1])
+
+
+class TraceTooLargeError(Exception):
+    "The traced paths grew past the size the caller allowed for them."
+
+
+def quantize(
+    image: Image.Image, options: TraceOptions
+) -> tuple[np.ndarray, list[tuple[int, int, int]]]:
+    """Reduce an image to ``options.colors`` flat colours.
+
+    Returns a label per pixel, ``-1`` for transparent pixels and otherwise an
+    index into the returned colours, which are ordered from most to least used.
+    """
+    rgba = image.convert("RGBA")
+    rgb = rgba.convert("RGB")
+    # median cut picks the palette on a small copy; mapping every pixel to it is fast
+    sample = rgb.copy()
+    sample.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+    palette = sample.quantize(options.colors, method=Image.Quantize.MEDIANCUT)
+    indexed = rgb.quantize(palette=palette, dither=Image.Dither.NONE)
+    if options.smoothing:
+        # a majority filter merges specks and ragged edges into their surroundings
+        indexed = indexed.filter(ImageFilter.ModeFilter(options.smoothing))
+
+    labels = np.asarray(indexed, dtype=np.int32)
+    opaque = np.asarray(rgba.getchannel("A")) >= ALPHA_THRESHOLD
+    counts = np.bincount(labels[opaque], minlength=256)
+    order = np.argsort(-counts, kind="stable")
+    used = order[counts[order] > 0]
+    rank = np.full(256, -1, dtype=np.int32)
+    rank[used] = np.arange(len(used), dtype=np.int32)
+    labels = np.where(opaque, rank[labels], -1)
+    flat = indexed.getpalette()
+    colors = [tuple(flat[3 * i : 3 * i + 3]) for i in used]
+    return labels, colors
+
+
+def _edges(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Directed unit edges around the regions of ``mask``, each with them on its right.
+
+    Returns each edge's start corner as x and y, and its direction. Corners are on
+    the grid between pixels, so a w x h mask has corners 0..w by 0..h.
+    """
+    padded = np.pad(mask, 1)
+    # horizontal edges on corner row y between pixel rows y - 1 and y
+    above, below = padded[:-1, 1:-1], padded[1:, 1:-1]
+    # vertical edges on corner column x between pixel columns x - 1 and x
+    left, right = padded[1:-1, :-1], padded[1:-1, 1:]
+    parts = []
+    # inside below: heading right; inside above: heading left from the far corner
+    y, x = np.nonzero(below & ~above)
+    parts.append((x, y, 0))
+    y, x = np.nonzero(above & ~below)
+    parts.append((x + 1, y, 2))
+    # inside on the left: heading down; inside on the right: heading up
+    y, x = np.nonzero(left & ~right)
+    parts.append((x, y, 1))
+    y, x = np.nonzero(right & ~left)
+    parts.append((x, y + 1, 3))
+    xs = np.concatenate([p[0] for p in parts])
+    ys = np.concatenate([p[1] for p in parts])
+    ds = np.concatenate([np.full(len(p[0]), p[2]) for p in parts])
+    return xs, ys, ds
+
+
+def _link(xs: np.ndarray, ys: np.ndarray, ds: np.ndarray, stride: int) -> np.ndarray:
+    "The edge each edge continues into, found for all edges at once."
+    keys = (ys * stride + xs) * 4 + ds
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    end_x, end_y = xs + _DX[ds], ys + _DY[ds]
+    following = np.full(len(xs), -1)
+    # where two regions touch only at a corner, turning right keeps their outlines
+    # apart; any other corner has exactly one way on
+    for turn in (1, 0, 3):
+        wanted = (end_y * stride + end_x) * 4 + (ds + turn) % 4
+        found = np.searchsorted(sorted_keys, wanted)
+        found = np.minimum(found, len(sorted_keys) - 1)
+        hit = (sorted_keys[found] == wanted) & (following < 0)
+        following[hit] = order[found[hit]]
+    # every edge in a closed outline has a successor
+    return following
+
+
+def _loops(following: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Order edges into closed loops with pointer jumping rather than a walk.
+
+    Returns the edges in loop order and the loop each belongs to.
+    """
+    count = len(following)
+    steps = max(1, int(np.ceil(np.log2(count + 1))))
+    # each loop is named after its lowest edge
+    loop = np.arange(count)
+    jump = following.copy()
+    for _ in range(steps):
+        loop = np.minimum(loop, loop[jump])
+        jump = jump[jump]
+    # distance from every edge to the end of its loop, which is cut just before
+    # the loop's lowest edge
+    last = following == loop
+    distance = np.where(last, 0, 1)
+    jump = np.where(last, np.arange(count), following)
+    for _ in range(steps):
+        distance = distance + distance[jump]
+        jump = jump[jump]
+    order = np.lexsort((-distance, loop))
+    return order, loop[order]
+
+
+def _simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+    "Ramer-Douglas-Peucker on an open polyline, keeping both ends."
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        chord = points[end] - points[start]
+        offsets = points[start + 1 : end] - points[start]
+        length = np.hypot(*chord)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0])
+            distances = distances / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, end))
+    return points[keep]
+
+
+def _simplify_ring(points: np.ndarray, tolerance: float) -> np.ndarray:
+    "Simplify a closed outline, split at the point farthest from its first."
+    distances = np.hypot(*(points - points[0]).T)
+    split = int(np.argmax(distances))
+    if split == 0:
+        return points
+    first = _simplify(points[: split + 1], tolerance)
+    second = _simplify(np.vstack([points[split:], points[:1]]), tolerance)
+    return np.vstack([first[:-1], second[:-1]])
+
+
+def _outlines(mask: np.ndarray, options: TraceOptions) -> tuple[np.ndarray, np.ndarray]:
+    """Simplified closed outlines of a layer; holes run the opposite way round.
+
+    Returns the corner points of every outline one after another, and the index
+    each outline starts at.
+    """
+    xs, ys, ds = _edges(mask)
+    if len(xs) == 0:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+    following = _link(xs, ys, ds, mask.shape[1] + 1)
+    order, loop = _loops(following)
+    xs, ys, ds = xs[order], ys[order], ds[order]
+
+    # a corner of the outline is where its direction changes
+    starts = np.flatnonzero(np.r_[True, loop[1:] != loop[:-1]])
+    ends = np.r_[starts[1:], len(loop)]
+    previous = np.roll(ds, 1)
+    previous[starts] = ds[ends - 1]
+    corner = ds != previous
+    xs, ys, loop = xs[corner], ys[corner], loop[corner]
+
+    starts = np.flatnonzero(np.r_[True, loop[1:] != loop[:-1]])
+    ends = np.r_[starts[1:], len(loop)]
+    # twice the enclosed area, by the shoelace formula, for dropping specks
+    cross = xs * np.roll(ys, -1) - np.roll(xs, -1) * ys
+    cross[ends - 1] = xs[ends - 1] * ys[starts] - xs[starts] * ys[ends - 1]
+    areas = np.abs(np.add.reduceat(cross, starts)) / 2
+    kept = areas >= options.min_area
+    points = np.column_stack([xs, ys])[np.repeat(kept, ends - starts)]
+    lengths = (ends - starts)[kept]
+    starts = np.r_[0, np.cumsum(lengths)[:-1]].astype(np.int64)
+    if options.tolerance <= 0 or len(points) == 0:
+        return points, starts
+
+    rings = []
+    for ring in np.split(points, starts[1:]):
+        if len(ring) > 4:
+            ring = _simplify_ring(ring.astype(np.float64), options.tolerance)
+        if len(ring) >= 3:
+            rings.append(ring.astype(np.int64))
+    if not rings:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+    lengths = np.array([len(ring) for ring in rings])
+    return np.vstack(rings), np.r_[0, np.cumsum(lengths)[:-1]].astype(np.int64)
+
+
+def _path_data(points: np.ndarray, starts: np.ndarray) -> str:
+    "Compact path data: relative moves and lines with implicit repeats."
+    # each outline starts relative to the previous one's first point, where the
+    # pen is left after closing it
+    reference = np.roll(points, 1, axis=0)
+    reference[starts] = np.vstack([[0, 0], points[starts[:-1]]])
+    moves = (points - reference).tolist()
+    prefix = [""] * len(points)
+    suffix = [" "] * len(points)
+    for start in starts.tolist():
+        prefix[start] = "m"
+        suffix[start] = ""
+        prefix[start + 1] = "l"
+        suffix[start - 1] = "z"
+    suffix[-1] = "z"
+    data = "".join(
+        f"{before}{dx} {dy}{after}"
+        for before, (dx, dy), after in zip(prefix, moves, suffix)
+    )
+    # a minus sign already separates numbers
+    return data.replace(" -", "-")
+
+
+def trace_image(
+    image: Image.Image, options: TraceOptions, max_bytes: Optional[int] = None
+) -> bytes:
+    """Trace an image into an SVG of flat-coloured paths.
+
+    Colours are stacked from the most used up, each shape also covering the
+    colours drawn on top of it, so outlines stay simple and no seams show
+    between neighbouring colours. A fully opaque image's most used colour
+    becomes a background rectangle. The SVG keeps the image's display size
+    even when it is traced scaled down.
+
+    Raises ``TraceTooLargeError`` as soon as the paths pass ``max_bytes``, so
+    photographs are not traced to the end only to be thrown away.
+    """
+    width, height = image.size
+    traced = image
+    if max(image.size) > options.max_side:
+        traced = image.copy()
+        traced.thumbnail((options.max_side, options.max_side), Image.Resampling.LANCZOS)
+    with stage("quantize"):
+        labels, colors = quantize(traced, options)
+    grid_height, grid_width = labels.shape
+
+    elements = []
+    size = 0
+    opaque = bool((labels >= 0).all())
+    with stage("trace"):
+        for index, color in enumerate(colors):
+            fill = "#%02x%02x%02x" % color
+            if index == 0 and opaque:
+                elements.append(
+                    f'<rect width="{grid_width}" height="{grid_height}" fill="{fill}"/>'
+                )
+                continue
+            points, starts = _outlines(labels >= index, options)
+            if len(points):
+                data = _path_data(points, starts)
+                elements.append(f'<path fill="{fill}" d="{data}"/>')
+                size += len(elements[-1])
+            if max_bytes is not None and size > max_bytes:
+                raise TraceTooLargeError(
+                    f"Traced paths passed {max_bytes} bytes at colour {index + 1}"
+                    f" of {len(colors)}"
+                )
+
+    with stage("encode"):
+        svg = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            f'width="{width}" height="{height}" '
+            f'viewBox="0 0 {grid_width} {grid_height}" fill-rule="evenodd">'
+            + "".join(elements)
+            + "</svg>"
+        )
+    return svg.encode("utf-8")
@@ -0,0 +1,101 @@
+import hashlib  # for hashing uploads while they stream in
+import mmap  # for handing converters a zero-copy view of the upload
+import os  # for spool file operations
+import tempfile  # for spooling uploads to disk
+import weakref  # for removing spooled uploads that are never closed explicitly
+from typing import Optional
+
+from fastapi import UploadFile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    "Raised as soon as an upload grows past the limit of the endpoint receiving it."
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds {max_bytes // (1024 * 1024)}MB limit")
+        self.max_bytes = max_bytes
+
+
+class IngestedUpload:
+    """An upload streamed to a spool file in fixed-size chunks.
+
+    Converters receive ``path`` (or ``mmap()``) instead of the whole body as bytes,
+    so a request never holds more than one chunk of the upload in memory. The file
+    is removed on ``close()``, when used as a context manager, or at the latest
+    when the object is garbage collected.
+    """
+
+    def __init__(
+        self, path: str, size: int, sha256: str, filename: str, content_type: str
+    ):
+        self.path = path
+        self.size = size
+        # content hash computed during ingestion, used as the conversion cache key
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+        self._finalizer = weakref.finalize(self, _unlink, path)
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.filename or "")[1].lower()
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def mmap(self) -> mmap.mmap:
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        self._finalizer()
+
+    def __enter__(self) -> "IngestedUpload":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+async def ingest_upload(
+    file: UploadFile, max_bytes: int, spool_dir: Optional[str] = None
+) -> IngestedUpload:
+    "Stream ``file`` to a spool file chunk by chunk, rejecting it once it passes ``max_bytes``."
+    # keep the original extension for tools that dispatch on it, and the pid so
+    # the result store's startup cleanup can remove uploads of crashed workers
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    if spool_dir:
+        os.makedirs(spool_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(
+        prefix=f"{os.getpid()}-upload-", suffix=suffix, dir=spool_dir
+    )
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        _unlink(path)
+        raise
+
+    return IngestedUpload(
+        path, size, digest.hexdigest(), file.filename, file.content_type
+    )
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
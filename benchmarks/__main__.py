@@ -0,0 +1,232 @@
+"""Benchmarks for every converter and compressor path.
+
+    python -m benchmarks run [--mode isolated|http|both] [--cases PATTERN ...]
+                             [--output results.json] [--baseline old.json]
+                             [--write-costs costs.json]
+    python -m benchmarks compare results.json old.json
+    python -m benchmarks list
+
+See the README's Benchmarks section for what is measured.
+"""
+
+import argparse  # for the command line
+import datetime  # for the time a run was made
+import fnmatch  # for selecting cases by pattern
+import json  # for result files
+import os  # for the default corpus location
+import platform  # for describing the machine in result files
+import subprocess  # for the commit a run was made on
+import sys  # for the exit status
+import tempfile  # for the default corpus location
+from dataclasses import asdict
+
+from app.services.registry import default_graph
+
+from benchmarks.cases import build_cases
+from benchmarks.client import Server, run_http
+from benchmarks.corpus import CORPUS, build_corpus
+from benchmarks.isolated import ROOT, dump, run_case, run_isolated
+from benchmarks.report import compare, edge_costs, table
+from benchmarks.results import CaseResult
+
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "fileconverter-bench-corpus")
+
+
+def _selected(patterns):
+    cases = build_cases(default_graph())
+    if not patterns:
+        return cases
+    return [
+        case
+        for case in cases
+        if any(fnmatch.fnmatchcase(case.name, pattern) for pattern in patterns)
+    ]
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _load(path: str) -> list[CaseResult]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [CaseResult(**result) for result in json.load(f)["results"]]
+
+
+def _compare(results, baseline_path: str, threshold: float) -> int:
+    lines, regressions = compare(results, _load(baseline_path), threshold)
+    print(lines)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) regressed by more than {threshold:.0%}")
+        return 1
+    return 0
+
+
+def _run(args) -> int:
+    cases = _selected(args.cases)
+    if not cases:
+        print("No cases match", file=sys.stderr)
+        return 2
+    build_corpus(args.corpus_dir, sorted({case.sample for case in cases}))
+
+    results = []
+    options = dict(
+        corpus_dir=args.corpus_dir,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        max_seconds=args.max_seconds,
+    )
+    if args.mode in ("isolated", "both"):
+        results.extend(_echo(run_isolated(cases, timeout=args.case_timeout, **options)))
+    if args.mode in ("http", "both"):
+        http = dict(options, concurrency=args.concurrency)
+        if args.url:
+            runs = run_http(cases, args.url.rstrip("/"), **http)
+            results.extend(_echo(runs))
+        else:
+            with Server() as server:
+                runs = run_http(
+                    cases, server.url, server_pid=server.process.pid, **http
+                )
+                results.extend(_echo(runs))
+
+    print()
+    print(table(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "meta": {
+                        "commit": _commit(),
+                        "created": datetime.datetime.now(
+                            datetime.timezone.utc
+                        ).isoformat(timespec="seconds"),
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "cpus": os.cpu_count(),
+                        "repeat": args.repeat,
+                        "warmup": args.warmup,
+                        "concurrency": args.concurrency,
+                    },
+                    "results": [asdict(result) for result in results],
+                },
+                f,
+                indent=2,
+            )
+    if args.write_costs:
+        with open(args.write_costs, "w", encoding="utf-8") as f:
+            json.dump(edge_costs(results), f, indent=2)
+    if args.baseline:
+        print()
+        return _compare(results, args.baseline, args.threshold)
+    return 0
+
+
+def _echo(results):
+    # one table row per case as it finishes; the full table follows at the end
+    for result in results:
+        print(table([result]).splitlines()[-1], flush=True)
+        yield result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_timing_options(command):
+        command.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+        command.add_argument(
+            "--repeat", type=int, default=5, help="timed runs per case"
+        )
+        command.add_argument(
+            "--warmup", type=int, default=1, help="untimed runs before timing"
+        )
+        command.add_argument(
+            "--max-seconds",
+            type=float,
+            default=30.0,
+            help="stop timing a case after this long, even short of --repeat",
+        )
+
+    run = commands.add_parser("run", help="run the benchmarks")
+    add_timing_options(run)
+    run.add_argument(
+        "--mode",
+        choices=("isolated", "http", "both"),
+        default="isolated",
+        help="direct converter calls, round trips through the API, or both",
+    )
+    run.add_argument(
+        "--cases",
+        nargs="*",
+        metavar="PATTERN",
+        help="case name patterns, e.g. 'pdf->*' or 'compress/*'",
+    )
+    run.add_argument(
+        "--concurrency", type=int, default=1, help="requests in flight in HTTP mode"
+    )
+    run.add_argument("--url", help="benchmark a running server instead of starting one")
+    run.add_argument(
+        "--case-timeout",
+        type=float,
+        default=600.0,
+        help="seconds before an isolated case is abandoned",
+    )
+    run.add_argument("--output", help="write the results to this JSON file")
+    run.add_argument("--baseline", help="compare with results saved by --output")
+    run.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="slowdown, as a fraction, that counts as a regression",
+    )
+    run.add_argument(
+        "--write-costs",
+        metavar="PATH",
+        help="write measured edge costs for CONVERSION_COSTS_FILE",
+    )
+
+    comparison = commands.add_parser("compare", help="compare two result files")
+    comparison.add_argument("results")
+    comparison.add_argument("baseline")
+    comparison.add_argument("--threshold", type=float, default=0.15)
+
+    commands.add_parser("list", help="list the cases and corpus entries")
+
+    # runs one case in this process; `run` starts one of these per case
+    case = commands.add_parser("case")
+    case.add_argument("name")
+    add_timing_options(case)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return _run(args)
+    if args.command == "compare":
+        return _compare(_load(args.results), args.baseline, args.threshold)
+    if args.command == "list":
+        for case in build_cases(default_graph()):
+            print(case.name)
+        print()
+        for name, (fmt, _) in CORPUS.items():
+            print(f"{name} ({fmt})")
+        return 0
+    print(
+        dump(
+            run_case(
+                args.name, args.corpus_dir, args.repeat, args.warmup, args.max_seconds
+            )
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
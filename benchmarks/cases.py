@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Optional
+
+from app import config
+from app.services.converter import FileCompressor, FileConverter
+from app.services.registry import ConversionGraph, media_type_of
+
+from benchmarks.corpus import CORPUS
+
+# compression level for the compressor cases, the middle of the API's range
+COMPRESS_PERCENT = 50
+COMPRESSIBLE = ("png", "jpeg", "webp", "pdf", "mp4")
+
+
+@dataclass(frozen=True)
+class Case:
+    "One converter or compressor call on one corpus entry."
+
+    # e.g. "png->pdf/png-medium" or "compress/pdf-scan-10"
+    name: str
+    sample: str
+    # the graph edge it runs, as "source->target"; None for compression
+    edge: Optional[str] = None
+    target: Optional[str] = None
+    percent: Optional[int] = None
+
+
+def build_cases(graph: ConversionGraph) -> list[Case]:
+    "Every graph edge on every corpus entry of its source format, then compression."
+    cases = []
+    for edge in sorted(graph.edges, key=lambda e: (e.source, e.target)):
+        for sample, (fmt, _) in CORPUS.items():
+            if fmt == edge.source:
+                pair = f"{edge.source}->{edge.target}"
+                cases.append(Case(f"{pair}/{sample}", sample, pair, edge.target))
+    for sample, (fmt, _) in CORPUS.items():
+        if fmt in COMPRESSIBLE:
+            cases.append(Case(f"compress/{sample}", sample, percent=COMPRESS_PERCENT))
+    return cases
+
+
+def converter() -> FileConverter:
+    "A converter set up as the API sets up its own."
+    return FileConverter(
+        render_workers=config.PDF_RENDER_WORKERS,
+        parallel_min_pages=config.PDF_PARALLEL_MIN_PAGES,
+        start_method=config.EXECUTOR_START_METHOD,
+        docx_engine=config.DOCX_PDF_ENGINE,
+        docx_timeout=config.DOCX_PDF_TIMEOUT_SECONDS,
+        docx_font_dir=config.DOCX_PDF_FONT_DIR,
+    )
+
+
+def call_for(
+    case: Case, graph: ConversionGraph, file_converter: FileConverter, path: str
+) -> Callable[[], object]:
+    "The call a case times, reading its input from ``path`` like a spooled upload."
+    fmt = CORPUS[case.sample][0]
+    if case.edge is None:
+        compressor = FileCompressor(
+            compression_percentage=case.percent,
+            video_preset=config.VIDEO_COMPRESS_PRESET,
+            threads=config.VIDEO_COMPRESS_THREADS,
+        )
+        return partial(compressor.compress, path, media_type_of(fmt), path)
+    edge = graph.edge(fmt, case.target)
+    return partial(file_converter.convert_chain, path, [edge.step])
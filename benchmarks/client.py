@@ -0,0 +1,195 @@
+import json  # for API responses
+import os  # for the server's environment and /proc
+import socket  # for picking a free port
+import subprocess  # for starting the API server
+import sys  # for the interpreter to start the server with
+import time  # for timing requests
+import urllib.error
+import urllib.request
+import uuid  # for multipart boundaries
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+from benchmarks.cases import Case
+from benchmarks.corpus import corpus_path
+from benchmarks.isolated import ROOT
+from benchmarks.results import CaseResult, peak_rss_mb
+
+
+def _multipart(fields: dict, path: str) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"'
+            f"\r\n\r\n{value}\r\n".encode("utf-8")
+        )
+    with open(path, "rb") as f:
+        content = f.read()
+    # no content type, so the server goes by the upload's bytes like it does for
+    # clients that send a wrong one
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+        f'filename="{os.path.basename(path)}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n".encode("utf-8")
+    )
+    parts.append(content + f"\r\n--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _post(url: str, body: bytes = b"", content_type: Optional[str] = None):
+    request = urllib.request.Request(url, data=body, method="POST")
+    if content_type:
+        request.add_header("Content-Type", content_type)
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return response.read()
+
+
+def _round_trip(base_url: str, case: Case, path: str) -> int:
+    "Upload, convert and download once; returns the size of the download."
+    if case.edge is None:
+        endpoint, fields = "/api/v1/compress", {"percent": case.percent}
+    else:
+        endpoint, fields = "/api/v1/convert", {"target_format": case.target}
+    body, content_type = _multipart(fields, path)
+    try:
+        answer = json.loads(_post(base_url + endpoint, body, content_type))
+    except urllib.error.HTTPError as e:
+        detail = e.read().decode("utf-8", "replace")
+        raise RuntimeError(f"{e.code} from {endpoint}: {detail}") from None
+    return len(_post(base_url + answer["download_url"]))
+
+
+def _tree(pid: int) -> list[int]:
+    "``pid`` and its descendants, where /proc lists children."
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _reset_peaks(pids: list[int]) -> None:
+    # writing 5 to clear_refs resets the peak the kernel reports as VmHWM
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+class Server:
+    """The API under uvicorn on a free local port, for the duration of a ``with``.
+
+    The conversion cache is switched off, since every run uploads the same bytes.
+    """
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.host = host
+        self.process: Optional[subprocess.Popen] = None
+        self.url = ""
+
+    def __enter__(self) -> "Server":
+        with socket.socket() as sock:
+            sock.bind((self.host, 0))
+            port = sock.getsockname()[1]
+        env = dict(os.environ, CONVERSION_CACHE_MAX_BYTES="0", CONVERSION_CACHE_DIR="")
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                "--host",
+                self.host,
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ],
+            cwd=ROOT,
+            env=env,
+        )
+        self.url = f"http://{self.host}:{port}"
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                urllib.request.urlopen(self.url + "/api/v1/convert/formats", timeout=1)
+                return self
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.__exit__(None, None, None)
+                    raise RuntimeError("The API server did not start")
+                time.sleep(0.2)
+
+    def __exit__(self, *exc_info) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+
+def run_http(
+    cases: Iterable[Case],
+    base_url: str,
+    corpus_dir: str,
+    repeat: int,
+    warmup: int,
+    max_seconds: float,
+    concurrency: int = 1,
+    server_pid: Optional[int] = None,
+) -> Iterator[CaseResult]:
+    """Time full round trips through the API: upload, convert and download.
+
+    ``concurrency`` requests are kept in flight, so throughput reflects the
+    executor's parallelism while latency includes queueing. Peak memory is read
+    from /proc when ``server_pid`` is a local server.
+    """
+    for case in cases:
+        path = corpus_path(corpus_dir, case.sample)
+        result = CaseResult(case.name, "http", case.sample, case.edge)
+        result.input_bytes = os.path.getsize(path)
+        latencies: list[float] = []
+        wall = 0.0
+        try:
+            for _ in range(warmup):
+                _round_trip(base_url, case, path)
+            if server_pid is not None:
+                _reset_peaks(_tree(server_pid))
+            deadline = time.perf_counter() + max_seconds
+
+            def timed() -> Optional[float]:
+                if time.perf_counter() >= deadline and latencies:
+                    return None
+                start = time.perf_counter()
+                result.output_bytes = _round_trip(base_url, case, path)
+                seconds = time.perf_counter() - start
+                latencies.append(seconds)
+                return seconds
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for _ in pool.map(lambda _: timed(), range(repeat)):
+                    pass
+            wall = time.perf_counter() - started
+        except Exception as e:
+            result.error = str(e) or type(e).__name__
+        result.summarize(latencies, wall)
+        if server_pid is not None:
+            pids = _tree(server_pid)
+            result.peak_rss_mb = peak_rss_mb(server_pid)
+            workers = [peak_rss_mb(pid) for pid in pids[1:]]
+            result.worker_peak_rss_mb = max(
+                (peak for peak in workers if peak is not None), default=None
+            )
+        yield result
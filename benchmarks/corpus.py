@@ -0,0 +1,207 @@
+import io  # for encoding generated images in memory
+import os  # for corpus file paths
+from typing import Callable, Iterable, Optional
+
+import fitz  # PyMuPDF, for text PDFs
+import numpy as np  # for synthetic photo pixels
+from docx import Document  # for DOCX files
+from PIL import Image, ImageDraw
+
+from app.services import ffmpeg
+from app.services.image_pdf import ImagePdfBuilder
+from app.services.registry import extension_of
+
+# every generator draws from a generator seeded with this, so the same corpus is
+# built on every machine
+SEED = 20240601
+
+IMAGE_SIZES = {
+    "small": (640, 480),
+    "medium": (1600, 1200),
+    "large": (4000, 3000),
+}
+
+_WORDS = (
+    "invoice total amount due payment account report quarter revenue growth "
+    "customer order shipment delivery schedule contract signed page section "
+    "summary analysis figure table appendix reference document review"
+).split()
+
+
+def _rng(name: str) -> np.random.Generator:
+    # one stream per entry, so adding an entry leaves the others unchanged
+    return np.random.default_rng([SEED, *name.encode("utf-8")])
+
+
+def _photo(width: int, height: int, rng: np.random.Generator) -> Image.Image:
+    "Smooth gradients under sensor-like noise, which encode about like a photo."
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    fx, fy, fxy = rng.uniform(1, 4, size=3)
+    channels = [
+        128 + 90 * np.sin(2 * np.pi * (fx * x + 0.3 * y)),
+        128 + 90 * np.cos(2 * np.pi * fy * y) * np.ones_like(x),
+        128 + 90 * np.sin(2 * np.pi * fxy * x * y),
+    ]
+    pixels = np.stack(channels, axis=-1)
+    pixels += rng.normal(0, 10, size=pixels.shape).astype(np.float32)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def _encode(image: Image.Image, fmt: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _logo(name: str) -> bytes:
+    "Flat colours and hard edges, like the logos and line art users vectorize."
+    rng = _rng(name)
+    image = Image.new("RGBA", (512, 512), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    palette = [
+        tuple(int(c) for c in rng.integers(0, 256, 3)) + (255,) for _ in range(5)
+    ]
+    draw.ellipse((32, 32, 480, 480), fill=palette[0])
+    draw.rectangle((128, 160, 384, 352), fill=palette[1])
+    draw.polygon([(256, 64), (448, 416), (64, 416)], outline=palette[2], width=12)
+    for i in range(8):
+        draw.line((64, 96 + i * 40, 448, 96 + i * 40), fill=palette[3 + i % 2], width=4)
+    return _encode(image, "PNG")
+
+
+def _sentences(rng: np.random.Generator, count: int) -> str:
+    sentences = []
+    for _ in range(count):
+        words = rng.choice(_WORDS, size=int(rng.integers(6, 16)))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def _text_pdf(name: str, pages: int) -> bytes:
+    rng = _rng(name)
+    document = fitz.open()
+    try:
+        for _ in range(pages):
+            page = document.new_page()
+            page.insert_text((72, 72), _sentences(rng, 1), fontsize=16)
+            page.insert_textbox(
+                fitz.Rect(72, 100, page.rect.width - 72, page.rect.height - 72),
+                _sentences(rng, 40),
+                fontsize=10,
+            )
+        return document.tobytes(garbage=3, deflate=True)
+    finally:
+        document.close()
+
+
+def _scanned_pdf(name: str, pages: int) -> bytes:
+    "Full-page JPEGs at letter size and 200 DPI, like the output of a scanner."
+    rng = _rng(name)
+    builder = ImagePdfBuilder(resolution=200)
+    for _ in range(pages):
+        page = _photo(1700, 2200, rng).convert("L")
+        builder.add(_encode(page, "JPEG", quality=80))
+    return builder.save()
+
+
+def _svg(name: str, shapes: int) -> bytes:
+    rng = _rng(name)
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<svg xmlns="http://www.w3.org/2000/svg" width="512" height="512" '
+        'viewBox="0 0 512 512">',
+    ]
+    for _ in range(shapes):
+        points = rng.integers(0, 512, size=8)
+        r, g, b = rng.integers(0, 256, size=3)
+        parts.append(
+            f'<path d="M{points[0]} {points[1]} C{points[2]} {points[3]} '
+            f'{points[4]} {points[5]} {points[6]} {points[7]} Z" '
+            f'fill="rgb({r},{g},{b})" fill-opacity="0.6" stroke="#222" '
+            f'stroke-width="1"/>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts).encode("utf-8")
+
+
+def _docx(name: str, sections: int) -> bytes:
+    rng = _rng(name)
+    document = Document()
+    for number in range(1, sections + 1):
+        document.add_heading(f"Section {number}", level=1)
+        for _ in range(4):
+            document.add_paragraph(_sentences(rng, 6))
+        table = document.add_table(rows=4, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = str(int(rng.integers(0, 10_000)))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _mp4(name: str, seconds: int) -> bytes:
+    # test pattern and tone from ffmpeg's own generators, in the common H.264/AAC mix
+    return ffmpeg.run(
+        [
+            "-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=30",
+            "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+            "-t", str(seconds), "-c:v", "libx264", "-preset", "veryfast",
+            "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "128k",
+            # MP4 seeks back to write its index unless it is fragmented
+            "-movflags", "frag_keyframe+empty_moov", "-f", "mp4", "pipe:1",
+        ]
+    )  # fmt: skip
+
+
+def _image(size: str, fmt: str, **options) -> Callable[[str], bytes]:
+    def build(name: str) -> bytes:
+        return _encode(_photo(*IMAGE_SIZES[size], _rng(name)), fmt, **options)
+
+    return build
+
+
+# corpus entry -> (format, generator of the file's bytes from the entry's name)
+CORPUS = {
+    "png-small": ("png", _image("small", "PNG")),
+    "png-medium": ("png", _image("medium", "PNG")),
+    "png-large": ("png", _image("large", "PNG")),
+    "png-logo": ("png", _logo),
+    "jpeg-small": ("jpeg", _image("small", "JPEG", quality=90)),
+    "jpeg-medium": ("jpeg", _image("medium", "JPEG", quality=90)),
+    "jpeg-large": ("jpeg", _image("large", "JPEG", quality=90)),
+    "webp-medium": ("webp", _image("medium", "WEBP", quality=90)),
+    "pdf-text-10": ("pdf", lambda name: _text_pdf(name, 10)),
+    "pdf-text-100": ("pdf", lambda name: _text_pdf(name, 100)),
+    "pdf-scan-10": ("pdf", lambda name: _scanned_pdf(name, 10)),
+    "svg-simple": ("svg", lambda name: _svg(name, 10)),
+    "svg-complex": ("svg", lambda name: _svg(name, 2000)),
+    "docx-20": ("docx", lambda name: _docx(name, 20)),
+    "mp4-5s": ("mp4", lambda name: _mp4(name, 5)),
+}
+
+
+def corpus_path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}.{extension_of(CORPUS[name][0])}")
+
+
+def build_corpus(
+    directory: str, names: Optional[Iterable[str]] = None
+) -> dict[str, str]:
+    """Write the corpus entries to ``directory`` and return their paths by name.
+
+    Entries already on disk are kept, so the corpus is only generated once.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name in names or CORPUS:
+        path = corpus_path(directory, name)
+        if not os.path.exists(path):
+            # write under a temporary name so an interrupted build is not reused
+            partial = f"{path}.partial"
+            with open(partial, "wb") as f:
+                f.write(CORPUS[name][1](name))
+            os.replace(partial, path)
+        paths[name] = path
+    return paths
@@ -0,0 +1,136 @@
+import json  # for passing results back from case processes
+import os  # for input sizes
+import resource  # for peak resident memory
+import subprocess  # for running each case in a fresh interpreter
+import sys  # for the interpreter to run cases with
+import time  # for timing runs
+from collections import defaultdict
+from dataclasses import asdict
+from typing import Iterable, Iterator, Optional
+
+from app.services.metrics import call_recorded
+from app.services.registry import default_graph
+
+from benchmarks.cases import Case, build_cases, call_for, converter
+from benchmarks.corpus import corpus_path
+from benchmarks.results import MB, CaseResult, peak_rss_mb
+
+# the repository root, so `python -m benchmarks` resolves in case processes
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _output_size(result) -> int:
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    if isinstance(result, (list, tuple)):
+        return sum(_output_size(part) for part in result)
+    return 0
+
+
+def _children_peak_rss_mb() -> Optional[float]:
+    "Peak of the largest finished child process, such as a render worker or ffmpeg."
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(peak / (MB if sys.platform == "darwin" else 1024), 1) or None
+
+
+def run_case(
+    name: str, corpus_dir: str, repeat: int, warmup: int, max_seconds: float
+) -> CaseResult:
+    """Time one case in this process; called in a fresh interpreter per case.
+
+    Warm-up runs are not timed, so imports and first-call setup stay out of the
+    figures. Timing stops early once ``max_seconds`` have been spent on timed runs.
+    """
+    graph = default_graph()
+    case = next(c for c in build_cases(graph) if c.name == name)
+    path = corpus_path(corpus_dir, case.sample)
+    result = CaseResult(case.name, "isolated", case.sample, case.edge)
+    result.input_bytes = os.path.getsize(path)
+    file_converter = converter()
+    call = call_for(case, graph, file_converter, path)
+    latencies = []
+    stages: dict[str, float] = defaultdict(float)
+    try:
+        for _ in range(warmup):
+            call()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            output, samples = call_recorded(call, (), {})
+            latencies.append(samples.seconds)
+            result.output_bytes = _output_size(output)
+            result.pages = samples.pages
+            for stage, seconds in samples.stages:
+                stages[stage] += seconds
+            if time.perf_counter() - started >= max_seconds:
+                break
+    except Exception as e:
+        result.error = str(e) or type(e).__name__
+    finally:
+        file_converter.shutdown()
+    # the runs are back to back, so their sum is the wall time
+    result.summarize(latencies, sum(latencies))
+    if latencies:
+        result.stages = {
+            stage: round(seconds / len(latencies) * 1000, 3)
+            for stage, seconds in sorted(stages.items())
+        }
+    result.peak_rss_mb = peak_rss_mb()
+    result.worker_peak_rss_mb = _children_peak_rss_mb()
+    return result
+
+
+def run_isolated(
+    cases: Iterable[Case],
+    corpus_dir: str,
+    repeat: int,
+    warmup: int,
+    max_seconds: float,
+    timeout: float,
+) -> Iterator[CaseResult]:
+    "Run every case in its own interpreter, so peak memory is the case's alone."
+    for case in cases:
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks",
+            "case",
+            case.name,
+            "--corpus-dir",
+            corpus_dir,
+            "--repeat",
+            str(repeat),
+            "--warmup",
+            str(warmup),
+            "--max-seconds",
+            str(max_seconds),
+        ]
+        try:
+            completed = subprocess.run(
+                command, cwd=ROOT, capture_output=True, text=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            yield CaseResult(
+                case.name,
+                "isolated",
+                case.sample,
+                case.edge,
+                error=f"Timed out after {timeout:g}s",
+            )
+            continue
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            error = completed.stderr.strip().splitlines()
+            yield CaseResult(
+                case.name,
+                "isolated",
+                case.sample,
+                case.edge,
+                error=error[-1] if error else f"Exited with {completed.returncode}",
+            )
+            continue
+        yield CaseResult(**json.loads(lines[-1]))
+
+
+def dump(result: CaseResult) -> str:
+    return json.dumps(asdict(result))
@@ -0,0 +1,107 @@
+import statistics  # for the median cost of an edge across corpus entries
+from typing import Optional
+
+from benchmarks.results import MB, CaseResult
+
+COLUMNS = (
+    ("case", "case", 36),
+    ("mode", "mode", 8),
+    ("runs", "runs", 4),
+    ("p50 ms", "p50_ms", 10),
+    ("p99 ms", "p99_ms", 10),
+    ("runs/s", "runs_per_second", 8),
+    ("MB/s", "mb_per_second", 8),
+    ("RSS MB", "peak_rss_mb", 8),
+    ("workers", "worker_peak_rss_mb", 8),
+)
+
+
+def _cell(value, width: int) -> str:
+    if value is None:
+        text = "-"
+    elif isinstance(value, float):
+        text = f"{value:.1f}" if value >= 10 else f"{value:.3g}"
+    else:
+        text = str(value)
+    return (
+        text[:width].rjust(width) if not isinstance(value, str) else text.ljust(width)
+    )
+
+
+def table(results: list[CaseResult]) -> str:
+    lines = [" ".join(_cell(title, width) for title, _, width in COLUMNS)]
+    for result in results:
+        row = " ".join(
+            _cell(getattr(result, field), width) for _, field, width in COLUMNS
+        )
+        if result.error:
+            row += f"  error: {result.error}"
+        lines.append(row)
+    return "\n".join(lines)
+
+
+def _change(new: Optional[float], old: Optional[float]) -> Optional[float]:
+    if new is None or not old:
+        return None
+    return new / old - 1
+
+
+def compare(
+    results: list[CaseResult], baseline: list[CaseResult], threshold: float
+) -> tuple[str, list[str]]:
+    """Lines comparing ``results`` with ``baseline``, and the regressed case keys.
+
+    A case regresses when its median latency or peak memory grew by more than
+    ``threshold``, a fraction, or when it fails where the baseline succeeded.
+    """
+    previous = {result.key: result for result in baseline}
+    lines = [
+        f"{'case':<45} {'p50 ms':>10} {'change':>8} {'p99 ms':>10} {'change':>8} "
+        f"{'RSS MB':>8} {'change':>8}"
+    ]
+    regressions = []
+    for result in results:
+        old = previous.get(result.key)
+        if old is None:
+            continue
+        changes = [
+            _change(result.p50_ms, old.p50_ms),
+            _change(result.p99_ms, old.p99_ms),
+            _change(result.peak_rss_mb, old.peak_rss_mb),
+        ]
+        regressed = (result.error is not None and old.error is None) or any(
+            change is not None and change > threshold
+            for change in (changes[0], changes[2])
+        )
+        row = f"{result.key:<45}"
+        for value, change in zip(
+            (result.p50_ms, result.p99_ms, result.peak_rss_mb), changes
+        ):
+            row += f" {_cell(value, 10 if value is not result.peak_rss_mb else 8)}"
+            row += f" {'-' if change is None else f'{change:+.0%}':>8}"
+        if regressed:
+            regressions.append(result.key)
+            row += "  REGRESSION"
+        lines.append(row)
+    return "\n".join(lines), regressions
+
+
+def edge_costs(results: list[CaseResult]) -> dict[str, float]:
+    """Measured milliseconds per megabyte of input for each graph edge.
+
+    These are the costs ConversionGraph.load_costs reads; an edge measured on
+    several corpus entries gets the median of them.
+    """
+    per_edge: dict[str, list[float]] = {}
+    for result in results:
+        if result.mode != "isolated" or result.edge is None or result.error:
+            continue
+        if result.p50_ms is None or not result.input_bytes:
+            continue
+        per_edge.setdefault(result.edge, []).append(
+            result.p50_ms / (result.input_bytes / MB)
+        )
+    return {
+        edge: round(statistics.median(costs), 1)
+        for edge, costs in sorted(per_edge.items())
+    }
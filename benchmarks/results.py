@@ -0,0 +1,72 @@
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+MB = 1024 * 1024
+
+
+def peak_rss_mb(pid: Union[int, str] = "self") -> Optional[float]:
+    "Peak resident memory of a process, from /proc; None where there is no /proc."
+    # unlike ru_maxrss, this starts over on exec instead of counting the parent's
+    # memory at the time of the fork
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values: list[float], q: float) -> float:
+    "The ``q``th percentile of ``values``, interpolating between the nearest two."
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+@dataclass
+class CaseResult:
+    "What one case measured in one mode; times are milliseconds."
+
+    case: str
+    # "isolated" for a direct converter call, "http" for the full API round trip
+    mode: str
+    sample: str
+    edge: Optional[str] = None
+    runs: int = 0
+    input_bytes: int = 0
+    output_bytes: int = 0
+    p50_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+    mean_ms: Optional[float] = None
+    runs_per_second: Optional[float] = None
+    mb_per_second: Optional[float] = None
+    # peak resident memory of the process that ran the case, and of the processes
+    # it started, such as render workers; None where it cannot be read
+    peak_rss_mb: Optional[float] = None
+    worker_peak_rss_mb: Optional[float] = None
+    pages: int = 0
+    # mean milliseconds per run spent in each instrumented stage
+    stages: dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.mode}:{self.case}"
+
+    def summarize(self, latencies: list[float], wall_seconds: float) -> None:
+        "Fill in the latency and throughput figures from per-run seconds."
+        self.runs = len(latencies)
+        if not latencies:
+            return
+        self.p50_ms = round(percentile(latencies, 50) * 1000, 3)
+        self.p99_ms = round(percentile(latencies, 99) * 1000, 3)
+        self.mean_ms = round(sum(latencies) / len(latencies) * 1000, 3)
+        if wall_seconds > 0:
+            self.runs_per_second = round(len(latencies) / wall_seconds, 3)
+            self.mb_per_second = round(
+                self.input_bytes * len(latencies) / MB / wall_seconds, 3
+            )